@@ -0,0 +1,387 @@
+#!/usr/bin/env python2.7
+# Copyright 2013 Virantha Ekanayake All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+    Throughput benchmark for pypdfocr.
+
+    Makes synthetic scanned pdfs (one image per page, filled with columns of words) for
+    every combination of page count, dpi, colour mode, page size, column count and
+    tesseract output asked for, and times each stage of the conversion on its own as
+    well as the whole pipeline:
+
+    ========== ===============================================================
+    dpi        Reading the scan resolution out of the pdf
+    render     Rasterizing the pages with ghostscript
+    ocr        Running tesseract on the page images
+    parse      Reading tesseract's hocr or tsv output into pages of words
+    textlayer  Drawing the hocr text of each page into its text layer, on the tesseract
+               processes (``--text-layer`` picks how; tesseract draws its own in the
+               ocr stage)
+    merge      Merging the text onto the original pages (``--merge`` picks how)
+    filing     Reading the text back out of the OCR'ed pdf and filing it
+    pipeline   pypdfocr -f on the document, start to finish
+    ========== ===============================================================
+
+    Every stage runs in a fresh process, so its peak memory and CPU time (including
+    the tools it runs) can be reported along with pages per second.  The merge stage
+    also reports the size of the OCR'ed pdf, and the parse stage the size of the
+    tesseract output.  A stage picks up the files left behind by the one before it.
+
+    With ``--standins``, gs and tesseract are replaced by the
+    deterministic stand-ins in :mod:`standins`, which leaves just the python side of
+    the pipeline being measured.  This is what the CI build runs.  The stand-in
+    tesseract fills the whole page with words whatever the columns are, so its
+    output only grows with the page size and dpi.
+
+    Usage::
+
+        python benchmark/pypdfocr_bench.py --pages 1 20 --dpi 300 --mode grey colour --standins
+
+    Comparing hocr and tsv parsing on dense three-column tabloid pages::
+
+        python benchmark/pypdfocr_bench.py --pages 5 --dpi 600 --page-size tabloid --columns 3 \
+            --ocr-output hocr tsv --stages dpi render ocr parse
+"""
+
+import os
+import sys
+import glob
+import json
+import time
+import shutil
+import random
+import itertools
+import argparse
+import resource
+import tempfile
+import subprocess
+
+import reportlab
+from PIL import Image, ImageDraw, ImageFont
+from reportlab.pdfgen.canvas import Canvas
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from pypdfocr.pypdfocr import PyPDFOCR
+from pypdfocr.pypdfocr_gs import PyGs
+from pypdfocr.pypdfocr_tesseract import PyTesseract
+from pypdfocr.pypdfocr_pdf import PyPdf
+from pypdfocr.pypdfocr_pdffiler import PyPdfFiler
+from pypdfocr.pypdfocr_filer_dirs import PyFilerDirs
+from pypdfocr.pypdfocr_pool import PyPool
+from pypdfocr.pypdfocr_timing import PyTimer
+
+import standins
+
+STAGES = ['dpi', 'render', 'ocr', 'parse', 'textlayer', 'merge', 'filing', 'pipeline']
+
+# PIL mode and image format of the scans embedded in the synthetic pdfs
+MODES = {'grey': ('L', 'JPEG'), 'colour': ('RGB', 'JPEG'), 'mono': ('1', 'PNG')}
+
+# Width and height in inches
+PAGE_SIZES = {'letter': (8.5, 11), 'legal': (8.5, 14), 'tabloid': (11, 17)}
+
+FOLDERS = {'finances': ['statement', 'balance'], 'receipts': ['receipt']}
+
+
+def make_scanned_pdf(pdf_filename, pages, dpi, mode, page_size='letter', columns=1, seed=0):
+    """
+        Write a pdf with one scanned-looking image per page, the way a scanner would:
+        the image covers the whole page, and is a jpeg for grey or colour scans and a
+        bilevel png for mono scans.  The text is set in `columns` columns between one
+        inch margins.
+    """
+    img_mode, img_format = MODES[mode]
+    rand = random.Random(seed)
+    font_filename = os.path.join(os.path.dirname(reportlab.__file__), 'fonts', 'Vera.ttf')
+    try:
+        font = ImageFont.truetype(font_filename, int(dpi*11/72.0))
+    except IOError:
+        font = ImageFont.load_default()
+
+    width, height = PAGE_SIZES[page_size]
+    gap = dpi//4
+    column_width = (int((width-2)*dpi) - gap*(columns-1)) // columns
+    work_dir = tempfile.mkdtemp()
+    canvas = Canvas(pdf_filename, pagesize=(width*72, height*72))
+    try:
+        for pgnum in range(pages):
+            img = Image.new('RGB', (int(width*dpi), int(height*dpi)), (255, 255, 255))
+            draw = ImageDraw.Draw(img)
+            if mode == 'colour':
+                draw.rectangle([dpi, dpi//2, int((width-1)*dpi), int(0.8*dpi)], fill=(40, 90, 160))
+            y = dpi
+            while y < (height-1)*dpi:
+                for column in range(columns):
+                    words = rand.choice(standins.WORDS)
+                    while True:
+                        more = words + ' ' + rand.choice(standins.WORDS)
+                        if font.getsize(more)[0] > column_width:
+                            break
+                        words = more
+                    draw.text((dpi + column*(column_width+gap), y), words, font=font, fill=(0, 0, 0))
+                y += int(dpi*18/72.0)
+            img_filename = os.path.join(work_dir, 'page_%d.%s' % (pgnum, img_format.lower()))
+            img.convert(img_mode).save(img_filename, img_format, dpi=(dpi, dpi))
+            canvas.drawImage(img_filename, 0, 0, width=width*72, height=height*72)
+            canvas.showPage()
+        canvas.save()
+    finally:
+        shutil.rmtree(work_dir)
+    return pdf_filename
+
+
+def _peak_rss_mb(who):
+    peak = resource.getrusage(who).ru_maxrss
+    # Kilobytes on Linux, bytes on OS X
+    return peak / (1024.0*1024 if sys.platform == 'darwin' else 1024.0)
+
+
+def _cpu_seconds():
+    """
+        :returns: User and system CPU time of this process and the children it has waited for
+    """
+    return sum(usage.ru_utime + usage.ru_stime for usage in
+               (resource.getrusage(resource.RUSAGE_SELF), resource.getrusage(resource.RUSAGE_CHILDREN)))
+
+
+class PyBenchmark(object):
+    """
+        Runs the stages on one synthetic document.
+
+        :ivar work_dir: Where the document and everything made from it goes
+        :ivar config: pypdfocr configuration used for every stage
+    """
+
+    def __init__(self, work_dir, pdf_filename, config):
+        self.work_dir = work_dir
+        self.pdf_filename = pdf_filename
+        self.config = config
+        self.gs = PyGs(config.get('ghostscript', {}))
+        self.ts = PyTesseract(config.get('tesseract', {}))
+        self.pdf = PyPdf(self.gs, config.get('pdf', {}))
+        if self.pdf.text_layer == 'tesseract':
+            self.ts.output = 'pdf'
+
+    def _images(self):
+        # Pages are rendered to jpeg or png depending on their colour mode, or extracted as
+        # jpeg or tiff
+        basename = os.path.splitext(self.pdf_filename)[0]
+        return sorted(glob.glob(basename + '_*.jpg') + glob.glob(basename + '_*.png') + glob.glob(basename + '_*.tiff'),
+                      key=self.pdf.natural_keys)
+
+    def _hocr_pairs(self):
+        return [(fn, '%s.%s' % (os.path.splitext(fn)[0], self.ts.output)) for fn in self._images()]
+
+    def stage_dpi(self, timer):
+        self.gs._get_page_settings(self.pdf_filename)
+
+    def stage_render(self, timer):
+        self.gs.make_img_from_pdf(self.pdf_filename, timer)
+
+    def stage_ocr(self, timer):
+        pool = PyPool(self.ts.threads)
+        pool.start()
+        try:
+            self.ts.make_hocr_from_pnms(self._images(), pool, timer)
+        finally:
+            pool.close()
+
+    def stage_parse(self, timer):
+        for img_filename, ocr_filename in self._hocr_pairs():
+            # Tesseract made the text layer already, so there is nothing to read
+            if not ocr_filename.endswith('.pdf'):
+                self.pdf.read_ocr_page(ocr_filename)
+
+    def stage_textlayer(self, timer):
+        # Made on the workers, the way the pipeline does after each page's OCR
+        pool = PyPool(self.ts.threads)
+        pool.start()
+        try:
+            with pool.lease() as workers:
+                results = [self.pdf.submit_text_layer(workers, None, img_filename, hocr_filename, keep_ocr_page=False)
+                           for img_filename, hocr_filename in self._hocr_pairs()
+                           # Tesseract made the text layer already
+                           if not hocr_filename.endswith('.pdf')]
+                for result in results:
+                    result.get()
+        finally:
+            pool.close()
+
+    def stage_merge(self, timer):
+        # overlay_hocr_pages redoes the text layer as it merges; only the merge time
+        # out of its timer is reported for this stage
+        self.pdf.overlay_hocr_pages(None, self._hocr_pairs(), self.pdf_filename, timer)
+        return timer.stages['merge']
+
+    def stage_filing(self, timer):
+        ocr_filename = os.path.splitext(self.pdf_filename)[0] + '_ocr.pdf'
+        filing_filename = os.path.join(self.work_dir, 'filing.pdf')
+        shutil.copy(ocr_filename, filing_filename)
+        filer = PyFilerDirs()
+        filer.target_folder = os.path.join(self.work_dir, 'filed')
+        filer.default_folder = 'default'
+        for folder, keywords in FOLDERS.items():
+            filer.add_folder_target(folder, keywords)
+        PyPdfFiler(filer).move_to_matching_folder(filing_filename)
+
+    def stage_pipeline(self, timer):
+        pipeline_dir = os.path.join(self.work_dir, 'pipeline')
+        os.makedirs(pipeline_dir)
+        pdf_filename = os.path.join(pipeline_dir, os.path.basename(self.pdf_filename))
+        shutil.copy(self.pdf_filename, pdf_filename)
+
+        config = dict(self.config, target_folder=os.path.join(pipeline_dir, 'filed'),
+                      default_folder='default', folders=FOLDERS)
+        config_filename = os.path.join(self.work_dir, 'config.yaml')
+        with open(config_filename, 'w') as f:
+            # JSON is valid YAML
+            json.dump(config, f)
+        timing_filename = os.path.join(self.work_dir, 'timing.jsonl')
+        PyPDFOCR().go([pdf_filename, '-f', '-c', config_filename, '--timing', timing_filename])
+
+    def run_stage(self, stage, result_filename):
+        """
+            Time `stage` and write its result to result_filename.  This runs in a fresh
+            python process (see :func:`run`), so the peak memory is the stage's own.
+        """
+        timer = PyTimer(self.pdf_filename)
+        cpu_start = _cpu_seconds()
+        start = time.time()
+        seconds = getattr(self, 'stage_%s' % stage)(timer)
+        if seconds is None:
+            seconds = time.time() - start
+        result = {'seconds': seconds,
+                  'cpu_seconds': _cpu_seconds() - cpu_start,
+                  'peak_rss_mb': _peak_rss_mb(resource.RUSAGE_SELF),
+                  'children_peak_rss_mb': _peak_rss_mb(resource.RUSAGE_CHILDREN)}
+        if stage == 'merge':
+            result['output_kb'] = os.path.getsize(os.path.splitext(self.pdf_filename)[0] + '_ocr.pdf')/1024.0
+        elif stage == 'parse':
+            result['output_kb'] = sum(os.path.getsize(ocr_filename) for img_filename, ocr_filename in self._hocr_pairs())/1024.0
+        with open(result_filename, 'w') as f:
+            json.dump(result, f)
+
+    def run(self, stages):
+        """
+            Run each stage in turn, each in its own python process.  Their output goes
+            to <stage>.log in the working directory.
+
+            :returns: list of result dicts, one per stage
+        """
+        config_filename = os.path.join(self.work_dir, 'bench_config.json')
+        with open(config_filename, 'w') as f:
+            json.dump(self.config, f)
+
+        records = []
+        for stage in stages:
+            result_filename = os.path.join(self.work_dir, '%s.json' % stage)
+            log_filename = os.path.join(self.work_dir, '%s.log' % stage)
+            cmd = [sys.executable, os.path.abspath(__file__), '--run-stage', stage, self.work_dir,
+                   self.pdf_filename, config_filename, result_filename]
+            with open(log_filename, 'w') as log:
+                ret = subprocess.call(cmd, stdout=log, stderr=subprocess.STDOUT)
+            if ret != 0:
+                with open(log_filename) as log:
+                    print(log.read())
+                raise RuntimeError("Benchmark stage %s failed (exit code %s)" % (stage, ret))
+            with open(result_filename) as f:
+                record = json.load(f)
+            record['stage'] = stage
+            records.append(record)
+        return records
+
+
+def get_options(argv):
+    p = argparse.ArgumentParser(description="Measure pypdfocr throughput on synthetic scanned pdfs")
+    p.add_argument('--pages', type=int, nargs='+', default=[10], help='Page counts to try (default 10)')
+    p.add_argument('--dpi', type=int, nargs='+', default=[300], help='Scan resolutions to try (default 300)')
+    p.add_argument('--mode', nargs='+', default=['grey'], choices=sorted(MODES),
+                   help='Colour modes to try (default grey)')
+    p.add_argument('--page-size', nargs='+', default=['letter'], choices=sorted(PAGE_SIZES),
+                   help='Page sizes to try (default letter)')
+    p.add_argument('--columns', type=int, nargs='+', default=[1], help='Numbers of text columns to try (default 1)')
+    p.add_argument('--stages', nargs='+', default=STAGES, choices=STAGES,
+                   help='Stages to run (default all).  Each one needs the files left by the ones before it')
+    p.add_argument('--threads', type=int, default=4, help='Tesseract processes (default 4)')
+    p.add_argument('--gs-threads', type=int, default=4, help='Ghostscript processes (default 4)')
+    p.add_argument('--batch-size', type=int, default=1, help='Pages per tesseract run (default 1)')
+    p.add_argument('--ocr-output', nargs='+', default=['hocr'], choices=['hocr', 'tsv'],
+                   help='What tesseract writes out for each page, one or both to compare them (default hocr)')
+    p.add_argument('--merge', default='pypdf2', choices=['pypdf2', 'incremental', 'qpdf'],
+                   help='How the text goes onto the pages (default pypdf2)')
+    p.add_argument('--text-layer', default='direct', choices=['direct', 'reportlab', 'tesseract'],
+                   help='What draws the text of each page (default direct)')
+    p.add_argument('--standins', action='store_true', default=False,
+                   help='Use the deterministic stand-ins for gs and tesseract')
+    p.add_argument('--json', dest='json_filename', metavar='FILE', help='Also write the results to FILE as JSON')
+    p.add_argument('--keep', action='store_true', default=False, help="Don't delete the working directory")
+    # Used by PyBenchmark.run to start each stage in a new process
+    p.add_argument('--run-stage', nargs=5, metavar=('STAGE', 'WORK_DIR', 'PDF', 'CONFIG', 'RESULT'), help=argparse.SUPPRESS)
+    return p.parse_args(argv)
+
+
+def main(argv):
+    args = get_options(argv)
+    if args.run_stage:
+        stage, work_dir, pdf_filename, config_filename, result_filename = args.run_stage
+        with open(config_filename) as f:
+            bench = PyBenchmark(work_dir, pdf_filename, json.load(f))
+        bench.run_stage(stage, result_filename)
+        return 0
+
+    root_dir = tempfile.mkdtemp(prefix='pypdfocr_bench_')
+    if args.standins:
+        bin_dir = standins.install(os.path.join(root_dir, 'bin'))
+        os.environ['PATH'] = bin_dir + os.pathsep + os.environ['PATH']
+
+    records = []
+    print("%-36s %-10s %6s %9s %9s %9s %9s %9s %9s"
+          % ("document", "stage", "pages", "seconds", "pages/s", "cpu s", "peak MB", "tools MB", "out KB"))
+    try:
+        for pages, dpi, mode, page_size, columns, ocr_output in itertools.product(
+                args.pages, args.dpi, args.mode, args.page_size, args.columns, args.ocr_output):
+            config = {'tesseract': {'threads': args.threads, 'batch_size': args.batch_size, 'output': ocr_output},
+                      'ghostscript': {'threads': args.gs_threads},
+                      'pdf': {'merge': args.merge, 'text_layer': args.text_layer}}
+            name = '%dp_%ddpi_%s_%s_%dcol_%s' % (pages, dpi, mode, page_size, columns, ocr_output)
+            work_dir = os.path.join(root_dir, name)
+            os.makedirs(work_dir)
+            pdf_filename = make_scanned_pdf(os.path.join(work_dir, 'scan.pdf'), pages, dpi, mode, page_size, columns)
+            for record in PyBenchmark(work_dir, pdf_filename, config).run(args.stages):
+                record.update({'document': name, 'pages': pages, 'dpi': dpi, 'mode': mode,
+                               'page_size': page_size, 'columns': columns, 'ocr_output': ocr_output,
+                               'standins': args.standins,
+                               'pages_per_sec': pages/record['seconds'] if record['seconds'] else None})
+                print("%-36s %-10s %6d %9.3f %9s %9.3f %9.1f %9.1f %9s"
+                      % (name, record['stage'], pages, record['seconds'],
+                         "%.2f" % record['pages_per_sec'] if record['pages_per_sec'] else '-',
+                         record['cpu_seconds'], record['peak_rss_mb'], record['children_peak_rss_mb'],
+                         "%.1f" % record['output_kb'] if 'output_kb' in record else '-'))
+                records.append(record)
+    finally:
+        if args.keep:
+            print("Kept working directory %s" % root_dir)
+        else:
+            shutil.rmtree(root_dir)
+
+    if args.json_filename:
+        with open(args.json_filename, 'w') as f:
+            json.dump(records, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,373 @@
+# Copyright 2013 Virantha Ekanayake All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+    Deterministic stand-ins for the external programs pypdfocr runs (gs and
+    tesseract).  They accept the same command lines and write the same
+    kind of output, but do as little work as possible, so a benchmark run against them
+    measures the python side of the pipeline on its own.
+
+    - gs renders every page as a white image of the right size, with a few dark bars
+      where the text lines would be
+    - tesseract ignores the image contents and makes up a page of words laid out in
+      lines, always the same words for the same image filename
+
+    :func:`install` writes small launcher scripts for these into a directory that can
+    be put at the front of the PATH.
+"""
+
+import os
+import sys
+import zlib
+import random
+import cStringIO
+from cgi import escape
+
+from PIL import Image, ImageDraw
+from PyPDF2 import PdfFileReader
+
+VERSION = "3.05.01"
+
+WORDS = ("the of and to in is that for it as was with be by on not he this are or his from at "
+         "which but have an they you were her she there been one all we their has would when "
+         "invoice receipt statement account payment balance total amount due date number "
+         "customer order service tax credit card bank transfer reference period summary").split()
+
+# (PIL mode, PIL format) written by each ghostscript device pypdfocr might ask for
+GS_DEVICES = {
+    'jpeg': ('RGB', 'JPEG'),
+    'jpeggray': ('L', 'JPEG'),
+    'png16m': ('RGB', 'PNG'),
+    'pnggray': ('L', 'PNG'),
+    'pngmono': ('1', 'PNG'),
+    'tiff24nc': ('RGB', 'TIFF'),
+    'tiffgray': ('L', 'TIFF'),
+    'tifflzw': ('RGB', 'TIFF'),
+    'tiffg4': ('1', 'TIFF'),
+    'pnmraw': ('RGB', 'PPM'),
+    'ppmraw': ('RGB', 'PPM'),
+    'pgm': ('L', 'PPM'),
+    'pgmraw': ('L', 'PPM'),
+    'pbmraw': ('1', 'PPM'),
+}
+
+
+def _page_sizes(pdf_filename):
+    """
+        :returns: list of (width, height) in points of each page as displayed, i.e.
+                  swapped for pages with a /Rotate of 90 or 270
+    """
+    reader = PdfFileReader(open(pdf_filename, 'rb'))
+    sizes = []
+    for pgnum in range(reader.getNumPages()):
+        page = reader.getPage(pgnum)
+        width, height = float(page.mediaBox.getWidth()), float(page.mediaBox.getHeight())
+        if int(page.get('/Rotate', 0)) % 180:
+            width, height = height, width
+        sizes.append((width, height))
+    return sizes
+
+
+def _parse_page_list(page_list, count):
+    pages = []
+    for part in page_list.split(','):
+        if '-' in part:
+            first, last = part.split('-')
+            pages.extend(range(int(first or 1), int(last or count)+1))
+        else:
+            pages.append(int(part))
+    return pages
+
+
+def _fake_scan(mode, size, dpi):
+    """
+        White page with a dark bar for each line of text, so it doesn't look blank
+    """
+    img = Image.new(mode, size, 255 if mode != 'RGB' else (255, 255, 255))
+    draw = ImageDraw.Draw(img)
+    width, height = size
+    line = int(dpi/4)
+    for i, y in enumerate(range(dpi, height-dpi-line, line)):
+        x_end = width - dpi - (i*37 % max(1, width//3))
+        draw.rectangle([dpi, y, x_end, y+line//3], fill=0)
+    return img
+
+
+def gs(args):
+    device, dpi, output = 'png16m', 72.0, None
+    first, last, page_list = None, None, None
+    inputs = []
+    for arg in args:
+        if arg == '-c':
+            break
+        if arg.startswith('-sDEVICE='):
+            device = arg.split('=', 1)[1]
+        elif arg.startswith('-r'):
+            dpi = float(arg[2:].split('x')[0])
+        elif arg.startswith('-sOutputFile='):
+            output = arg.split('=', 1)[1]
+        elif arg.startswith('-dFirstPage='):
+            first = int(arg.split('=', 1)[1])
+        elif arg.startswith('-dLastPage='):
+            last = int(arg.split('=', 1)[1])
+        elif arg.startswith('-sPageList='):
+            page_list = arg.split('=', 1)[1]
+        elif not arg.startswith('-'):
+            inputs.append(arg)
+
+    if device not in GS_DEVICES:
+        sys.stdout.write("Unknown device: %s\n" % device)
+        return 1
+    mode, fmt = GS_DEVICES[device]
+
+    sizes = _page_sizes(inputs[0])
+    pages = range(first or 1, (last or len(sizes))+1)
+    if page_list:
+        pages = [p for p in _parse_page_list(page_list, len(sizes)) if p in pages]
+
+    for i, pgnum in enumerate(pages):
+        width, height = sizes[pgnum-1]
+        size = (int(round(width*dpi/72.0)), int(round(height*dpi/72.0)))
+        img = _fake_scan(mode, size, int(dpi))
+        options = {'dpi': (dpi, dpi)}
+        if fmt == 'JPEG':
+            options['quality'] = 75
+        if output in ('-', '%stdout%'):
+            # PIL writes around python's buffer when it gets a real file
+            out = cStringIO.StringIO()
+            img.save(out, fmt, **options)
+            sys.stdout.write(out.getvalue())
+        else:
+            img.save(output % (i+1) if '%' in output else output, fmt, **options)
+    sys.stdout.flush()
+    return 0
+
+
+def _layout(img_size, dpi, seed):
+    """
+        Make up a page of text: lines of words between one inch margins
+
+        :returns: list of lines, each a list of (word, (x0, y0, x1, y1)) in pixels
+    """
+    rand = random.Random(seed)
+    width, height = img_size
+    char_w, line_h = int(dpi*6/72.0), int(dpi*18/72.0)
+    lines = []
+    y = dpi
+    while y + line_h < height - dpi:
+        x = dpi
+        words = []
+        while True:
+            word = rand.choice(WORDS)
+            x1 = x + len(word)*char_w
+            if x1 > width - dpi:
+                break
+            words.append((word, (x, y, x1, y+int(line_h*0.7))))
+            x = x1 + char_w
+        if words:
+            lines.append(words)
+        y += line_h
+    return lines
+
+
+def _hocr_page(pgnum, img_name, img_size, lines):
+    out = ["  <div class='ocr_page' id='page_%d' title='image \"%s\"; bbox 0 0 %d %d; ppageno %d'>\n"
+           % (pgnum, img_name, img_size[0], img_size[1], pgnum-1)]
+    word_id = 0
+    for line_id, words in enumerate(lines, 1):
+        x0, y0 = words[0][1][0], words[0][1][1]
+        x1, y1 = words[-1][1][2], words[-1][1][3]
+        out.append("   <span class='ocr_line' id='line_%d_%d' title=\"bbox %d %d %d %d; baseline 0 -%d; "
+                   "x_size %d; x_descenders %d; x_ascenders %d\">"
+                   % (pgnum, line_id, x0, y0, x1, y1, (y1-y0)//5, y1-y0, (y1-y0)//5, (y1-y0)//4))
+        for word, bbox in words:
+            word_id += 1
+            out.append("<span class='ocrx_word' id='word_%d_%d' title='bbox %d %d %d %d; x_wconf 90; "
+                       "x_font Times_New_Roman; x_fsize 12' lang='eng' dir='ltr'>%s</span> "
+                       % ((pgnum, word_id) + bbox + (escape(word),)))
+        out.append("\n   </span>\n")
+    out.append("  </div>\n")
+    return ''.join(out)
+
+
+def _hocr(pages):
+    head = ("<?xml version=\"1.0\" encoding=\"UTF-8\"?>\n"
+            "<!DOCTYPE html PUBLIC \"-//W3C//DTD XHTML 1.0 Transitional//EN\"\n"
+            "    \"http://www.w3.org/TR/xhtml1/DTD/xhtml1-transitional.dtd\">\n"
+            "<html xmlns=\"http://www.w3.org/1999/xhtml\" xml:lang=\"en\" lang=\"en\">\n"
+            " <head>\n  <title></title>\n"
+            "  <meta http-equiv=\"Content-Type\" content=\"text/html;charset=utf-8\" />\n"
+            "  <meta name='ocr-system' content='tesseract %s' />\n"
+            "  <meta name='ocr-capabilities' content='ocr_page ocr_carea ocr_par ocr_line ocrx_word'/>\n"
+            " </head>\n <body>\n" % VERSION)
+    return head + ''.join(pages) + " </body>\n</html>\n"
+
+
+def _tsv_page(pgnum, img_size, lines):
+    rows = [(1, pgnum, 0, 0, 0, 0, 0, 0, img_size[0], img_size[1], -1, '')]
+    for line_num, words in enumerate(lines, 1):
+        x0, y0 = words[0][1][0], words[0][1][1]
+        x1, y1 = words[-1][1][2], words[-1][1][3]
+        rows.append((4, pgnum, 1, 1, line_num, 0, x0, y0, x1-x0, y1-y0, -1, ''))
+        for word_num, (word, bbox) in enumerate(words, 1):
+            rows.append((5, pgnum, 1, 1, line_num, word_num, bbox[0], bbox[1], bbox[2]-bbox[0], bbox[3]-bbox[1], 90, word))
+    return ''.join('\t'.join(str(col) for col in row) + '\n' for row in rows)
+
+
+def _tsv(pages):
+    return 'level\tpage_num\tblock_num\tpar_num\tline_num\tword_num\tleft\ttop\twidth\theight\tconf\ttext\n' + ''.join(pages)
+
+
+def _textonly_pdf(pages):
+    """
+        A text-only pdf the way tesseract writes one with textonly_pdf=1: invisible
+        text in a glyphless Type0 font, with each word as UTF-16 character codes
+        stretched over its bounding box, and the font shared by all the pages
+    """
+    rand = random.Random(0)
+    font_file = ''.join(chr(rand.randrange(256)) for _ in range(572))
+    cmap = ("/CIDInit /ProcSet findresource begin\n12 dict begin\nbegincmap\n"
+            "/CMapName /Adobe-Identify-UCS def\n/CMapType 2 def\n1 begincodespacerange\n<0000> <FFFF>\n"
+            "endcodespacerange\n1 beginbfrange\n<0000> <FFFF> <0000>\nendbfrange\n"
+            "endcmap\nCMapName currentdict /CMap defineresource pop\nend\nend\n")
+    objects = [
+        None,   # Catalog, filled in below
+        None,   # Pages
+        "<< /Type /Font /Subtype /Type0 /BaseFont /GlyphLessFont /Encoding /Identity-H "
+        "/DescendantFonts [4 0 R] /ToUnicode 6 0 R >>",
+        "<< /Type /Font /Subtype /CIDFontType2 /BaseFont /GlyphLessFont /CIDToGIDMap 5 0 R "
+        "/CIDSystemInfo << /Ordering (Identity) /Registry (Adobe) /Supplement 0 >> /FontDescriptor 7 0 R /DW 500 >>",
+        _pdf_stream('\x00\x01' * 65536),
+        _pdf_stream(cmap),
+        "<< /Type /FontDescriptor /FontName /GlyphLessFont /FontBBox [0 0 500 1000] /Flags 5 /ItalicAngle 0 "
+        "/Ascent 1000 /Descent 0 /CapHeight 1000 /StemV 80 /FontFile2 8 0 R >>",
+        _pdf_stream(font_file),
+    ]
+    kids = []
+    for img_name, size, dpi, lines in pages:
+        scale = 72.0/dpi
+        width, height = size[0]*scale, size[1]*scale
+        content = ['BT', '3 Tr']
+        for words in lines:
+            font_size = (words[0][1][3] - words[0][1][1])*scale
+            for i, (word, bbox) in enumerate(words):
+                if i < len(words) - 1:
+                    word += ' '
+                stretch = 100.0*(bbox[2]-bbox[0])*scale/(len(word)*font_size*0.5)
+                content.append('1 0 0 1 %.3f %.3f Tm /f-0-0 %.1f Tf %.2f Tz [ <%s> ] TJ'
+                               % (bbox[0]*scale, height - bbox[3]*scale, font_size, stretch,
+                                  word.encode('utf-16-be').encode('hex').upper()))
+        content.append('ET')
+        objects.append(_pdf_stream('\n'.join(content)))
+        objects.append("<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %.3f %.3f] /Contents %d 0 R "
+                       "/Resources << /Font << /f-0-0 3 0 R >> >> >>" % (width, height, len(objects)))
+        kids.append(len(objects))
+    objects[0] = "<< /Type /Catalog /Pages 2 0 R >>"
+    objects[1] = "<< /Type /Pages /Kids [%s] /Count %d >>" % (' '.join('%d 0 R' % i for i in kids), len(kids))
+
+    out = ['%PDF-1.5\n%\xde\xad\xbe\xeb\n']
+    offsets = []
+    for obj_id, obj in enumerate(objects, 1):
+        offsets.append(sum(len(part) for part in out))
+        out.append('%d 0 obj\n%s\nendobj\n' % (obj_id, obj))
+    xref = sum(len(part) for part in out)
+    out.append('xref\n0 %d\n0000000000 65535 f \n' % (len(objects)+1))
+    out.extend('%010d 00000 n \n' % offset for offset in offsets)
+    out.append('trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (len(objects)+1, xref))
+    return ''.join(out)
+
+
+def _pdf_stream(data):
+    data = zlib.compress(data)
+    return '<< /Length %d /Filter /FlateDecode >>\nstream\n%s\nendstream' % (len(data), data)
+
+
+def _text(lines):
+    return '\n'.join(' '.join(word for word, bbox in words) for words in lines) + '\n'
+
+
+def tesseract(args):
+    if '-v' in args or '--version' in args:
+        sys.stderr.write("tesseract %s\n leptonica-1.73\n  libjpeg 8d : libpng 1.6.20 : libtiff 4.0.6 : zlib 1.2.8\n" % VERSION)
+        return 0
+
+    positional, variables = [], {}
+    i = 0
+    while i < len(args):
+        if args[i] == '-c' and i+1 < len(args):
+            variables.update([args[i+1].split('=', 1)])
+        if args[i] in ('-psm', '--psm', '-l', '--oem', '-c', '--tessdata-dir'):
+            i += 2
+            continue
+        positional.append(args[i])
+        i += 1
+    in_filename, out_base, configs = positional[0], positional[1], positional[2:]
+
+    if in_filename in ('-', 'stdin'):
+        images = [(Image.open(cStringIO.StringIO(sys.stdin.read())), 'stdin')]
+    elif in_filename.endswith('.txt'):
+        # A list of image filenames, one per line
+        with open(in_filename) as f:
+            images = [(Image.open(fn), os.path.basename(fn)) for fn in f.read().splitlines() if fn]
+    else:
+        images = [(Image.open(in_filename), os.path.basename(in_filename))]
+    pages = []
+    for img, img_name in images:
+        dpi = int(variables.get('user_defined_dpi') or img.info.get('dpi', (300, 300))[0])
+        pages.append((img_name, img.size, dpi, _layout(img.size, dpi, zlib.crc32(img_name))))
+
+    if 'hocr' in configs:
+        output = _hocr([_hocr_page(pgnum, img_name, size, lines) for pgnum, (img_name, size, dpi, lines) in enumerate(pages, 1)])
+        ext = 'hocr'
+    elif 'tsv' in configs:
+        output = _tsv([_tsv_page(pgnum, size, lines) for pgnum, (img_name, size, dpi, lines) in enumerate(pages, 1)])
+        ext = 'tsv'
+    elif 'pdf' in configs and variables.get('textonly_pdf') == '1':
+        output, ext = _textonly_pdf(pages), 'pdf'
+    else:
+        output, ext = ''.join(_text(lines) for img_name, size, dpi, lines in pages), 'txt'
+
+    if out_base in ('-', 'stdout'):
+        sys.stdout.write(output)
+    else:
+        with open('%s.%s' % (out_base, ext), 'wb') as f:
+            f.write(output)
+    return 0
+
+
+TOOLS = {'gs': gs, 'tesseract': tesseract}
+
+LAUNCHER = """#!%(python)s
+import sys
+sys.path.insert(0, %(path)r)
+import standins
+sys.exit(standins.TOOLS[%(tool)r](sys.argv[1:]))
+"""
+
+
+def install(bin_dir):
+    """
+        Write a launcher for each stand-in into bin_dir, using the running python
+
+        :returns: bin_dir
+    """
+    if not os.path.exists(bin_dir):
+        os.makedirs(bin_dir)
+    for tool in TOOLS:
+        filename = os.path.join(bin_dir, tool)
+        with open(filename, 'w') as f:
+            f.write(LAUNCHER % {'python': sys.executable, 'tool': tool,
+                                'path': os.path.dirname(os.path.abspath(__file__))})
+        os.chmod(filename, 0o755)
+    return bin_dir
@@ -25,7 +25,9 @@ from version import __version__
 from PIL import Image
 import yaml
 
+import threading
 import multiprocessing
+from multiprocessing.pool import ThreadPool
 # Replace the Popen routine to allow win32 pyinstaller to build
 from multiprocessing import forking
 from pypdfocr_multiprocessing import _Popen
@@ -35,10 +37,15 @@ from pypdfocr_pdf import PyPdf
 from pypdfocr_tesseract import PyTesseract
 from pypdfocr_gs import PyGs
 from pypdfocr_watcher import PyPdfWatcher
+from pypdfocr_batch import PyPdfBatch
 from pypdfocr_pdffiler import PyPdfFiler
 from pypdfocr_filer_dirs import PyFilerDirs
 from pypdfocr_filer_evernote import PyFilerEvernote
 from pypdfocr_preprocess import PyPreprocess
+from pypdfocr_pool import PyPool
+from pypdfocr_timing import PyTimer
+from pypdfocr_workspace import PyWorkspace
+from pypdfocr_blank import PyBlankDetector
 
 def error(text):
     print("ERROR: %s" % text)
@@ -88,6 +95,13 @@ class PyPDFOCR(object):
         """ Initializes the GhostScript, Tesseract, and PDF helper classes.
         """
         self.config = {}
+        self.ts_pool = None
+        self.preprocess_pool = None
+        # Filing picks unique target names, so only let one document at a time do it
+        self.filing_lock = threading.Lock()
+        self.timing_lock = threading.Lock()
+        self.timing_filename = None
+        self.timing_summary = False
 
     def _get_config_file(self, config_file):
         """
@@ -118,7 +132,13 @@ class PyPDFOCR(object):
             :ivar watch_dir: Directory to watch for files to convert
             :ivar config: Dict of the config file
             :ivar watch: Whether folder watching mode is turned on
+            :ivar batch: Whether batch mode is turned on
+            :ivar batch_paths: Directories, globs, and @list files to convert in batch mode
+            :ivar manifest_filename: Batch mode progress file
             :ivar enable_evernote: Enable filing to evernote
+            :ivar timing_filename: File to append per-document stage timings to (JSON lines)
+            :ivar timing_summary: Whether to print the stage timings after each conversion
+            :ivar force_ocr: Whether to OCR pages that already have text
 
         """
         p = argparse.ArgumentParser(
@@ -139,12 +159,21 @@ class PyPDFOCR(object):
             default='eng', dest='lang', help='Language(default eng)')
 
 
+        p.add_argument('--timing', dest='timing_filename', metavar='FILE',
+            help='Append the time spent in each conversion stage to FILE, as one JSON record per document')
+
+        p.add_argument('--timing-summary', action='store_true',
+            default=False, dest='timing_summary', help='Print a table of stage times after each conversion')
+
         p.add_argument('--preprocess', action='store_true',
                 default=False, dest='preprocess', help='Enable preprocessing.  Not really useful now with improved Tesseract 3.04+')
         
         p.add_argument('--skip-preprocess', action='store_true',
                 default=False, dest='skip_preprocess', help='DEPRECATED: always skips now.')
 
+        p.add_argument('--force-ocr', action='store_true',
+                default=False, dest='force_ocr', help='OCR every page, including pages that already have text')
+
         #---------
         # Single or watch mode
         #--------
@@ -154,6 +183,16 @@ class PyPDFOCR(object):
         # Watch directory for watch mode
         single_or_watch_group.add_argument('-w', '--watch', 
              dest='watch_dir', help='Watch given directory and run ocr automatically until terminated')
+        # Many directories/globs/list files for batch mode
+        single_or_watch_group.add_argument('-b', '--batch', nargs='+', metavar='PATH',
+             dest='batch_paths', help='Convert every pdf in the given directories, globs, or @files listing one pdf per line')
+
+        #-----------
+        # Batch options
+        #----------
+        batch_group = p.add_argument_group(title="Batch options")
+        batch_group.add_argument('--manifest', default='pypdfocr_manifest.jsonl',
+             dest='manifest_filename', help='File recording finished conversions, used to resume an interrupted batch (default pypdfocr_manifest.jsonl)')
 
         #-----------
         # Filing options
@@ -181,6 +220,9 @@ class PyPDFOCR(object):
         self.watch_dir = args.watch_dir
         self.enable_email = args.mail
         self.match_using_filename = args.match_using_filename
+        self.timing_filename = args.timing_filename
+        self.timing_summary = args.timing_summary
+        self.force_ocr = args.force_ocr
 
 
         # Deprecating skip_preprocess to make skipping the default (always true). Tesseract 3.04 is so much better now
@@ -222,6 +264,10 @@ class PyPDFOCR(object):
             logging.debug("Starting to watch")
             self.watch = True
 
+        self.batch_paths = args.batch_paths
+        self.manifest_filename = args.manifest_filename
+        self.batch = bool(args.batch_paths)
+
         if self.enable_email:
             if not args.configfile:
                 p.error("Please specify a configuration file(CONFIGFILE) to enable email")
@@ -241,6 +287,33 @@ class PyPDFOCR(object):
 
             
 
+    def _iter_rendered(self, workspace, rendered_imgs):
+        """
+            Helper generator that passes through each page image from the pages already
+            in the workspace followed by rendered_imgs, checkpointing each new one
+
+            :param rendered_imgs: iterable of (image filename, page number)
+        """
+        for fn in workspace.get_pages('render'):
+            yield fn
+        for fn, page in rendered_imgs:
+            workspace.add_page('render', fn, page)
+            yield fn
+
+    def _iter_piped(self, workspace, piped_pages):
+        """
+            Helper generator like :func:`_iter_rendered`, for chunks of pages that are
+            piped into tesseract.  Each page is checkpointed as rendered, under the name
+            of the image it would have had, as its chunk goes to tesseract.
+
+            :param piped_pages: iterable of (image names, page numbers, command, image data, dpi)
+            :returns: generator of (image names, command, image data, dpi)
+        """
+        for names, pages, cmd, data, dpi in piped_pages:
+            for name, page in zip(names, pages):
+                workspace.add_page('render', name, page)
+            yield (names, cmd, data, dpi)
+
     def _setup_filing(self):
         """
             Instance the proper PyFiler object (either
@@ -318,76 +391,197 @@ class PyPDFOCR(object):
 
         self.gs = PyGs(self.config.get('ghostscript',{}))
         self.ts = PyTesseract(self.config.get('tesseract',{}))
-        self.pdf = PyPdf(self.gs)
+        self.pdf = PyPdf(self.gs, self.config.get('pdf', {}))
         self.preprocess = PyPreprocess(self.config.get('preprocess', {}))
+        self.blank = PyBlankDetector(self.config.get('blank', {}))
+        if self.blank.enabled:
+            self.ts.blank = self.blank
+        if self.pdf.text_layer == 'tesseract':
+            # Tesseract writes the text layer of each page itself
+            self.ts.output = 'pdf'
 
         return
 
-    def run_conversion(self, pdf_filename):
+    def _setup_pools(self):
+        """
+            Start the worker pools that are shared by every conversion, so watch mode
+            doesn't pay for process startup on each new document.  Workers are shut down
+            after `idle_timeout` seconds without any work, and restarted on demand.
+
+            :ivar ts_pool: :class:`pypdfocr.pypdfocr_pool.PyPool` for tesseract
+            :ivar preprocess_pool: :class:`pypdfocr.pypdfocr_pool.PyPool` for preprocessing (None if disabled)
+        """
+        pool_config = self.config.get('pools', {})
+        idle_timeout = pool_config.get('idle_timeout', 300)
+        queue_size = pool_config.get('queue_size')
+
+        self.ts_pool = PyPool(self.ts.threads, idle_timeout, queue_size)
+        self.ts_pool.start()
+        if not self.skip_preprocess:
+            self.preprocess_pool = PyPool(self.preprocess.threads, idle_timeout, queue_size)
+            self.preprocess_pool.start()
+        else:
+            self.preprocess_pool = None
+
+    def _close_pools(self):
+        for pool in [self.ts_pool, self.preprocess_pool]:
+            if pool:
+                pool.close()
+
+    def run_conversion(self, pdf_filename, timer=None, ocr_results=None):
         """
             Does the following:
             
-            - Convert the PDF using GhostScript to TIFF and JPG
-            - Run Tesseract on the TIFF to extract the text into HOCR (html)
-            - Use PDF generator to overlay the text on the JPG and output a new PDF
+            - Find the pages that are only scanned images; pages that already have
+              text, or have no images, are copied over as they are
+            - Convert those pages using GhostScript to TIFF and JPG
+            - Run Tesseract on the TIFF to extract the text into HOCR (html), except for
+              blank pages, which get no text (or are dropped, if configured)
+            - Make the text layer of each page on the tesseract workers as soon as it's
+              OCR'ed, and overlay the text layers on the original pages into a new PDF
             - Clean up temporary image files
+
+            The intermediate files go into a :class:`pypdfocr.pypdfocr_workspace.PyWorkspace`
+            in the `scratch_dir` from the config file (or the system temp directory),
+            which checkpoints each page as it gets through each step.  If the conversion
+            fails, the workspace is kept, and the next conversion of the same file only
+            does the pages that were not finished.
             
             :param pdf_filename: Scanned PDF
             :type pdf_filename: string
+            :param timer: Optional :class:`pypdfocr.pypdfocr_timing.PyTimer` to record stage times into
+            :param ocr_results: Optional dict to put the text OCR'ed onto each page in, as for
+                                :func:`pypdfocr.pypdfocr_pdf.PyPdf.overlay_hocr_pages`
             :returns: OCR'ed PDF
             :rtype: filename string
         """
+        timer = timer or PyTimer(pdf_filename)
         print ("Starting conversion of %s" % pdf_filename)
+        # Preprocessing needs all the images up front, so only stream pages when it's off
+        stream = self.skip_preprocess and self.gs.stream
+        # Piping pages into tesseract only works when they are streamed
+        pipe = stream and self.gs.pipe
+        if self.gs.pipe and not pipe:
+            print ("WARNING: Pages can only be piped into tesseract when they're streamed without preprocessing, so using image files")
+        if pipe and not self.ts.can_pipe():
+            print ("WARNING: Tesseract is too old to read images from a pipe (3.03 needed), so using image files")
+            pipe = False
+        if pipe and self.ts.batch_size > 1:
+            print ("WARNING: Piped pages go into tesseract one at a time, so the tesseract batch_size is ignored")
+        workspace = PyWorkspace(pdf_filename, self.config.get('scratch_dir'))
+        if workspace.open(lang=self.lang, preprocess=not self.skip_preprocess, force_ocr=self.force_ocr, pipe=pipe):
+            print ("Resuming earlier conversion from %s" % workspace.dir)
         try:
-            # Make the images for Tesseract
-            img_dpi, glob_img_filename = self.gs.make_img_from_pdf(pdf_filename)
+            # Only the pages that are nothing but scanned images need OCR
+            with timer.stage('precheck'):
+                if self.force_ocr:
+                    page_count = self.pdf.get_page_count(pdf_filename)
+                    ocr_pages = range(1, page_count+1)
+                else:
+                    page_count, ocr_pages = self.pdf.get_pages_to_ocr(pdf_filename)
+            if len(ocr_pages) < page_count:
+                print ("Keeping %d of %d pages as they are, since they already have text or have no images" % (page_count-len(ocr_pages), page_count))
+
+            # Make the images for Tesseract, skipping the pages already rendered
+            rendered = workspace.get_pages('render')
+            ocr_done = workspace.get_pages('ocr')
+            if pipe:
+                # Piped pages leave no image behind, so they're only done once they're OCR'ed
+                todo_pages = sorted(set(ocr_pages) - set(rendered[fn] for fn in ocr_done))
+            else:
+                todo_pages = sorted(set(ocr_pages) - set(rendered.values()))
+            if not todo_pages:
+                rendered_imgs = []
+            elif pipe:
+                rendered_imgs = self.gs.iter_pipe_pages(pdf_filename, timer, workspace.dir, todo_pages)
+            elif stream:
+                rendered_imgs = self.gs.iter_img_from_pdf(pdf_filename, timer, workspace.dir, todo_pages)
+            else:
+                rendered_imgs = self.gs.make_img_from_pdf(pdf_filename, timer, workspace.dir, todo_pages)
+            page_imgs = self._iter_rendered(workspace, rendered_imgs)
 
-            fns = glob.glob(glob_img_filename)
-        
-        except Exception:
-            raise
+            # Skip the pages that were already OCR'ed
+            todo_imgs = (fn for fn in page_imgs if fn not in ocr_done)
 
-        try:
             # Preprocess
-            if not self.skip_preprocess:
-                preprocess_imagefilenames = self.preprocess.preprocess(fns)
+            if pipe:
+                # Each page goes from ghostscript straight into tesseract, without an image file
+                logging.info("Piping pages from ghostscript into tesseract")
+                ocr_imagefilenames = self._iter_piped(workspace, rendered_imgs)
+                page_of = {}
+            elif stream:
+                # Each page goes to tesseract as soon as ghostscript finishes it
+                logging.info("Streaming pages from ghostscript into tesseract")
+                ocr_imagefilenames = todo_imgs
+                page_of = {}
+            elif not self.skip_preprocess:
+                todo_imgs = list(todo_imgs)
+                with timer.stage('preprocess'):
+                    ocr_imagefilenames = self.preprocess.preprocess(todo_imgs, self.preprocess_pool)
+                page_of = dict(zip(ocr_imagefilenames, todo_imgs))
             else:
                 logging.info("Skipping preprocess step")
-                preprocess_imagefilenames = fns
+                ocr_imagefilenames = list(todo_imgs)
+                page_of = {}
             # Run teserract
             self.ts.lang = self.lang
-            hocr_filenames = self.ts.make_hocr_from_pnms(preprocess_imagefilenames)
-            
-            # Generate new pdf with overlayed text
-            #ocr_pdf_filename = self.pdf.overlay_hocr(tiff_dpi, hocr_filename, pdf_filename)
-            ocr_pdf_filename = self.pdf.overlay_hocr_pages(img_dpi, hocr_filenames, pdf_filename)
+            done_text = workspace.get_pages('text')
+            pending, page_sizes = {}, []
+            def submit_text_layer(fn, img_filename, hocr_filename):
+                # The workers make each page's text layer right after its OCR, so only
+                # the merge is left to do here once they're all finished
+                if (not hocr_filename or hocr_filename.endswith('.pdf') or img_filename in pending or
+                        (self.pdf.text_layer == 'reportlab' and img_filename in done_text)):
+                    return
+                page_size = None
+                if not os.path.exists(img_filename):
+                    if not page_sizes:
+                        page_sizes.extend(self.pdf.get_page_sizes(pdf_filename))
+                    page_size = page_sizes[workspace.get_page('render', fn)-1]
+                pending[img_filename] = self.pdf.submit_text_layer(workers, None, img_filename, hocr_filename, page_size,
+                                                                   ocr_results is not None)
+            def ocr_finished(img_filename, hocr_filename):
+                fn = page_of.get(img_filename, img_filename)
+                workspace.add_page('ocr', fn, (img_filename, hocr_filename))
+                submit_text_layer(fn, img_filename, hocr_filename)
+            with self.ts_pool.lease() as workers:
+                with timer.stage('ocr'):
+                    self.ts.make_hocr_from_pnms(ocr_imagefilenames, workers, timer, ocr_finished)
+                page_numbers = workspace.get_pages('render')
+                hocr_filenames, hocr_pages, blank_pages = [], [], []
+                for fn, (img_filename, hocr_filename) in workspace.get_pages('ocr').items():
+                    if hocr_filename:
+                        hocr_filenames.append((img_filename, hocr_filename))
+                        hocr_pages.append(page_numbers[fn])
+                        # Pages OCR'ed by an earlier attempt
+                        submit_text_layer(fn, img_filename, hocr_filename)
+                    else:
+                        blank_pages.append(page_numbers[fn])
+                if blank_pages:
+                    print ("%s %d blank pages" % ("Dropping" if self.blank.drop else "Found", len(blank_pages)))
+
+                # Generate new pdf with overlayed text
+                #ocr_pdf_filename = self.pdf.overlay_hocr(tiff_dpi, hocr_filename, pdf_filename)
+                ocr_pdf_filename = self.pdf.overlay_hocr_pages(None, hocr_filenames, pdf_filename, timer,
+                                                               done_text,
+                                                               lambda img, text: workspace.add_page('text', img, text),
+                                                               hocr_pages, blank_pages if self.blank.drop else None,
+                                                               ocr_results, pending)
+
+        except (Exception, SystemExit, KeyboardInterrupt):
+            print ("Conversion of %s did not finish; finished pages are kept in %s to resume from next time" % (pdf_filename, workspace.dir))
+            raise
 
-        finally:
-            # Clean up the files
-            time.sleep(1)
+        # Clean up the files
+        with timer.stage('cleanup'):
             if not self.debug:
-                # Need to clean up the original image files before preprocessing
-                if locals().has_key("fns"): # Have to check if this was set before exception raised
-                    logging.info("Cleaning up %s" % fns)
-                    self._clean_up_files(fns)
-
-                if locals().has_key("preprocess_imagefilenames"):  # Have to check if this was set before exception raised
-                    logging.info("Cleaning up %s" % preprocess_imagefilenames)
-                    self._clean_up_files(preprocess_imagefilenames) # splat the hocr_filenames as it is a list of pairs
-                    for ext in [".hocr", ".html", ".txt"]:
-                        fns_to_remove = [os.path.splitext(fn)[0]+ext for fn in preprocess_imagefilenames]
-                        logging.info("Cleaning up %s" % fns_to_remove)
-                        self._clean_up_files(fns_to_remove) # splat the hocr_filenames as it is a list of pairs
-                    # clean up the hocr input (jpg) and output (html) files
-                    #self._clean_up_files(itertools.chain(*hocr_filenames)) # splat the hocr_filenames as it is a list of pairs
-                    # Seems like newer tessearct > 3.03 is now creating .txt files with the OCR text?/?
-                    #self._clean_up_files([x[1].replace(".hocr", ".txt") for x in hocr_filenames])
-
+                logging.info("Cleaning up %s" % workspace.dir)
+                workspace.remove()
 
         print ("Completed conversion successfully to %s" % ocr_pdf_filename)
         return ocr_pdf_filename
 
-    def file_converted_file(self, ocr_pdffilename, original_pdffilename):
+    def file_converted_file(self, ocr_pdffilename, original_pdffilename, ocr_results=None):
         """ move the converted filename to its destiantion directory.  Optionally also
             moves the original PDF.
 
@@ -395,10 +589,12 @@ class PyPDFOCR(object):
             :type ocr_pdffilename: filename string
             :param original_pdffilename: Original scanned PDF file
             :type original_pdffilename: filename string
+            :param ocr_results: Optional dict of page number to the text OCR'ed onto it, so
+                                the text of those pages needn't be read back out of the pdf
             :returns: Target folder name
             "rtype: string
         """
-        filed_path = self.pdf_filer.move_to_matching_folder(ocr_pdffilename)  
+        filed_path = self.pdf_filer.move_to_matching_folder(ocr_pdffilename, ocr_results)
         print("Filed %s to %s as %s" % (ocr_pdffilename, os.path.dirname(filed_path), os.path.basename(filed_path)))
 
         tgt_path = self.pdf_filer.file_original(original_pdffilename)
@@ -444,6 +640,7 @@ class PyPDFOCR(object):
             #. Parses options
             #. If filing is enabled, call :func:`_setup_filing`
             #. If watch is enabled, start the watcher
+            #. If batch is enabled, convert all the matching files with :func:`_run_batch`
             #. :func:`run_conversion`
             #. if filing is enabled, call :func:`file_converted_file`
         """
@@ -457,34 +654,112 @@ class PyPDFOCR(object):
         if self.enable_filing:
             self._setup_filing()
 
+        # Start up the worker processes once, and reuse them for every document
+        self._setup_pools()
+
         # Do the actual conversion followed by optional filing and email
-        if self.watch:
-            while True:  # Make sure the watcher doesn't terminate
-                try:
-                    py_watcher = PyPdfWatcher(self.watch_dir, self.config.get('watch'))
-                    for pdf_filename in py_watcher.start():
-                        self._convert_and_file_email(pdf_filename)
-                except KeyboardInterrupt:
-                    break
-                except Exception as e:
-                    print traceback.print_exc(e)
-                    py_watcher.stop()
-                    
+        try:
+            if self.watch:
+                watch_config = self.config.get('watch') or {}
+                py_watcher = PyPdfWatcher(self.watch_dir, watch_config)
+                # Several documents can be in flight at once; their pages all share the
+                # tesseract pool's queue, so a short document doesn't sit behind a long one
+                documents = ThreadPool(processes=watch_config.get('max_documents', 2))
+                while True:  # Make sure the watcher doesn't terminate
+                    try:
+                        for pdf_filename in py_watcher.start():
+                            documents.apply_async(self._try_convert_and_file_email, (pdf_filename,))
+                    except KeyboardInterrupt:
+                        documents.terminate()
+                        break
+                    except Exception as e:
+                        print traceback.print_exc(e)
+                        py_watcher.stop()
+
+            elif self.batch:
+                self._run_batch()
+            else:
+                self._convert_and_file_email(self.pdf_filename)
+        finally:
+            self._close_pools()
+
+    def _run_batch(self):
+        """
+            Convert everything matched by :attr:`batch_paths`, a few documents at a time,
+            on the same worker pools.  Progress goes into the manifest file so the
+            batch can be restarted after a crash without redoing finished files.
+        """
+        batch_config = self.config.get('batch') or {}
+        batch = PyPdfBatch(self.batch_paths, self.manifest_filename)
+        documents = ThreadPool(processes=batch_config.get('max_documents', 2))
+        try:
+            for pdf_filename in batch.start():
+                documents.apply_async(self._batch_convert_and_file_email, (batch, pdf_filename))
+            documents.close()
+            documents.join()
+        except KeyboardInterrupt:
+            documents.terminate()
+            raise
+        print("Batch complete: %d converted, %d failed, %d already done" % (batch.converted, batch.failed, batch.skipped))
+
+    def _batch_convert_and_file_email(self, batch, pdf_filename):
+        """
+            Convert one document of a batch and record the outcome in its manifest
+        """
+        try:
+            ocr_pdffilename = self._convert_and_file_email(pdf_filename)
+        except (Exception, SystemExit) as e:
+            print("ERROR: Could not convert %s" % pdf_filename)
+            traceback.print_exc()
+            batch.mark_failed(pdf_filename, repr(e))
         else:
-            self._convert_and_file_email(self.pdf_filename)
+            batch.mark_done(pdf_filename, ocr_pdffilename)
 
     def _convert_and_file_email(self, pdf_filename):
         """
             Helper function to run the conversion, then do the optional filing, and optional emailing.
         """
-        ocr_pdffilename = self.run_conversion(pdf_filename)
+        timer = PyTimer(pdf_filename)
+        # The OCR'ed text is kept for filing, instead of reading it back out of the pdf
+        ocr_results = {} if self.enable_filing else None
+        ocr_pdffilename = self.run_conversion(pdf_filename, timer, ocr_results)
         if self.enable_filing:
-            filing = self.file_converted_file(ocr_pdffilename, pdf_filename)
+            with self.filing_lock:
+                with timer.stage('filing'):
+                    filing = self.file_converted_file(ocr_pdffilename, pdf_filename, ocr_results)
         else:
             filing = "None"
 
         if self.enable_email:
-            self._send_email(pdf_filename, ocr_pdffilename, filing)
+            with timer.stage('email'):
+                self._send_email(pdf_filename, ocr_pdffilename, filing)
+
+        self._report_timing(timer, ocr_pdffilename)
+        return ocr_pdffilename
+
+    def _report_timing(self, timer, ocr_pdffilename):
+        """
+            Append the stage timings of a finished conversion to the timing file,
+            and print the summary table if requested.
+        """
+        with self.timing_lock:
+            if self.timing_filename:
+                with open(self.timing_filename, 'a') as f:
+                    timer.write_record(f, output=ocr_pdffilename)
+            if self.timing_summary:
+                print(timer.get_summary())
+
+    def _try_convert_and_file_email(self, pdf_filename):
+        """
+            Used for the background conversions in watch mode.  Report any failure
+            (including errors that would normally exit) instead of taking down the
+            thread, so the watcher carries on with the next document.
+        """
+        try:
+            self._convert_and_file_email(pdf_filename)
+        except (Exception, SystemExit):
+            print("ERROR: Could not convert %s" % pdf_filename)
+            traceback.print_exc()
 
 def main(): # pragma: no cover 
     multiprocessing.freeze_support()
@@ -0,0 +1,155 @@
+# Copyright 2013 Virantha Ekanayake All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+    Batch conversion of many pdfs, with a manifest to resume interrupted runs
+"""
+
+import os
+import glob
+import json
+import logging
+import time
+
+from threading import Lock
+
+
+class PyPdfBatch(object):
+    """
+        Find all the pdfs to convert from a list of directories, globs, and list files,
+        and keep track of the finished ones in a manifest file.
+
+        The manifest has one JSON record per line, and is only ever appended to, so a
+        crash loses at most the document that was being converted.  When the batch is
+        run again, any file recorded as done (and unchanged since) is skipped.
+    """
+
+    def __init__(self, paths, manifest_filename):
+        self.paths = paths
+        self.manifest_filename = manifest_filename
+        self.manifest_lock = Lock()
+
+        self.done = {}
+        self.signatures = {}
+        self.converted = 0
+        self.failed = 0
+        self.skipped = 0
+
+    def _is_source_pdf(self, filename):
+        return filename.lower().endswith(".pdf") and not filename.endswith(("_ocr.pdf", "_text.pdf"))
+
+    def _expand(self, path):
+        """
+            Turn one batch argument into pdf filenames:
+
+            - A directory is searched recursively for pdfs
+            - @filename reads a list of paths from a file, one per line
+            - Anything else is treated as a glob (a plain filename works too)
+        """
+        if path.startswith('@'):
+            with open(path[1:]) as f:
+                for line in f:
+                    line = line.strip()
+                    if line and not line.startswith('#'):
+                        for fn in self._expand(line):
+                            yield fn
+        elif os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                dirs.sort()
+                for fn in sorted(files):
+                    if self._is_source_pdf(fn):
+                        yield os.path.join(root, fn)
+        else:
+            for fn in sorted(glob.glob(path)):
+                if os.path.isdir(fn):
+                    for f in self._expand(fn):
+                        yield f
+                elif self._is_source_pdf(fn):
+                    yield fn
+
+    def _signature(self, filename):
+        st = os.stat(filename)
+        return (st.st_size, int(st.st_mtime))
+
+    def _load_manifest(self):
+        """
+            Read back the finished files from a previous run.  The last record for a
+            file wins, and a partially written last line (from a crash) or a record
+            with missing fields is ignored.
+        """
+        self.done = {}
+        if not os.path.exists(self.manifest_filename):
+            return
+        with open(self.manifest_filename) as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    logging.debug("Ignoring bad manifest line %s" % line)
+                    continue
+                if not isinstance(record, dict) or not record.get('file'):
+                    logging.debug("Ignoring manifest record without a file %s" % line)
+                    continue
+                if record.get('status') == 'done':
+                    if 'size' not in record or 'mtime' not in record:
+                        logging.debug("Ignoring incomplete manifest record %s" % line)
+                        continue
+                    self.done[record['file']] = (record['size'], record['mtime'])
+                else:
+                    self.done.pop(record['file'], None)
+        logging.info("Manifest %s lists %d finished files" % (self.manifest_filename, len(self.done)))
+
+    def _write_record(self, record):
+        with open(self.manifest_filename, 'a') as f:
+            f.write(json.dumps(record) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+
+    def start(self):
+        """
+            Generator of the pdfs that still need converting (each one only once,
+            even if it matches more than one path)
+        """
+        self._load_manifest()
+        seen = set()
+        for path in self.paths:
+            for filename in self._expand(path):
+                filename = os.path.abspath(filename)
+                if filename in seen:
+                    continue
+                seen.add(filename)
+                signature = self._signature(filename)
+                if self.done.get(filename) == signature:
+                    logging.info("Already converted %s, skipping" % filename)
+                    self.skipped += 1
+                    continue
+                # Remember what the file looked like now, since filing may move it away
+                self.signatures[filename] = signature
+                yield filename
+
+    def mark_done(self, filename, ocr_filename):
+        """
+            Record that filename (as yielded by :func:`start`) was converted
+        """
+        size, mtime = self.signatures[filename]
+        with self.manifest_lock:
+            self._write_record({'file': filename, 'status': 'done', 'output': ocr_filename,
+                                'size': size, 'mtime': mtime, 'time': time.time()})
+            self.converted += 1
+
+    def mark_failed(self, filename, reason):
+        with self.manifest_lock:
+            self._write_record({'file': filename, 'status': 'failed', 'error': reason,
+                                'time': time.time()})
+            self.failed += 1
@@ -0,0 +1,77 @@
+# Copyright 2013 Virantha Ekanayake All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+    Spot blank pages (e.g. the back sides of duplex scans) before they go to Tesseract
+"""
+
+import logging
+
+from PIL import Image
+
+
+class PyBlankDetector(object):
+    """
+        Decides whether a page image is blank from its grey-level histogram: a page
+        is blank when the fraction of ink pixels (darker than `ink_level`) is below
+        `ink_threshold`.  A margin around the edges is left out, since scanners
+        often leave a dark border or shadow there.  A page with only a word or two
+        on it has very little ink, so the threshold is set well below that.
+
+        :ivar enabled: Whether to check for blank pages at all (off unless configured,
+                       since a page taken for blank loses its text)
+        :ivar drop: Whether to leave blank pages out of the OCR'ed pdf
+    """
+
+    def __init__(self, config):
+        self.enabled = config.get('enabled', False)
+        self.drop = config.get('drop', False)
+        # Grey level (0-255) below which a pixel counts as ink
+        self.ink_level = config.get('ink_level', 128)
+        # Fraction of ink pixels below which the page is blank.  A single short word
+        # at 10pt and 300dpi is around 0.0001, a speck of dust around 0.000004.
+        self.ink_threshold = config.get('ink_threshold', 0.00002)
+        # Fraction of the width/height to ignore on each side
+        self.margin = config.get('margin', 0.05)
+
+    def get_ink_ratio(self, img_filename):
+        """
+            :param img_filename: Image filename, or a file object to read the image from
+            :returns: Fraction of the pixels inside the margins that are ink
+        """
+        img = Image.open(img_filename)
+        w, h = img.size
+        # Jpegs can be decoded at reduced size, which is all we need for counting ink
+        img.draft('L', (w//2, h//2))
+        img = img.convert('L')
+
+        w, h = img.size
+        dx, dy = int(w*self.margin), int(h*self.margin)
+        if w > 2*dx and h > 2*dy:
+            img = img.crop((dx, dy, w-dx, h-dy))
+        hist = img.histogram()
+        total = sum(hist)
+        if not total:
+            return 0.0
+        return float(sum(hist[:self.ink_level])) / total
+
+    def is_blank(self, img_filename, name=None):
+        """
+            :param name: Name of the page to log, if img_filename is a file object
+        """
+        ratio = self.get_ink_ratio(img_filename)
+        blank = ratio < self.ink_threshold
+        if blank:
+            logging.info("%s is blank (%.4f%% ink)" % (name or img_filename, ratio*100))
+        return blank
@@ -0,0 +1,140 @@
+# Copyright 2013 Virantha Ekanayake All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+    On-disk cache of OCR results, keyed by the contents of the page image
+"""
+
+import os
+import logging
+import hashlib
+import shutil
+import tempfile
+
+
+class PyOcrCache(object):
+    """
+        Keeps the hocr output of tesseract for each page image it has seen, so pages
+        that show up again (a document dropped in a second time, the same cover
+        sheet on every fax) don't need to be OCR'ed again.
+
+        Entries are keyed by a hash of the image file plus everything that changes
+        the OCR result (language, tesseract version, options).  Every hit refreshes an
+        entry's modification time, and :func:`evict` removes the least recently used
+        entries once the cache grows past `max_size` bytes.
+
+        Several worker processes can use the same cache directory at once: entries
+        are written to a temporary file and renamed into place.
+    """
+
+    def __init__(self, cache_dir, max_size=500*1024*1024):
+        self.cache_dir = os.path.expanduser(cache_dir)
+        self.max_size = max_size
+        if not os.path.exists(self.cache_dir):
+            os.makedirs(self.cache_dir)
+
+    def get_key(self, img_filename, *settings):
+        """
+            :param settings: Anything else the OCR result depends on
+            :returns: Hex digest of the image contents and the settings
+        """
+        h = hashlib.sha1()
+        with open(img_filename, 'rb') as f:
+            for block in iter(lambda: f.read(1024*1024), ''):
+                h.update(block)
+        return self._add_settings(h, settings)
+
+    def get_data_key(self, data, *settings):
+        """
+            Same as :func:`get_key`, for an image that is in memory instead of in a file
+        """
+        return self._add_settings(hashlib.sha1(data), settings)
+
+    def _add_settings(self, h, settings):
+        for setting in settings:
+            h.update('\0%s' % setting)
+        return h.hexdigest()
+
+    def _get_path(self, key):
+        return os.path.join(self.cache_dir, key[:2], "%s.hocr" % key)
+
+    def fetch(self, key, filename):
+        """
+            Copy the cached result for key to filename
+
+            :returns: True on a hit, False if key is not in the cache
+        """
+        path = self._get_path(key)
+        try:
+            shutil.copyfile(path, filename)
+            os.utime(path, None)
+        except (IOError, OSError):
+            return False
+        logging.info("OCR cache hit for %s" % filename)
+        return True
+
+    def store(self, key, filename):
+        """
+            Add the contents of filename to the cache under key
+        """
+        path = self._get_path(key)
+        cache_subdir = os.path.dirname(path)
+        try:
+            if not os.path.exists(cache_subdir):
+                os.makedirs(cache_subdir)
+        except OSError:
+            pass  # Another worker just made it
+        fd, tmp_filename = tempfile.mkstemp(dir=cache_subdir, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as tmp, open(filename, 'rb') as f:
+                shutil.copyfileobj(f, tmp)
+            os.rename(tmp_filename, path)
+        except (IOError, OSError) as e:
+            logging.info("Could not add %s to the OCR cache: %s" % (filename, e))
+            if os.path.exists(tmp_filename):
+                os.remove(tmp_filename)
+
+    def evict(self):
+        """
+            Remove the least recently used entries until the cache fits in max_size
+
+            :returns: Number of entries removed
+        """
+        entries = []
+        total = 0
+        for root, dirs, files in os.walk(self.cache_dir):
+            for fn in files:
+                if not fn.endswith('.hocr'):
+                    continue
+                path = os.path.join(root, fn)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, path))
+                total += st.st_size
+
+        removed = 0
+        for mtime, size, path in sorted(entries):
+            if total <= self.max_size:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue  # Someone else got to it first
+            total -= size
+            removed += 1
+        if removed:
+            logging.info("Evicted %d entries from the OCR cache" % removed)
+        return removed
@@ -0,0 +1,147 @@
+# Copyright 2013 Virantha Ekanayake All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+    Copy scanned page images straight out of the pdf, instead of having Ghostscript
+    decode, render and re-compress them
+"""
+
+import struct
+import logging
+
+from PyPDF2 import PdfFileReader
+
+from pypdfocr_pdfinfo import PyPageInfo
+
+
+class PyImageExtractor(object):
+    """
+        Writes out the image of pages that are nothing but one full-page scan.  JPEG
+        images are copied as they are, and CCITT (fax) images get a TIFF header put
+        in front of them.  Only the resolution recorded in the file is changed, so the
+        text layer can be sized from it.
+    """
+
+    def get_format(self, page_info):
+        """
+            :param page_info: :class:`pypdfocr.pypdfocr_pdfinfo.PyPageInfo` of the page
+            :returns: The image file extension ('jpg' or 'tiff') if the page's image can
+                      be extracted, else None
+        """
+        image = page_info.full_page_image
+        if image is None or page_info.rotation or image.image_mask:
+            return None
+        if image.filters == ['/DCTDecode']:
+            if image.bits != 8 or image.colorspace not in ['/DeviceGray', '/DeviceRGB']:
+                return None
+            if image.decode and image.decode != [0.0, 1.0]*len(image.decode[::2]):
+                return None
+            if image.colorspace == '/DeviceRGB' and image.params.get('/ColorTransform') == 0:
+                return None
+            return 'jpg'
+        if image.filters == ['/CCITTFaxDecode']:
+            if image.params.get('/EncodedByteAlign') or int(image.params.get('/Columns', 1728)) != image.width:
+                return None
+            return 'tiff'
+        return None
+
+    def iter_images(self, pdf_filename, page_filename, pages, timer):
+        """
+            Extract the images of some pages, which must all have a format from
+            :func:`get_format`
+
+            :param page_filename: Filename template for each page, without the extension
+            :returns: generator of (image filename, page number)
+        """
+        with open(pdf_filename, 'rb') as f:
+            reader = PdfFileReader(f)
+            for page in pages:
+                with timer.stage('render'):
+                    fn = self.extract_page(reader.getPage(page-1), page_filename % page)
+                logging.info("Extracted image %s" % fn)
+                yield (fn, page)
+
+    def extract_page(self, page, filename):
+        """
+            :param page: PyPDF2 page object
+            :param filename: Image filename, without the extension
+            :returns: The image filename
+        """
+        data, img_format = self.get_page_image(page)
+        filename = '%s.%s' % (filename, img_format)
+        with open(filename, 'wb') as f:
+            f.write(data)
+        return filename
+
+    def get_page_image(self, page):
+        """
+            :param page: PyPDF2 page object
+            :returns: (image file contents, file extension)
+        """
+        info = PyPageInfo(page)
+        img_format = self.get_format(info)
+        image = info.full_page_image
+        xobject = page['/Resources'].getObject()['/XObject'].getObject()[image.name].getObject()
+        dpi = [int(x) for x in info.get_dpi()]
+        if img_format == 'jpg':
+            data = self._set_jpeg_dpi(xobject._data, dpi)
+        else:
+            data = self._make_ccitt_tiff(xobject._data, image, dpi)
+        return (data, img_format)
+
+    def _set_jpeg_dpi(self, data, dpi):
+        """
+            Set the resolution in the JFIF header of the jpeg, adding one if needed
+        """
+        density = struct.pack('>BHH', 1, dpi[0], dpi[1])
+        if data[2:4] == '\xff\xe0' and data[6:11] == 'JFIF\x00' and struct.unpack('>H', data[4:6])[0] >= 16:
+            return data[:13] + density + data[18:]
+        app0 = '\xff\xe0' + struct.pack('>H', 16) + 'JFIF\x00\x01\x01' + density + '\x00\x00'
+        return data[:2] + app0 + data[2:]
+
+    def _make_ccitt_tiff(self, data, image, dpi):
+        """
+            Wrap the fax data in a single-strip TIFF file
+        """
+        k = int(image.params.get('/K', 0))
+        rows = int(image.params.get('/Rows', image.height)) or image.height
+        # Fax data codes white and black runs, and the pdf decides which is which
+        inverted = bool(image.params.get('/BlackIs1', False)) != (image.decode == [1.0, 0.0])
+        photometric = 1 if inverted else 0
+
+        entries = [(256, 4, image.width), (257, 4, rows), (258, 3, 1),
+                   (259, 3, 4 if k < 0 else 3), (262, 3, photometric),
+                   (273, 4, None), (277, 3, 1), (278, 4, rows), (279, 4, len(data)),
+                   (282, 5, None), (283, 5, None), (296, 3, 2)]
+        if k >= 0:
+            # T4Options: 2-D coding if K > 0
+            entries.append((292, 4, 1 if k > 0 else 0))
+        entries.sort()
+
+        ifd_size = 2 + 12*len(entries) + 4
+        resolution_offset = 8 + ifd_size
+        data_offset = resolution_offset + 16
+        ifd = struct.pack('<H', len(entries))
+        for tag, kind, value in entries:
+            if tag == 273:
+                value = data_offset
+            elif tag in (282, 283):
+                value = resolution_offset + (8 if tag == 283 else 0)
+            if kind == 3:
+                ifd += struct.pack('<HHIHH', tag, kind, 1, value, 0)
+            else:
+                ifd += struct.pack('<HHII', tag, kind, 1, value)
+        ifd += struct.pack('<I', 0)
+        resolution = struct.pack('<IIII', dpi[0], 1, dpi[1], 1)
+        return 'II*\x00' + struct.pack('<I', 8) + ifd + resolution + data
@@ -24,6 +24,18 @@ import subprocess
 import sys, os
 import logging
 import glob
+import tempfile
+import time
+import itertools
+import math
+import multiprocessing
+from collections import OrderedDict
+
+from PyPDF2 import PdfFileReader
+
+from pypdfocr_timing import PyTimer
+from pypdfocr_pdfinfo import PyPdfInfo
+from pypdfocr_extract import PyImageExtractor
 
 def error(text):
     print("ERROR: %s" % text)
@@ -32,6 +44,11 @@ def error(text):
 class PyGs(object):
     """Class to wrap all the ghostscript calls"""
 
+    # Most pages to pipe out of one ghostscript run.  Their OCR is only checkpointed
+    # once the whole chunk is done, so this is also how many pages each tesseract
+    # process can lose if the conversion is interrupted.
+    PIPE_CHUNK_SIZE = 8
+
     def __init__(self, config):
         self.msgs = {
                 'GS_FAILED': 'Ghostscript execution failed',
@@ -39,7 +56,28 @@ class PyGs(object):
                 'GS_OUTDATED': 'Your Ghostscript version is probably out of date.  Please upgrade to the latest version',
                 'GS_MISSING_BINARY': 'Could not find Ghostscript in the usual place; please specify it using your config file',
             }
-        self.threads = config.get('threads',4)
+        # Number of ghostscript processes to run at the same time, each on its own chunk of pages
+        self.threads = config.get('threads', min(4, multiprocessing.cpu_count()))
+        # Pages per ghostscript process (default is to split the pages evenly between them)
+        self.chunk_size = config.get('chunk_size', None)
+        # Ghostscript's own rendering threads and band buffer, passed on as they are
+        self.render_options = []
+        if 'rendering_threads' in config:
+            self.render_options.append('-dNumRenderingThreads=%d' % config['rendering_threads'])
+        if 'max_bitmap' in config:
+            self.render_options.append('-dMaxBitmap=%d' % config['max_bitmap'])
+        if 'band_buffer_space' in config:
+            self.render_options.append('-dBandBufferSpace=%d' % config['band_buffer_space'])
+        # Hand pages to OCR as soon as they're rendered instead of waiting for the whole document
+        self.stream = config.get('stream', True)
+        self.poll_interval = config.get('poll_interval', 0.1)
+        # Render non-consecutive pages with the same settings in one go (needs Ghostscript 9.20+)
+        self.page_list = config.get('page_list', False)
+        # Copy plain scanned pages straight out of the pdf instead of rendering them
+        self.extractor = PyImageExtractor() if config.get('extract_images', True) else None
+        # 'pipe' to send each page straight from ghostscript to tesseract, instead of
+        # through an image file
+        self.pipe = config.get('transport', 'file') == 'pipe'
 
         if "binary" in config:  # Override location of binary
             binary = config['binary']
@@ -61,7 +99,7 @@ class PyGs(object):
         self.greyscale = True
         # Tiff is used for the ocr, so just fix it at 300dpi
         #  The other formats will be used to create the final OCR'ed image, so determine
-        #  the DPI by using pdfimages if available, o/w default to 200
+        #  the DPI from the images in the pdf if possible, o/w default to 300
         self.gs_options = {'tiff': ['tiff', ['-sDEVICE=tiff24nc','-r%(dpi)s' ]],
                             'jpg': ['jpg', ['-sDEVICE=jpeg','-dJPEGQ=75', '-r%(dpi)s']],
                             'jpggrey': ['jpg', ['-sDEVICE=jpeggray', '-dJPEGQ=75', '-r%(dpi)s']],
@@ -71,7 +109,12 @@ class PyGs(object):
                             'tiffg4': ['tiff', ['-sDEVICE=tiffg4', '-r%(dpi)s']],
                             'pnm': ['pnm', ['-sDEVICE=pnmraw', '-r%(dpi)s']],
                             'pgm': ['pgm', ['-sDEVICE=pgm', '-r%(dpi)s']],
+                            'pbmraw': ['pbm', ['-sDEVICE=pbmraw', '-r%(dpi)s']],
+                            'pgmraw': ['pgm', ['-sDEVICE=pgmraw', '-r%(dpi)s']],
+                            'ppmraw': ['ppm', ['-sDEVICE=ppmraw', '-r%(dpi)s']],
                         }
+        # Uncompressed formats to use instead when the pages are piped
+        self.pipe_formats = {'pnggrey': 'pbmraw', 'jpggrey': 'pgmraw', 'jpg': 'ppmraw'}
 
     def _find_windows_gs(self):
         """
@@ -114,106 +157,409 @@ class PyGs(object):
     def _warn(self, msg):
         print("WARNING: %s" % msg)
 
-    def _get_dpi(self, pdf_filename):
+    def _read_pages(self, pdf_filename):
+        """
+            :returns: list of :class:`pypdfocr.pypdfocr_pdfinfo.PyPageInfo`, or None if
+                      the pdf can't be read
+        """
         if not os.path.exists(pdf_filename):
             error(self.msgs['GS_MISSING_PDF'] + " %s" % pdf_filename)
 
-        cmd = 'pdfimages -list "%s"' % pdf_filename
-        logging.info("Running pdfimages to figure out DPI...")
-        logging.debug(cmd)
+        logging.info("Reading the pdf to figure out DPI...")
         try:
-            out = subprocess.check_output(cmd, shell=True)
-        except subprocess.CalledProcessError as e:
-            self._warn ("Could not execute pdfimages to calculate DPI (try installing xpdf or poppler?), so defaulting to %sdpi" % self.output_dpi) 
-            return
-
-        # Need the second line of output
-        # Make sure it exists (in case this is an empty pdf)
-        results = out.splitlines()
-        if len(results)<3:
-            self._warn("Empty pdf, cannot determine dpi using pdfimages")
-            return
-        results = results[2]
-        logging.debug(results)
-        results = results.split()
-        if(results[2] != 'image'):
-            self._warn("Could not understand output of pdfimages, please rerun with -d option and file an issue at http://github.com/virantha/pypdfocr/issues") 
-            return
-        x_pt, y_pt, greyscale = int(results[3]), int(results[4]), results[5]=='gray'
-        self.greyscale = greyscale
-
-        # Now, run imagemagick identify to get pdf width/height/density
-        cmd = 'identify -format "%%w %%x %%h %%y\n" "%s"' % pdf_filename
-        try:
-            out = subprocess.check_output(cmd, shell=True)
-            results = out.splitlines()[0]
-            results = results.replace("Undefined", "")
-            width, xdensity, height, ydensity = [float(x) for x in results.split()]
-            xdpi = round(x_pt/width*xdensity)
-            ydpi = round(y_pt/height*ydensity)
-            self.output_dpi = xdpi
-            if ydpi>xdpi: self.output_dpi = ydpi
-            if self.output_dpi < 300: self.output_dpi = 300
-            if abs(xdpi-ydpi) > xdpi*.05:  # Make sure the two dpi's are within 5%
-                self._warn("X-dpi is %d, Y-dpi is %d, defaulting to %d" % (xdpi, ydpi, self.output_dpi))
-            else:
-                print("Using %d DPI" % self.output_dpi)
-
-
+            return PyPdfInfo(pdf_filename).pages
         except Exception as e:
             logging.debug(str(e))
-            self._warn ("Could not execute identify to calculate DPI (try installing imagemagick?), so defaulting to %sdpi" % self.output_dpi) 
-        return
+            return None
 
+    def _get_dpi(self, pdf_filename, page_infos=None):
+        """
+            Figure out the resolution and color mode of the scanned images in the pdf,
+            from the first page that has any images.  Anything that can't be determined
+            falls back to :attr:`output_dpi` and :attr:`greyscale`.  Nothing is stored
+            on this object, since several documents may be converted at the same time.
 
+            :param page_infos: The pages of the pdf, if they were already read
+            :returns: (dpi, greyscale)
+        """
+        output_dpi, greyscale = self.output_dpi, self.greyscale
+        if page_infos is None:
+            page_infos = self._read_pages(pdf_filename)
+        if page_infos is None:
+            self._warn("Could not read the pdf to calculate DPI, so defaulting to %sdpi" % output_dpi)
+            return (output_dpi, greyscale)
+
+        for page in page_infos:
+            dpi = page.get_dpi()
+            if dpi:
+                break
+        else:
+            self._warn("No images found in pdf, so defaulting to %sdpi" % output_dpi)
+            return (output_dpi, greyscale)
 
-    def _run_gs(self, options, output_filename, pdf_filename):
-        try:
-            cmd = '%s -q -dNOPAUSE %s -sOutputFile="%s" "%s" -c quit' % (self.binary, options, output_filename, pdf_filename)
-            logging.info(cmd)        
-            out = subprocess.check_output(cmd, shell=True)
+        xdpi, ydpi = dpi
+        greyscale = page.is_greyscale()
+        output_dpi = int(max(xdpi, ydpi, 300))
+        if abs(xdpi-ydpi) > xdpi*.05:  # Make sure the two dpi's are within 5%
+            self._warn("X-dpi is %d, Y-dpi is %d, defaulting to %d" % (xdpi, ydpi, output_dpi))
+        return (output_dpi, greyscale)
+
+    def _get_page_settings(self, pdf_filename, pages=None):
+        """
+            Decide the resolution and image format to render each page with, from the
+            scanned images on it.  Black and white scans are rendered to 1-bit png,
+            greyscale scans to greyscale jpeg, and only colour scans to colour jpeg.
+            Pages without any images of their own get the settings of the document.
+            Pages that are just one JPEG or CCITT scan of at least 300dpi get the
+            'extract' format (and no dpi), since their image can be used as it is.
+
+            :param pages: Page numbers to render (default is every page)
+            :returns: list of (dpi, image format, page numbers) for each combination of
+                      settings, ordered by their first page.  The page numbers are None
+                      (every page) if the pdf could not be read.
+        """
+        page_infos = self._read_pages(pdf_filename)
+        if page_infos is None:
+            self._warn("Could not read the pdf to calculate DPI, so defaulting to %sdpi" % self.output_dpi)
+            return [(self.output_dpi, 'jpggrey' if self.greyscale else 'jpg', pages)]
+        output_dpi, greyscale = self._get_dpi(pdf_filename, page_infos)
+        default_format = 'jpggrey' if greyscale else 'jpg'
+
+        if pages is None:
+            pages = range(1, len(page_infos)+1)
+        groups = OrderedDict()
+        for page in sorted(pages):
+            info = page_infos[page-1]
+            dpi = info.get_dpi()
+            if not dpi:
+                settings = (output_dpi, default_format)
+            elif self._can_extract(info, dpi):
+                settings = (None, 'extract')
+            elif info.is_bilevel():
+                settings = (int(max(dpi[0], dpi[1], 300)), 'pnggrey')
+            else:
+                settings = (int(max(dpi[0], dpi[1], 300)), 'jpggrey' if info.is_greyscale() else 'jpg')
+            groups.setdefault(settings, []).append(page)
 
-        except subprocess.CalledProcessError as e:
-            print e.output
-            if "undefined in .getdeviceparams" in e.output:
+        names = {'pnggrey': 'black and white', 'jpggrey': 'greyscale', 'jpg': 'colour'}
+        for (dpi, img_format), group in groups.items():
+            if img_format == 'extract':
+                print("Using the scanned images of %d page(s)" % len(group))
+            else:
+                print("Using %d DPI %s for %d page(s)" % (dpi, names[img_format], len(group)))
+        return [(dpi, img_format, group) for (dpi, img_format), group in groups.items()]
+
+    def _can_extract(self, page_info, dpi):
+        """
+            Whether the page's image can be handed to OCR as it is.  Lower resolution
+            scans still go through ghostscript to bring them up to 300dpi, as do scans
+            with different x and y resolutions.
+        """
+        if not self.extractor or min(dpi) < 300 or abs(dpi[0]-dpi[1]) > dpi[0]*.05:
+            return False
+        return self.extractor.get_format(page_info) is not None
+
+    def _start_gs(self, options, output_filename, pdf_filename):
+        """
+            Start ghostscript in the background
+
+            :param output_filename: Output filename template containing a %d for the page number
+            :returns: (process, file collecting its output)
+        """
+        cmd = '%s -q -dNOPAUSE %s -sOutputFile="%s" "%s" -c quit' % (self.binary, options, output_filename, pdf_filename)
+        if os.name != 'nt':
+            # Replace the shell so we can stop ghostscript itself if the caller bails out early
+            cmd = 'exec ' + cmd
+        logging.info(cmd)
+        out = tempfile.TemporaryFile()
+        proc = subprocess.Popen(cmd, shell=True, stdout=out, stderr=subprocess.STDOUT)
+        return (proc, out)
+
+    def _iter_gs(self, proc, out, output_filename, page_filename=None, pages=None):
+        """
+            Yield each page image of a running ghostscript as soon as it is complete.
+            Ghostscript writes pages in order, so page n is done once page n+1 shows up
+            or the process has exited.
+
+            :param proc: The ghostscript process, from :func:`_start_gs`
+            :param output_filename: Output filename template containing a %d for the page number
+            :param page_filename: When rendering only some pages, the images are renamed to
+                                  this template with their real page number
+            :param pages: The page numbers being rendered
+            :returns: generator of image filenames, in page order
+        """
+        page = 1
+        while True:
+            finished = proc.poll() is not None
+            while os.path.exists(output_filename % (page+1)) or (finished and os.path.exists(output_filename % page)):
+                logging.info("Created image %s" % (output_filename % page))
+                yield self._rename_page(output_filename, page, page_filename, pages)
+                page += 1
+            if finished:
+                break
+            time.sleep(self.poll_interval)
+
+        if proc.returncode != 0:
+            out.seek(0)
+            output = out.read()
+            print output
+            if "undefined in .getdeviceparams" in output:
                 error(self.msgs['GS_OUTDATED'])
             else:
                 error (self.msgs['GS_FAILED'])
 
+    def _rename_page(self, output_filename, page, page_filename, pages):
+        """
+            Ghostscript numbers its output from 1 even when it starts at a later page,
+            so move the image to the name of the page it really is
+        """
+        if output_filename == page_filename or not page_filename:
+            return output_filename % page
+        fn = page_filename % pages[page-1]
+        if os.path.exists(fn):
+            os.remove(fn)
+        os.rename(output_filename % page, fn)
+        return fn
 
-    def make_img_from_pdf(self, pdf_filename):
-        self._get_dpi(pdf_filename) # No need to bother anymore
+    def _get_page_runs(self, pages):
+        """
+            Split the page numbers into runs of consecutive pages, since ghostscript can
+            only be given a first and last page
 
-        if not os.path.exists(pdf_filename):
-            error(self.msgs['GS_MISSING_PDF'] + " %s" % pdf_filename)
+            :param pages: Page numbers (starting at 1), or None for the whole document
+            :returns: list of (first page, last page), with last page None for "to the end"
+        """
+        if pages is None:
+            return [(1, None)]
+        runs = []
+        for page in sorted(set(pages)):
+            if runs and runs[-1][1] == page-1:
+                runs[-1] = (runs[-1][0], page)
+            else:
+                runs.append((page, page))
+        return runs
 
-        filename, filext = os.path.splitext(pdf_filename)
+    def _split_pages(self, pages, chunk_size=None):
+        """
+            :param chunk_size: Most pages to give to one ghostscript run
+            :returns: list of the page lists to give to each ghostscript run (None for
+                      the whole document)
+        """
+        if pages is None:
+            return [None]
+        if self.page_list:
+            runs = [sorted(set(pages))]
+        else:
+            runs = [range(first, last+1) for first, last in self._get_page_runs(pages)]
+        if not chunk_size:
+            return runs
+        return [run[i:i+chunk_size] for run in runs for i in range(0, len(run), chunk_size)]
 
+    def _get_chunk_size(self, settings):
+        """
+            :returns: Pages per ghostscript run, so the pages are shared out evenly
+                      between the ghostscript processes
+        """
+        if self.chunk_size:
+            return self.chunk_size
+        pages = sum(len(group) for dpi, img_format, group in settings if group and img_format != 'extract')
+        return int(math.ceil(float(pages)/max(self.threads, 1))) or None
+
+    def _get_page_options(self, pages):
+        """
+            :returns: The gs options to render just pages
+        """
+        runs = self._get_page_runs(pages)
+        if len(runs) == 1:
+            return ' -dFirstPage=%d -dLastPage=%d' % runs[0]
+        return ' -sPageList=%s' % ','.join(str(first) if first == last else '%d-%d' % (first, last)
+                                           for first, last in runs)
+
+    def _get_run_output(self, options, page_filename, pages):
+        """
+            :returns: (gs options, output filename template) to render pages
+        """
+        if pages is None:
+            return (options, page_filename)
+        options += self._get_page_options(pages)
+        runs = self._get_page_runs(pages)
+        if runs == [(1, len(pages))]:
+            return (options, page_filename)
+        filename, img_file_ext = page_filename.rsplit('_%d.', 1)
+        return (options, '%s_from%d_%%d.%s' % (filename, pages[0], img_file_ext))
+
+    def _setup_img_output(self, pdf_filename, timer, output_dir=None, pages=None):
+        """
+            Figure out the image format and dpi for each page of this pdf, and clear out
+            any stale images of the pages about to be rendered.
+
+            :param output_dir: Where to put the images (default is next to the pdf)
+            :param pages: Page numbers to render (default is every page)
+            :returns: list of (gs options, filename template for each page, page numbers)
+                      for each ghostscript run, in page order.  Runs of extracted pages
+                      have no options and no extension in the template.  The pages are
+                      split into chunks, so the runs can go in parallel.
+        """
+        with timer.stage('dpi'):
+            settings = self._get_page_settings(pdf_filename, pages)
+
+        filename, filext = os.path.splitext(pdf_filename)
+        if output_dir:
+            filename = os.path.join(output_dir, os.path.basename(filename))
 
         # Create ancillary jpeg files to use later to calculate image dpi etc
         #   We no longer use these for the final image. Instead the text is merged
         #   directly with the original PDF.  Yay!
-        if self.greyscale:
-            self.img_format = 'jpggrey'
-            #self.img_format = 'pnggrey'
-            logging.info("Detected greyscale")
-        else:
-            self.img_format = 'jpg'
-            #self.img_format = 'png'
-            logging.info("Detected color")
+        runs = []
+        chunk_size = self._get_chunk_size(settings)
+        for dpi, img_format, group in settings:
+            if img_format == 'extract':
+                # No options, since ghostscript isn't needed for these
+                for first, last in self._get_page_runs(group):
+                    runs.append((None, '%s_%%d' % filename, range(first, last+1)))
+                continue
+            logging.info("Rendering %s at %d DPI as %s" % (group or "all pages", dpi, img_format))
+            img_file_ext = self.gs_options[img_format][0]
+            page_filename = '%s_%%d.%s' % (filename, img_file_ext)
+            options = ' '.join(self.gs_options[img_format][1] + self.render_options) % {'dpi':dpi}
+            for run_pages in self._split_pages(group, chunk_size):
+                runs.append((options, page_filename, run_pages))
+        runs.sort(key=lambda run: run[2][0] if run[2] else 1)
+
+        # Delete any img files already existing (only for the pages being rendered, so
+        # the images of other pages can be kept)
+        img_file_exts = set(ext for ext, options in self.gs_options.values())
+        stale = None
+        if pages is not None:
+            stale = set('%s_%d.%s' % (filename, page, ext) for page in pages for ext in img_file_exts)
+        for img_file_ext in img_file_exts:
+            for fn in glob.glob('%s_*.%s' % (filename, img_file_ext)):
+                if stale is None or fn in stale or fn.startswith('%s_from' % filename):
+                    os.remove(fn)
+        return runs
+
+    def make_img_from_pdf(self, pdf_filename, timer=None, output_dir=None, pages=None):
+        """
+            Render the pages of the pdf into images, for Tesseract.  Up to
+            :attr:`threads` ghostscript processes render chunks of pages at the same
+            time.
+
+            :param output_dir: Where to put the images (default is next to the pdf)
+            :param pages: Page numbers to render (default is every page); images of the
+                          other pages are left alone
+            :returns: list of (image filename, page number), in page order
+        """
+        timer = timer or PyTimer(pdf_filename)
+        runs = self._setup_img_output(pdf_filename, timer, output_dir, pages)
+        return sorted(self._iter_runs(runs, pdf_filename, timer), key=lambda img: img[1])
 
-        self.img_file_ext = self.gs_options[self.img_format][0]
+    def iter_img_from_pdf(self, pdf_filename, timer=None, output_dir=None, pages=None):
+        """
+            Same as :func:`make_img_from_pdf`, except the page images are handed back one
+            at a time as soon as each one is rendered.
 
-        # The possible output files glob
-        globable_filename = '%s_*.%s' % (filename, self.img_file_ext)
-        # Delete any img files already existing
-        for fn in glob.glob(globable_filename):
-            os.remove(fn)
+            :returns: generator of (image filename, page number), in page order
+        """
+        timer = timer or PyTimer(pdf_filename)
+        runs = self._setup_img_output(pdf_filename, timer, output_dir, pages)
+        return self._iter_runs(runs, pdf_filename, timer)
 
-        options = ' '.join(self.gs_options[self.img_format][1]) % {'dpi':self.output_dpi}
-        output_filename = '%s_%%d.%s' % (filename, self.img_file_ext)
-        self._run_gs(options, output_filename, pdf_filename)
-        for fn in glob.glob(globable_filename):
-            logging.info("Created image %s" % fn)
-        return (self.output_dpi, globable_filename)
+    def _iter_runs(self, runs, pdf_filename, timer):
+        """
+            Run ghostscript on the runs of pages (or extract their images), yielding the
+            images of each run in turn as they are rendered.  Up to :attr:`threads` runs
+            are rendered at the same time, starting with the earliest pages.
+        """
+        procs = {}
+        # Time to the end of the last ghostscript run, not counting whatever the
+        # caller does with the last pages
+        start = end = time.time()
+        try:
+            for i, (options, page_filename, run_pages) in enumerate(runs):
+                self._start_runs(runs, i, procs, pdf_filename)
+                if options is None:
+                    for img in self.extractor.iter_images(pdf_filename, page_filename, run_pages, timer):
+                        yield img
+                    continue
+                proc, out = procs[i]
+                run_options, output_filename = self._get_run_output(options, page_filename, run_pages)
+                fns = self._iter_gs(proc, out, output_filename, page_filename, run_pages)
+                for fn, page in itertools.izip(fns, run_pages or itertools.count(1)):
+                    yield (fn, page)
+                    self._start_runs(runs, i, procs, pdf_filename)
+                end = time.time()
+        finally:
+            for proc, out in procs.values():
+                if proc.poll() is None:
+                    proc.kill()
+                    proc.wait()
+            if procs:
+                timer.add('render', end-start)
+
+    def _start_runs(self, runs, first, procs, pdf_filename):
+        """
+            Start ghostscript on the next runs from `first` onwards, as long as fewer
+            than :attr:`threads` are still running
+
+            :param procs: dict of the runs started so far, by index, which gets the new
+                          ones added
+        """
+        running = sum(1 for proc, out in procs.values() if proc.poll() is None)
+        for i in range(first, len(runs)):
+            if running >= max(self.threads, 1):
+                break
+            options, page_filename, run_pages = runs[i]
+            if options is None or i in procs:
+                continue
+            run_options, output_filename = self._get_run_output(options, page_filename, run_pages)
+            procs[i] = self._start_gs(run_options, output_filename, pdf_filename)
+            running += 1
 
+    def iter_pipe_pages(self, pdf_filename, timer=None, output_dir=None, pages=None):
+        """
+            Same as :func:`iter_img_from_pdf`, except no image files are written.
+            Instead, each chunk of pages comes with the ghostscript command that writes
+            their images (uncompressed, one after the other) to stdout, for whoever runs
+            it to pipe into tesseract.  The chunks are at most :attr:`PIPE_CHUNK_SIZE`
+            pages (or ``chunk_size``), so ghostscript only starts up and reads the pdf
+            once for each chunk, and the chunks can still go to tesseract in parallel.
+            The images of scanned pages that can be extracted are handed over as they
+            are, one page at a time.
+
+            :param pages: Page numbers to render
+            :returns: generator of (image names, page numbers, ghostscript command or
+                      None, image data or None, dpi), in order of the first page of
+                      each chunk.  The image names are the filenames the images would
+                      have had.
+        """
+        timer = timer or PyTimer(pdf_filename)
+        with timer.stage('dpi'):
+            settings = self._get_page_settings(pdf_filename, pages)
+        filename = os.path.splitext(pdf_filename)[0]
+        if output_dir:
+            filename = os.path.join(output_dir, os.path.basename(filename))
+
+        chunk_size = self.chunk_size or min(self._get_chunk_size(settings) or self.PIPE_CHUNK_SIZE, self.PIPE_CHUNK_SIZE)
+        chunks = []
+        for dpi, img_format, group in settings:
+            if img_format == 'extract':
+                chunks.extend(([page], dpi, img_format) for page in group)
+            else:
+                chunks.extend((chunk, dpi, img_format) for chunk in self._split_pages(group, chunk_size))
+        chunks.sort()
+        reader = None
+        with open(pdf_filename, 'rb') as f:
+            for chunk, dpi, img_format in chunks:
+                if img_format == 'extract':
+                    reader = reader or PdfFileReader(f)
+                    with timer.stage('render'):
+                        data, img_file_ext = self.extractor.get_page_image(reader.getPage(chunk[0]-1))
+                    yield (['%s_%d.%s' % (filename, chunk[0], img_file_ext)], chunk, None, data, None)
+                    continue
+                img_format = self.pipe_formats[img_format]
+                img_file_ext, options = self.gs_options[img_format]
+                options = ' '.join(options + self.render_options) % {'dpi': dpi}
+                # Keep ghostscript's own messages out of the images
+                cmd = '%s -q -dNOPAUSE -sstdout=%%stderr %s%s -sOutputFile=- "%s" -c quit' % (
+                    self.binary, options, self._get_page_options(chunk), pdf_filename)
+                yield (['%s_%d.%s' % (filename, page, img_file_ext) for page in chunk], chunk, cmd, None, dpi)
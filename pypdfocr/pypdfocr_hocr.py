@@ -0,0 +1,124 @@
+# Copyright 2013 Virantha Ekanayake All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+    Read the lines and words out of hocr files
+"""
+
+import re
+import logging
+try:
+    from xml.etree.cElementTree import iterparse
+except ImportError:
+    from xml.etree.ElementTree import iterparse
+
+from pypdfocr_ocrpage import PyOcrPage, PyOcrLine, PyOcrWord
+
+
+regex_bbox = re.compile(r'bbox\s+(-?\d+)\s+(-?\d+)\s+(-?\d+)\s+(-?\d+)')
+regex_baseline = re.compile(r'baseline\s+([\d\.\-]+)\s+([\d\.\-]+)')
+regex_textangle = re.compile(r'textangle\s+(\d+)')
+regex_font = re.compile(r'x_font\s+([^;]+)')
+regex_fsize = re.compile(r'x_fsize\s+(\d+)')
+regex_xsize = re.compile(r'x_size\s+([\d\.]+)')
+regex_wconf = re.compile(r'x_wconf\s+([\d\.]+)')
+
+
+class PyHocrReader(object):
+    """
+        Reads a hocr file a line at a time, without building the whole document tree.
+        Each line is handed out as soon as its end tag is read, as a
+        :class:`pypdfocr.pypdfocr_ocrpage.PyOcrLine` with the numbers in its title
+        already parsed, and the elements it was read from are thrown away, so memory
+        doesn't grow with the number of words on the page.
+    """
+
+    def read_page(self, hocr_filename, page_num=1):
+        """
+            :param page_num: Which page of the hocr file to read, starting at 1
+            :returns: :class:`pypdfocr.pypdfocr_ocrpage.PyOcrPage` with the lines of
+                      the page, and the size of the image if the hocr says
+        """
+        page = PyOcrPage([])
+        page.lines = list(self.iter_lines(hocr_filename, page_num, page))
+        return page
+
+    def iter_lines(self, hocr_filename, page_num=1, page=None):
+        """
+            :param page: Optional :class:`pypdfocr.pypdfocr_ocrpage.PyOcrPage` to set the
+                         image size of
+            :returns: generator of :class:`pypdfocr.pypdfocr_ocrpage.PyOcrLine` for each
+                      text line of the page.  Words with no text are left out.  A file
+                      that can't be read (e.g. tesseract failed and left garbage) has
+                      no lines past where the garbage starts.
+        """
+        page_count, line = 0, None
+        try:
+            with open(hocr_filename, 'rb') as f:
+                for event, elem in iterparse(f, events=('start', 'end')):
+                    cls = elem.get('class')
+                    if event == 'start':
+                        if cls == 'ocr_page':
+                            page_count += 1
+                            m = regex_bbox.search(elem.get('title', ''))
+                            if page is not None and page_count == page_num and m:
+                                page.width, page.height = int(m.group(3)), int(m.group(4))
+                        elif cls == 'ocr_line' and line is None:
+                            line = elem
+                        continue
+                    if elem is line:
+                        line = None
+                        if page_count == page_num:
+                            parsed = self._get_line(elem)
+                            if parsed:
+                                yield parsed
+                    elif cls == 'ocr_page' and page_count == page_num:
+                        return
+                    if line is None:
+                        # The words of a line are needed until its end tag
+                        elem.clear()
+        except Exception as e:
+            logging.info("Error loading hocr %s (%s), not adding any more text" % (hocr_filename, e))
+
+    def _get_line(self, line):
+        title = line.get('title', '')
+        m = regex_bbox.search(title)
+        if not m:
+            return None
+        bbox = [float(v) for v in m.groups()]
+        m = regex_textangle.search(title)
+        angle = int(m.group(1)) if m else 0
+        m = regex_baseline.search(title)
+        baseline = (float(m.group(1)), float(m.group(2))) if m else None
+        m = regex_xsize.search(title)
+        x_size = float(m.group(1)) if m else None
+
+        words = []
+        for word in line.iter():
+            if word.get('class') != 'ocrx_word':
+                continue
+            text = u' '.join(child.text for child in word.iter() if child.text).strip()
+            title = word.get('title', '')
+            m = regex_bbox.search(title)
+            if not text or not m:
+                continue
+            box = [float(v) for v in m.groups()]
+            m = regex_wconf.search(title)
+            confidence = float(m.group(1)) if m else None
+            m = regex_font.search(title)
+            font_name = m.group(1).strip().strip('"') if m else None
+            m = regex_fsize.search(title)
+            font_size = float(m.group(1)) if m else None
+            words.append(PyOcrWord(text, box, confidence, font_name, font_size))
+        return PyOcrLine(bbox, words, angle, baseline, x_size)
@@ -0,0 +1,306 @@
+# Copyright 2013 Virantha Ekanayake All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+    Ways of putting the text layers onto the pages of the original pdf, besides
+    rewriting the whole pdf with PyPDF2
+"""
+
+import os
+import re
+import math
+import shutil
+import logging
+import subprocess
+import cStringIO
+from itertools import izip
+
+from PyPDF2 import PdfFileReader
+from PyPDF2.generic import ArrayObject, DictionaryObject, IndirectObject, NameObject
+from PyPDF2.utils import matrixMultiply
+
+from pypdfocr_textlayer import PyTextLayer, PyObjectWriter, get_text_pdf_page
+
+
+def get_transform(rotation, tx, ty):
+    """
+        :returns: (a, b, c, d, e, f) matrix that turns by rotation degrees around (tx, ty)
+    """
+    # http://stackoverflow.com/questions/6041244/how-to-merge-two-landscape-pdf-pages-using-pypdf/17392824#17392824
+    translation = [[1, 0, 0],
+                   [0, 1, 0],
+                   [-tx,-ty,1]]
+    rotation = math.radians(rotation)
+    rotating = [[math.cos(rotation), math.sin(rotation),0],
+                [-math.sin(rotation),math.cos(rotation), 0],
+                [0,                  0,                  1]]
+    rtranslation = [[1, 0, 0],
+                   [0, 1, 0],
+                   [tx,ty,1]]
+    ctm = matrixMultiply(translation, rotating)
+    ctm = matrixMultiply(ctm, rtranslation)
+    return ctm[0][0], ctm[0][1], ctm[1][0], ctm[1][1], ctm[2][0], ctm[2][1]
+
+
+def get_page_ranges(pages):
+    """
+        :returns: Sorted page numbers as ranges, e.g. '1-3,5'
+    """
+    ranges = []
+    for page in sorted(pages):
+        if ranges and ranges[-1][1] == page-1:
+            ranges[-1][1] = page
+        else:
+            ranges.append([page, page])
+    return ','.join('%d-%d' % (a, b) if a != b else '%d' % a for a, b in ranges)
+
+
+class PyIncrementalMerge(object):
+    """
+        Adds the text layers to a copy of the original pdf as an incremental update.
+        The original bytes are copied over untouched, and only the OCR'ed page objects
+        get written again, each with one more content stream (the text) and the font
+        added to its resources.  The text is written out as it comes, so memory
+        doesn't grow with the number of pages.  Text pdfs (e.g. from tesseract) have
+        their content streams and resources copied over, with the fonts they all
+        share written only once.
+    """
+
+    def __init__(self):
+        self.text_writer = PyTextLayer()
+
+    def merge(self, orig_pdf_filename, pdf_filename, pages, text_layers, drop=None, work_dir=None):
+        """
+            :param pages: Page numbers (starting at 1) that get a text layer, in order
+            :param text_layers: iterable of (width, height, content stream), or the filename
+                                of a text pdf, for each of pages
+            :param drop: Page numbers to leave out; not possible with an incremental update
+            :returns: False, without using text_layers, if the pdf can't be updated this way
+        """
+        if drop:
+            logging.info("Dropping pages needs the pdf rewritten, not merging incrementally")
+            return False
+        with open(orig_pdf_filename, 'rb') as orig:
+            reader = PdfFileReader(orig, strict=False)
+            if reader.isEncrypted:
+                logging.info("%s is encrypted, not merging incrementally" % orig_pdf_filename)
+                return False
+            prev = self._get_xref_table_offset(orig)
+            if prev is None:
+                logging.info("%s has no plain cross-reference table, not merging incrementally" % orig_pdf_filename)
+                return False
+
+            with open(pdf_filename, 'wb') as out:
+                orig.seek(0)
+                shutil.copyfileobj(orig, out)
+                writer = PyObjectWriter(out, self._get_size(reader), out.tell())
+                writer.write('\n')
+                # Saves the graphics state before the original contents, so whatever
+                # they leave behind doesn't affect the text
+                font, save = None, None
+                for page, text_layer in izip(pages, text_layers):
+                    pg = reader.getPage(page-1)
+                    contents = self._get_contents(pg)
+                    resources = self._copy_resources(pg.get('/Resources'))
+                    if isinstance(text_layer, tuple):
+                        width, height, content = text_layer
+                        font = font or writer.add(self.text_writer.get_font())
+                        fonts = self._get_category(resources, '/Font')
+                        fonts[NameObject(PyTextLayer.FONT_RESOURCE)] = IndirectObject(font, 0, reader)
+                        text_refs = []
+                    else:
+                        width, text_refs = self._add_text_pdf(writer, reader, text_layer, resources)
+                        content = ''
+                    prefix = ''
+                    if contents:
+                        save = save or writer.add_stream('q\n')
+                        prefix = 'Q\n'
+                    rotation = int(pg.get('/Rotate', 0))
+                    if rotation:
+                        prefix += '%s %s %s %s %s %s cm\n' % tuple(self.text_writer._num(v) for v in
+                                                                   get_transform(rotation, width/2, width/2))
+                    if prefix + content:
+                        text_refs.insert(0, IndirectObject(writer.add_stream(prefix + content), 0, reader))
+
+                    new_pg = DictionaryObject(pg)
+                    refs = [IndirectObject(save, 0, reader)] + contents if contents else []
+                    new_pg[NameObject('/Contents')] = ArrayObject(refs + text_refs)
+                    new_pg[NameObject('/Resources')] = resources
+                    writer.add(self._serialize(new_pg), pg.indirectRef.idnum, pg.indirectRef.generation)
+
+                trailer = DictionaryObject()
+                for key in ['/Root', '/Info', '/ID']:
+                    if key in reader.trailer:
+                        trailer[NameObject(key)] = reader.trailer.raw_get(key)
+                writer.finish('%s /Prev %d' % (self._serialize(trailer)[2:-2], prev))
+        return True
+
+    def _get_xref_table_offset(self, f):
+        """
+            :returns: Offset of the last cross-reference section, or None if it isn't a
+                      plain table (i.e. a cross-reference stream)
+        """
+        f.seek(0, os.SEEK_END)
+        f.seek(max(0, f.tell()-1024))
+        tail = f.read()
+        i = tail.rfind('startxref')
+        if i < 0:
+            return None
+        try:
+            offset = int(tail[i+len('startxref'):].split()[0])
+        except (ValueError, IndexError):
+            return None
+        f.seek(offset)
+        return offset if f.read(4) == 'xref' else None
+
+    def _get_size(self, reader):
+        """
+            :returns: The number for the first new object
+        """
+        size = int(reader.trailer.get('/Size', 0))
+        for ids in reader.xref.values():
+            size = max([size] + [obj_id+1 for obj_id in ids])
+        return size
+
+    def _get_contents(self, pg):
+        """
+            :returns: list of references to the content streams of a page
+        """
+        if '/Contents' not in pg:
+            return []
+        contents = pg.raw_get('/Contents')
+        if isinstance(contents, IndirectObject) and isinstance(contents.getObject(), ArrayObject):
+            contents = contents.getObject()
+        if isinstance(contents, ArrayObject):
+            return list(contents)
+        return [contents]
+
+    def _copy_resources(self, resources):
+        """
+            :returns: Copy of the page resources that can have the text's added, leaving
+                      the originals (which may be shared with other pages) untouched
+        """
+        return DictionaryObject(resources.getObject() if resources else {})
+
+    def _get_category(self, resources, category):
+        """
+            :returns: The copied resources' dictionary of category (e.g. /Font), itself
+                      a copy that can be added to
+        """
+        entries = resources.get(category)
+        entries = DictionaryObject(entries.getObject() if entries else {})
+        resources[NameObject(category)] = entries
+        return entries
+
+    def _add_text_pdf(self, writer, reader, text_filename, resources):
+        """
+            Copy the first page of a text pdf, adding its resources to the page's.  Any
+            that are named the same as one of the page's own get a new name, and the
+            content stream is rewritten to use it.
+
+            :param resources: Copy of the page resources, from :func:`_copy_resources`
+            :returns: (width of the text page, list of references to its content streams)
+        """
+        text_pg = get_text_pdf_page(text_filename)
+        text_resources = text_pg.get('/Resources')
+        renames = {}
+        for category, entries in (text_resources.getObject() if text_resources else {}).items():
+            entries = entries.getObject()
+            if not isinstance(entries, DictionaryObject):
+                # /ProcSet
+                continue
+            page_entries = self._get_category(resources, category)
+            for name, value in entries.items():
+                new_name, i = name, 0
+                while new_name in page_entries:
+                    i += 1
+                    new_name = '%s_%d' % (name, i)
+                if new_name != name:
+                    renames[name] = new_name
+                page_entries[NameObject(new_name)] = IndirectObject(writer.copy(value), 0, reader)
+
+        if renames:
+            logging.info("Renaming %s in the text of %s" % (', '.join(sorted(renames)), text_filename))
+            content = re.sub(r'/[^\s/\[\]<>(){}%]+', lambda m: renames.get(m.group(0), m.group(0)),
+                             text_pg.getContents().getData())
+            refs = [IndirectObject(writer.add_stream(content), 0, reader)]
+        else:
+            refs = [IndirectObject(writer.copy(ref), 0, reader) for ref in self._get_contents(text_pg)]
+        return float(text_pg.mediaBox.getWidth()), refs
+
+    def _serialize(self, obj):
+        out = cStringIO.StringIO()
+        obj.writeToStream(out, None)
+        return out.getvalue()
+
+
+class PyQpdfMerge(object):
+    """
+        Writes all the text layers into one text-only pdf, and has qpdf lay its pages
+        over the OCR'ed pages of the original
+    """
+
+    # qpdf exits with 3 when it succeeded, but warned about problems in the input
+    EXIT_WARNINGS = 3
+
+    def __init__(self, binary='qpdf'):
+        """
+            :ivar available: Whether qpdf could be run, which is only checked once
+        """
+        self.binary = binary
+        self.text_writer = PyTextLayer()
+        try:
+            subprocess.check_output('%s --version' % self.binary, shell=True, stderr=subprocess.STDOUT)
+            self.available = True
+        except subprocess.CalledProcessError:
+            self.available = False
+
+    def merge(self, orig_pdf_filename, pdf_filename, pages, text_layers, drop=None, work_dir=None):
+        """
+            Same as :func:`PyIncrementalMerge.merge`, except pages can be dropped
+
+            :param work_dir: Directory for the text-only pdf
+            :returns: False, without using text_layers, if qpdf can't be run
+        """
+        if not self.available:
+            logging.info("Could not run %s, merging with PyPDF2" % self.binary)
+            return False
+
+        basename = os.path.splitext(os.path.basename(orig_pdf_filename))[0]
+        text_filename = os.path.join(work_dir or os.path.dirname(pdf_filename), "%s_text.pdf" % basename)
+        with open(text_filename, 'wb') as f:
+            self.text_writer.write_pdf(f, text_layers)
+
+        cmd = '%s "%s"' % (self.binary, orig_pdf_filename)
+        to_pages = pages
+        drop = set(drop or [])
+        if drop:
+            with open(orig_pdf_filename, 'rb') as f:
+                kept = [pg for pg in range(1, PdfFileReader(f, strict=False).getNumPages()+1) if pg not in drop]
+            cmd += ' --pages . %s --' % get_page_ranges(kept)
+            # The text goes onto the pages by where they end up
+            to_pages = [kept.index(pg)+1 for pg in pages if pg in kept]
+        if pages:
+            cmd += ' --overlay "%s" --to=%s --' % (text_filename, get_page_ranges(to_pages))
+        cmd += ' "%s"' % pdf_filename
+        logging.info(cmd)
+        try:
+            subprocess.check_output(cmd, shell=True, stderr=subprocess.STDOUT)
+        except subprocess.CalledProcessError as e:
+            if e.returncode != self.EXIT_WARNINGS:
+                raise
+            logging.info("qpdf warned about %s: %s" % (orig_pdf_filename, e.output))
+        finally:
+            os.remove(text_filename)
+        return True
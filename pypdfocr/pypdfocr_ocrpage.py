@@ -0,0 +1,96 @@
+# Copyright 2013 Virantha Ekanayake All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+    The OCR'ed text of a page, as read once from tesseract's output and then used
+    for the text layer, filing and anything else that needs it
+"""
+
+
+class PyOcrWord(object):
+    """
+        :ivar text: The word, as unicode
+        :ivar bbox: (x0, y0, x1, y1) in pixels from the top left of the page image
+        :ivar confidence: Tesseract's confidence in the word (0-100), or None
+        :ivar font_name: Font name, or None
+        :ivar font_size: Font size in points, or None
+    """
+    __slots__ = ('text', 'bbox', 'confidence', 'font_name', 'font_size')
+
+    def __init__(self, text, bbox, confidence=None, font_name=None, font_size=None):
+        self.text = text
+        self.bbox = tuple(bbox)
+        self.confidence = confidence
+        self.font_name = font_name
+        self.font_size = font_size
+
+
+class PyOcrLine(object):
+    """
+        :ivar bbox: (x0, y0, x1, y1) in pixels from the top left of the page image
+        :ivar words: list of :class:`PyOcrWord`
+        :ivar angle: Angle of the text in degrees
+        :ivar baseline: (slope, offset) of the baseline from the bottom left of the
+                        line's bbox, or None
+        :ivar x_size: Height of the line in pixels, or None
+    """
+    __slots__ = ('bbox', 'words', 'angle', 'baseline', 'x_size')
+
+    def __init__(self, bbox, words, angle=0, baseline=None, x_size=None):
+        self.bbox = tuple(bbox)
+        self.words = words
+        self.angle = angle
+        self.baseline = baseline
+        self.x_size = x_size
+
+    def get_baseline(self, x):
+        """
+            :returns: The y of the baseline at x, in pixels from the top, or None if
+                      the line isn't upright
+        """
+        if self.angle != 0:
+            return None
+        slope, offset = self.baseline or (0.0, 0.0)
+        return self.bbox[3] + offset + slope*(x - self.bbox[0])
+
+    def get_text(self):
+        return u' '.join(word.text for word in self.words)
+
+
+class PyOcrPage(object):
+    """
+        :ivar lines: list of :class:`PyOcrLine`
+        :ivar width: Width of the page image in pixels, or None if unknown
+        :ivar height: Height of the page image in pixels, or None if unknown
+    """
+    __slots__ = ('lines', 'width', 'height')
+
+    def __init__(self, lines, width=None, height=None):
+        self.lines = lines
+        self.width = width
+        self.height = height
+
+    def iter_words(self):
+        """
+            :returns: generator of (line, word) for every word on the page
+        """
+        for line in self.lines:
+            for word in line.words:
+                yield (line, word)
+
+    def get_text(self):
+        """
+            :returns: The text of the page, one line of text per line
+        """
+        return u'\n'.join(line.get_text() for line in self.lines)
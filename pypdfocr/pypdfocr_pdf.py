@@ -31,10 +31,10 @@ import time
 import tempfile
 import glob
 
-import cStringIO
 import base64
 import zlib
 import math
+import bisect
 
 from cgi import escape
 # Pkg to read multiple image tiffs
@@ -42,18 +42,26 @@ from PIL import Image
 from reportlab.pdfgen.canvas import Canvas
 from reportlab.pdfbase import pdfmetrics
 from reportlab.pdfbase.ttfonts import TTFont
-from xml.etree.ElementTree import ElementTree, ParseError
-import xml.etree
 
 # Import Pypdf2
-from PyPDF2 import PdfFileMerger, PdfFileReader, PdfFileWriter, utils
+from PyPDF2 import PdfFileReader, PdfFileWriter, utils
+from PyPDF2.pdf import PageObject
+from PyPDF2.generic import DictionaryObject, DecodedStreamObject, NameObject
 
 from reportlab.lib.styles import getSampleStyleSheet
 from reportlab.lib.enums import TA_LEFT
 from reportlab.platypus.paragraph import Paragraph
 
-from pypdfocr_util import Retry
-from functools import partial
+from pypdfocr_timing import PyTimer
+from pypdfocr_pdffiler import get_page_text
+from pypdfocr_pdfinfo import PyPageInfo, has_inline_images
+from pypdfocr_textlayer import PyTextLayer, get_text_pdf_page
+from pypdfocr_hocr import PyHocrReader
+from pypdfocr_tsv import PyTsvReader
+from pypdfocr_merge import PyIncrementalMerge, PyQpdfMerge, get_transform
+
+def unwrap_self_text_layer(arg, **kwarg):
+    return PyPdf.make_text_layer(*arg, **kwarg)
 
 class RotatedPara(Paragraph):
     """
@@ -79,34 +87,32 @@ class RotatedPara(Paragraph):
 
 class PyPdf(object):
     """Class to create pdfs from images"""
-    # Some regexes to compile once
-    regex_bbox = re.compile('bbox((\s+\d+){4})')
-    regex_baseline = re.compile('baseline((\s+[\d\.\-]+){2})')
-    regex_fontspec = re.compile('x_font\s+(.+);\s+x_fsize\s+(\d+)')
-    regex_textangle = re.compile('textangle\s+(\d+)')
 
-    def __init__(self, gs):
+    # A page with images needs at least this many words of text to count as already
+    # OCR'ed.  Stamps on a scan (Bates numbers, page numbers, headers) are a handful
+    # of words, while a page of text runs to hundreds.
+    MIN_TEXT_WORDS = 20
+
+    def __init__(self, gs, config=None):
         self.gs = gs # Pointer to ghostscript object
+        config = config or {}
+        # 'direct' writes the text operators straight into the page, 'reportlab' lays
+        # out each word as a reportlab paragraph (slower), and 'tesseract' uses the
+        # text-only pdf tesseract writes for each page as it is
+        self.text_layer = config.get('text_layer', 'direct')
+        self.text_writer = PyTextLayer()
+        self.reader = PyHocrReader()
+        self.tsv_reader = PyTsvReader()
+        # 'pypdf2' rewrites the whole pdf, 'incremental' appends the text to a copy of
+        # the original, and 'qpdf' has qpdf lay a text-only pdf over it
+        self.merge = config.get('merge', 'pypdf2')
+        self.qpdf_binary = config.get('qpdf_binary', 'qpdf')
+        self.qpdf_merge = None
 
 
     def get_transform(self, rotation, tx, ty):
-        # Code taken from here:
-        # http://stackoverflow.com/questions/6041244/how-to-merge-two-landscape-pdf-pages-using-pypdf/17392824#17392824
         # Unclear why PyPDF2 builtin page rotation functions don't work
-        translation = [[1, 0, 0],
-                       [0, 1, 0],
-                       [-tx,-ty,1]]
-        rotation = math.radians(rotation)
-        rotating = [[math.cos(rotation), math.sin(rotation),0],
-                    [-math.sin(rotation),math.cos(rotation), 0],
-                    [0,                  0,                  1]]
-        rtranslation = [[1, 0, 0],
-                       [0, 1, 0],
-                       [tx,ty,1]]
-        ctm = utils.matrixMultiply(translation, rotating)
-        ctm = utils.matrixMultiply(ctm, rtranslation)
-
-        return ctm[0][0], ctm[0][1], ctm[1][0], ctm[1][1], ctm[2][0], ctm[2][1]
+        return get_transform(rotation, tx, ty)
 
     def mergeRotateAroundPointPage(self,page, page2, rotation, tx, ty):
         # Code taken from here:
@@ -129,59 +135,203 @@ class PyPdf(object):
                                                  ctm[1][0], ctm[1][1],
                                                  ctm[2][0], ctm[2][1]])
 
-    def overlay_hocr_pages(self, dpi, hocr_filenames, orig_pdf_filename):
-        
+    def overlay_hocr_pages(self, dpi, hocr_filenames, orig_pdf_filename, timer=None, done=None, callback=None, pages=None, drop=None,
+                           ocr_pages=None, pending=None):
+        """
+            Make the invisible text of each hocr file, and merge it onto the pages of
+            the original pdf.  The text goes straight onto the pages in one pass, each
+            page's text being made as the merge gets to it (unless it is `pending` from
+            the workers); only the reportlab text layer makes a text pdf for each page,
+            which is written next to the image and left there.
+
+            :param dpi: Resolution of the page images, or None to use the resolution
+                        recorded in each image
+            :param hocr_filenames: list of (image filename, hocr filename) pairs.  Pages
+                                   that were piped into tesseract have no image file,
+                                   and get a text layer the size of their pdf page.
+                                   Text-only pdfs from tesseract (.pdf) go onto the
+                                   pages as they are.
+            :param done: Optional dict of image filename to text pdfs already made by an earlier attempt
+            :param callback: Optional function called with (image filename, text pdf filename) as
+                             each text pdf is made (only for text pdfs written to disk)
+            :param pages: Optional list of the page number (starting at 1) each hocr file is
+                          for.  Other pages of the original are copied over untouched.  By
+                          default the hocr files go on the pages in the natural order of
+                          their image filenames.
+            :param drop: Optional list of page numbers to leave out of the OCR'ed pdf
+            :param ocr_pages: Optional dict that gets the
+                              :class:`pypdfocr.pypdfocr_ocrpage.PyOcrPage` read from each
+                              hocr file, keyed by its page number in the OCR'ed pdf (text
+                              pdfs from an earlier attempt aren't read again, and so
+                              their pages are left out)
+            :param pending: Optional dict of image filename to the
+                            :class:`pypdfocr.pypdfocr_pool.PyPoolResult` of a text layer
+                            already started with :func:`submit_text_layer`
+            :returns: Filename of the OCR'ed pdf
+        """
+        timer = timer or PyTimer(orig_pdf_filename)
         logging.debug("Going to overlay following files onto %s" % orig_pdf_filename)
-        # Sort the hocr_filenames into natural keys!
-        hocr_filenames.sort(key=lambda x: self.natural_keys(x[0] ))
+        if pages is None:
+            # Sort the hocr_filenames into natural keys!
+            hocr_filenames = sorted(hocr_filenames, key=lambda x: self.natural_keys(x[0] ))
+            pages = range(1, len(hocr_filenames)+1)
+        else:
+            pages, hocr_filenames = zip(*sorted(zip(pages, hocr_filenames))) or ([], [])
         logging.debug(hocr_filenames)
 
         pdf_dir, pdf_basename = os.path.split(orig_pdf_filename)
         basename = os.path.splitext(pdf_basename)[0]
         pdf_filename = os.path.join(pdf_dir, "%s_ocr.pdf" % (basename))
 
-        text_pdf_filenames = []
-        for img_filename, hocr_filename in hocr_filenames:
-            text_pdf_filename = self.overlay_hocr_page(dpi, hocr_filename, img_filename)
-            logging.info("Created temp OCR'ed pdf containing only the text as %s" % (text_pdf_filename))
-            text_pdf_filenames.append(text_pdf_filename)
-
-        # Now, concatenate this text_pdfs into one single file.
-        # This is a hack to save memory/running time when we have to do the actual merge with a writer
-
-        all_text_filename = os.path.join(pdf_dir, "%s_text.pdf" % (basename))
-        merger = PdfFileMerger()
-        for text_pdf_filename in text_pdf_filenames:
-            merger.append(PdfFileReader(file(text_pdf_filename, 'rb')))
-        merger.write(all_text_filename)
-        merger.close()
-	del merger
-
-
-        writer = PdfFileWriter()
-        orig = open(orig_pdf_filename, 'rb')
-        text_file = open(all_text_filename, 'rb')
-
-        for orig_pg, text_pg in zip(self.iter_pdf_page(orig), self.iter_pdf_page(text_file)):
-            orig_pg = self._get_merged_single_page(orig_pg, text_pg)
-            writer.addPage(orig_pg)
+        text_layers = self._iter_text_layers(dpi, hocr_filenames, pages, orig_pdf_filename, timer, done, callback,
+                                             ocr_pages, drop, pending)
+        # Making the text layers is timed as the overlay stage, not as part of the merge
+        overlay_time = timer.stages.get('overlay', 0)
+        start = time.time()
+        merger = self._get_merger()
+        work_dir = os.path.dirname(hocr_filenames[0][1]) if hocr_filenames else pdf_dir
+        if not (merger and merger.merge(orig_pdf_filename, pdf_filename, list(pages), text_layers, drop, work_dir)):
+            self._merge_pages(orig_pdf_filename, pdf_filename, pages, text_layers, drop)
+        timer.add('merge', time.time() - start - (timer.stages.get('overlay', 0) - overlay_time))
+
+        # The text pdfs are left for the caller, who owns the directory they are in
+        logging.info("Created OCR'ed pdf as %s" % (pdf_filename))
 
-        with open(pdf_filename, 'wb') as f:
-            # Flush out this page merge so we can close the text_file
-            writer.write(f)
+        return pdf_filename
 
-        orig.close()
-        text_file.close()
+    def _get_merger(self):
+        """
+            :returns: The merge backend from the config, or None to merge with PyPDF2
+        """
+        if self.merge == 'incremental':
+            return PyIncrementalMerge()
+        if self.merge == 'qpdf':
+            # Kept for every document, so qpdf is only looked for once
+            self.qpdf_merge = self.qpdf_merge or PyQpdfMerge(self.qpdf_binary)
+            return self.qpdf_merge
+        return None
+
+    def _iter_text_layers(self, dpi, hocr_filenames, pages, orig_pdf_filename, timer, done=None, callback=None,
+                          ocr_pages=None, drop=None, pending=None):
+        """
+            :returns: generator of the text of each page, as a text pdf filename (for the
+                      reportlab and tesseract text layers) or (width, height, content stream)
+        """
+        done = done or {}
+        pending = pending or {}
+        drop = sorted(drop or [])
+        page_sizes = None
+        for (img_filename, hocr_filename), page in zip(hocr_filenames, pages):
+            if self.text_layer == 'reportlab' and img_filename in done:
+                yield done[img_filename]
+                continue
+            if hocr_filename.endswith('.pdf'):
+                # Tesseract's own text-only pdf
+                yield hocr_filename
+                continue
+            start = time.time()
+            if img_filename in pending:
+                # Only the wait for the worker counts towards the stage
+                text_layer, ocr_page, seconds = pending.pop(img_filename).get()
+                if ocr_page is None and ocr_pages is not None:
+                    ocr_page = self.read_ocr_page(hocr_filename)
+                timer.add('overlay', time.time()-start)
+            else:
+                page_size = None
+                if not os.path.exists(img_filename):
+                    page_sizes = page_sizes or self.get_page_sizes(orig_pdf_filename)
+                    page_size = page_sizes[page-1]
+                text_layer, ocr_page, seconds = self.make_text_layer(dpi, img_filename, hocr_filename, page_size)
+                timer.add('overlay', seconds)
+            timer.add('overlay', seconds, page=img_filename)
+            if ocr_pages is not None:
+                ocr_pages[page - bisect.bisect_left(drop, page)] = ocr_page
+            if self.text_layer == 'reportlab':
+                logging.info("Created temp OCR'ed pdf containing only the text as %s" % (text_layer))
+                if callback:
+                    callback(img_filename, text_layer)
+            yield text_layer
+
+    def make_text_layer(self, dpi, img_filename, hocr_filename, page_size=None, keep_ocr_page=True):
+        """
+            Read the OCR'ed text of a page and make its text layer, as a text pdf (for
+            the reportlab text layer) or (width, height, content stream).  Needs
+            nothing but the files, so it can run in a worker process.
+
+            :param page_size: As for :func:`overlay_hocr_page`
+            :param keep_ocr_page: False to hand back None instead of the page's text,
+                                  to save sending it back from a worker
+            :returns: (text layer, :class:`pypdfocr.pypdfocr_ocrpage.PyOcrPage`, seconds taken)
+        """
+        start = time.time()
+        ocr_page = self.read_ocr_page(hocr_filename)
+        if self.text_layer == 'reportlab':
+            text_layer = self.overlay_hocr_page(dpi, hocr_filename, img_filename, page_size, ocr_page)
+        else:
+            text_layer = self.get_text_layer(dpi, ocr_page, img_filename, page_size)
+        return (text_layer, ocr_page if keep_ocr_page else None, time.time()-start)
 
-        # Windows sometimes locks the temp text file for no reason, so we need to retry a few times to delete
-        for fn in text_pdf_filenames:
-            #os.remove(fn)
-            Retry(partial(os.remove, fn), tries=10, pause=3).call_with_retry() 
+    def submit_text_layer(self, pool, dpi, img_filename, hocr_filename, page_size=None, keep_ocr_page=True):
+        """
+            Start :func:`make_text_layer` on a worker, e.g. as soon as the page is OCR'ed,
+            so the text layers are made in parallel instead of one by one in
+            :func:`overlay_hocr_pages`.  Only call this while holding a lease on the pool.
 
-        os.remove(all_text_filename)
-        logging.info("Created OCR'ed pdf as %s" % (pdf_filename))
+            :param pool: :class:`pypdfocr.pypdfocr_pool.PyPool` to run on
+            :returns: :class:`pypdfocr.pypdfocr_pool.PyPoolResult` to pass on in the
+                      `pending` dict of :func:`overlay_hocr_pages`
+        """
+        return pool.submit(unwrap_self_text_layer, ((self, dpi, img_filename, hocr_filename, page_size, keep_ocr_page),))
 
-        return pdf_filename
+    def _merge_pages(self, orig_pdf_filename, pdf_filename, pages, text_layers, drop=None):
+        """
+            Merge the text layers onto the pages with PyPDF2, writing the whole pdf anew
+        """
+        writer = PdfFileWriter()
+        # All the text layers share one font
+        font = writer._addObject(self._get_text_font()) if pages else None
+        ocr_pages = set(pages)
+        drop = set(drop or [])
+        with open(orig_pdf_filename, 'rb') as orig:
+            text_layers = iter(text_layers)
+            for pgnum, orig_pg in enumerate(self.iter_pdf_page(orig)):
+                if pgnum+1 in ocr_pages:
+                    orig_pg = self._get_merged_single_page(orig_pg, self._get_text_page(next(text_layers), font))
+                if pgnum+1 not in drop:
+                    writer.addPage(orig_pg)
+
+            with open(pdf_filename, 'wb') as f:
+                writer.write(f)
+
+    def _get_text_font(self):
+        return DictionaryObject({NameObject('/Type'): NameObject('/Font'), NameObject('/Subtype'): NameObject('/Type1'),
+                                 NameObject('/BaseFont'): NameObject('/' + PyTextLayer.FONT),
+                                 NameObject('/Encoding'): NameObject('/WinAnsiEncoding')})
+
+    def _get_text_page(self, text_layer, font):
+        """
+            :param text_layer: Text pdf filename, or (width, height, content stream)
+            :param font: Font for the content streams, as :attr:`PyTextLayer.FONT_RESOURCE`
+            :returns: PyPDF2 page object with the text
+        """
+        if not isinstance(text_layer, tuple):
+            return get_text_pdf_page(text_layer)
+        width, height, content = text_layer
+        page = PageObject.createBlankPage(None, width, height)
+        contents = DecodedStreamObject()
+        contents.setData(content)
+        page[NameObject('/Contents')] = contents
+        page[NameObject('/Resources')] = DictionaryObject({NameObject('/Font'): DictionaryObject({NameObject(PyTextLayer.FONT_RESOURCE): font})})
+        return page
+
+    def read_ocr_page(self, ocr_filename):
+        """
+            :param ocr_filename: Tesseract's output for a page, as hocr or TSV (.tsv)
+            :returns: :class:`pypdfocr.pypdfocr_ocrpage.PyOcrPage` with its text
+        """
+        if ocr_filename.endswith('.tsv'):
+            return self.tsv_reader.read_page(ocr_filename)
+        return self.reader.read_page(ocr_filename)
 
     def _get_merged_single_page(self, original_page, ocr_text_page):
         """
@@ -213,7 +363,55 @@ class PyPdf(object):
         del img
         return (width, height, dpi)
 
-    def overlay_hocr_page(self, dpi, hocr_filename, img_filename):
+    def get_page_sizes(self, pdf_filename):
+        """
+            :returns: list of (width, height) in points of each page, the way ghostscript
+                      renders them (i.e. turned by the page's /Rotate)
+        """
+        sizes = []
+        with open(pdf_filename, 'rb') as f:
+            for pg in self.iter_pdf_page(f):
+                width, height = float(pg.mediaBox.getWidth()), float(pg.mediaBox.getHeight())
+                if int(pg.get('/Rotate', 0)) % 180:
+                    width, height = height, width
+                sizes.append((width, height))
+        return sizes
+
+    def _get_page_geometry(self, dpi, ocr_page, img_filename, page_size=None):
+        """
+            :returns: (width, height, dpi) of the page the text is for, with the dpi of the
+                      image unless one is given
+        """
+        if page_size:
+            width, height = page_size
+            dpi_jpg = (ocr_page.width*72.0/width if ocr_page.width else 300,)
+        else:
+            width, height, dpi_jpg = self._get_img_dims(img_filename)
+        logging.info("Page width=%f, height=%f" % (width, height))
+        if not dpi:
+            # Pages can be rendered at different resolutions
+            dpi = int(round(dpi_jpg[0]))
+        return (width, height, dpi)
+
+    def get_text_layer(self, dpi, ocr_page, img_filename, page_size=None):
+        """
+            Same as :func:`overlay_hocr_page`, but the text is kept in memory instead of
+            being written out as a pdf
+
+            :param ocr_page: :class:`pypdfocr.pypdfocr_ocrpage.PyOcrPage` with the text
+            :returns: (width, height, content stream)
+        """
+        width, height, dpi = self._get_page_geometry(dpi, ocr_page, img_filename, page_size)
+        return (width, height, self.text_writer.get_content(ocr_page, height, dpi))
+
+    def overlay_hocr_page(self, dpi, hocr_filename, img_filename, page_size=None, ocr_page=None):
+        """
+            :param page_size: (width, height) in points, to size the text layer without
+                              the image (e.g. when it was piped into tesseract).  The
+                              resolution then comes from the hocr.
+            :param ocr_page: The :class:`pypdfocr.pypdfocr_ocrpage.PyOcrPage` already read
+                             from the hocr file, if any
+        """
         hocr_dir, hocr_basename = os.path.split(hocr_filename)
         img_dir, img_basename = os.path.split(img_filename)
         logging.debug("hocr_filename:%s, hocr_dir:%s, hocr_basename:%s" % (hocr_filename, hocr_dir, hocr_basename))
@@ -221,33 +419,76 @@ class PyPdf(object):
 
         #basename = hocr_basename.split('.')[0]
         basename = os.path.splitext(hocr_basename)[0]
-        pdf_filename = os.path.join("text_%s_ocr.pdf" % (basename))
+        # Use full paths instead of switching to the hocr directory, since other
+        # documents may be getting converted in other threads
+        pdf_filename = os.path.join(hocr_dir, "text_%s_ocr.pdf" % (basename))
 
-        # Switch to the hocr directory to make this easier
-        cwd = os.getcwd()
-        if hocr_dir != "":
-            os.chdir(hocr_dir)
+        ocr_page = ocr_page or self.read_ocr_page(hocr_filename)
+        width, height, dpi = self._get_page_geometry(dpi, ocr_page, img_filename, page_size)
 
         with open(pdf_filename, "wb") as f:
             logging.info("Overlaying hocr and creating text pdf %s" % pdf_filename)
+            if self.text_layer != 'reportlab':
+                content = self.text_writer.get_content(ocr_page, height, dpi)
+                self.text_writer.write_pdf(f, [(width, height, content)], os.path.basename(hocr_filename))
+                return pdf_filename
+
             pdf = Canvas(f, pageCompression=1)
             pdf.setCreator('pypdfocr')
             pdf.setTitle(os.path.basename(hocr_filename))
             pdf.setPageCompression(1)
-
-            width, height, dpi_jpg = self._get_img_dims(img_basename)
             pdf.setPageSize((width,height))
-            logging.info("Page width=%f, height=%f" % (width, height))
-
-            pg_num = 1
 
             logging.info("Adding text to page %s" % pdf_filename)
-            self.add_text_layer(pdf,hocr_basename,pg_num,height,dpi)
+            self.add_text_layer(pdf,ocr_page,height,dpi)
             pdf.showPage()
             pdf.save()
 
-        os.chdir(cwd)
-        return os.path.join(hocr_dir, pdf_filename)
+        return pdf_filename
+
+    def get_page_count(self, pdf_filename):
+        with open(pdf_filename, 'rb') as f:
+            return PdfFileReader(f).getNumPages()
+
+    def get_pages_to_ocr(self, pdf_filename):
+        """
+            Find the pages that are only scanned images, and so need OCR.  Pages that
+            already have real text (born-digital pages, or pages OCR'ed before) or that
+            have no images at all are left as they are.  A scan with only a few words
+            of text on it, like a Bates number or page number stamped over it, still
+            gets OCR'ed.
+
+            :returns: (page count, list of page numbers to OCR, starting at 1)
+        """
+        pages = []
+        with open(pdf_filename, 'rb') as f:
+            reader = PdfFileReader(f)
+            page_count = reader.getNumPages()
+            for pgnum in range(page_count):
+                page = reader.getPage(pgnum)
+                try:
+                    words = len(get_page_text(page).split())
+                    has_images = words < self.MIN_TEXT_WORDS and self._page_has_images(page)
+                except Exception as e:
+                    # When in doubt, OCR it
+                    logging.info("Could not check page %d for text (%s)" % (pgnum+1, e))
+                    words, has_images = 0, True
+                if words >= self.MIN_TEXT_WORDS:
+                    logging.info("Page %d already has text, skipping OCR" % (pgnum+1))
+                elif not has_images:
+                    logging.info("Page %d has no images, skipping OCR" % (pgnum+1))
+                else:
+                    if words:
+                        logging.info("Page %d only has %d words of text, OCR'ing it" % (pgnum+1, words))
+                    pages.append(pgnum+1)
+        return (page_count, pages)
+
+    def _page_has_images(self, page):
+        """
+            Whether the page draws any image, either an image XObject (directly or
+            inside a form XObject) or an inline image in its content stream
+        """
+        return bool(PyPageInfo(page).images) or has_inline_images(page)
 
     def iter_pdf_page(self, f):
         reader = PdfFileReader(f)
@@ -266,65 +507,18 @@ class PyPdf(object):
         '''
         return [ self._atoi(c) for c in re.split('(\d+)', text) ]
 
-    def add_text_layer(self,pdf, hocrfile, page_num,height, dpi):
+    def add_text_layer(self,pdf, ocr_page, height, dpi):
       """Draw an invisible text layer for OCR data.
 
-        This function really needs to get cleaned up
-        
+        :param ocr_page: :class:`pypdfocr.pypdfocr_ocrpage.PyOcrPage` with the text
       """
-      hocr = ElementTree()
-      try: 
-        # It's possible tesseract has failed and written garbage to this hocr file, so we need to catch any exceptions
-          hocr.parse(hocrfile)
-      except Exception:
-          logging.info("Error loading hocr, not adding any text")
-          return 
-
-      logging.debug(xml.etree.ElementTree.tostring(hocr.getroot()))
-      for c in hocr.getroot():  # Find the <body> tag
-          if c.tag != 'body':
-              continue
-      for page in c: # Each child in the body is a page tag
-          if (page.attrib['class'] != "ocr_page"):
-              assert ("Why is this hocr not paging properly??")
-          if page.attrib['id'] == 'page_%d' %(page_num):
-              break
-
-      for line in page.findall(".//{http://www.w3.org/1999/xhtml}span"):
-      #for line in page.findall(".//span"):
-        if line.attrib['class'] != 'ocr_line':
-          continue
-        linebox = self.regex_bbox.search(line.attrib['title']).group(1).split()
-        textangle = self.regex_textangle.search(line.attrib['title'])
-        if textangle:
-            textangle = self._atoi(textangle.group(1))
-        else:
-            textangle = 0
-
-        try:
-          baseline = self.regex_baseline.search(line.attrib['title']).group(1).split()
-        except AttributeError:
-          baseline = [ 0, 0 ]
-
-        linebox = [float(i) for i in linebox]
-        baseline = [float(i) for i in baseline]
-
-        for word in line:
-          if word.attrib['class'] != 'ocrx_word':
-            continue
-          word_text = []
-          for child in word.iter():
-              if child.text:
-                  word_text.append(child.text)
-          word.text = ' '.join(word_text)
-          if word.text is None:
-            continue
-          logging.debug("word: %s, angle: %d" % ( word.text.strip(), textangle))
-
-
-          box = self.regex_bbox.search(word.attrib['title']).group(1).split()
-          #b = self.polyval(baseline, (box[0] + box[2]) / 2 - linebox[0]) + linebox[3]
-          box = [float(i) for i in box]
+      style = getSampleStyleSheet()
+      for line in ocr_page.lines:
+        textangle = line.angle
+        for word in line.words:
+          text, box, font_size = word.text, word.bbox, word.font_size
+          # Only formatted when debug logging is on
+          logging.debug("word: %s, angle: %d", text, textangle)
 
           # Transform angle to x,y co-ords needed for proper text placement
           # We only support 0, 90, 180, 270!.  Anything else, we'll just use the normal orientation for now
@@ -336,15 +530,13 @@ class PyPdf(object):
                     }
           x,y = coords.get(textangle, (box[0], box[1]))
 
-          style = getSampleStyleSheet()
           normal = style["BodyText"]
           normal.alignment = TA_LEFT
           normal.leading = 0
-          font_name, font_size = self._get_font_spec(word.attrib['title'])
           normal.fontName = "Helvetica"
-          normal.fontSize = font_size
+          normal.fontSize = font_size or 8
 
-          para = RotatedPara(escape(word.text.strip()), normal, textangle)
+          para = RotatedPara(escape(text), normal, textangle)
           para.wrapOn(pdf, para.minWidth(), 100)  # Not sure what to use as the height  here
           para.drawOn(pdf, x*72/dpi, height - y*72/dpi)
 
@@ -353,12 +545,3 @@ class PyPdf(object):
     def polyval(self,poly, x):
       return x * poly[0] + poly[1]
 
-
-    def _get_font_spec(self, tag):
-        try:
-            fontspec = self.regex_fontspec.search(tag).groups()
-            fontname, fontsize = fontspec
-        except Exception:
-            fontname = ""
-            fontsize = "8"
-        return (fontname, self._atoi(fontsize))
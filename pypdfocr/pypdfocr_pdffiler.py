@@ -25,9 +25,58 @@ import logging
 import shutil
 
 from PyPDF2 import PdfFileReader
+from PyPDF2.pdf import ContentStream
+from PyPDF2.generic import ByteStringObject, TextStringObject
 from pypdfocr_filer import PyFiler
 from pypdfocr_filer_dirs import PyFilerDirs
 
+def get_page_text(page):
+    """
+        :param page: PyPDF2 page object
+        :returns: The text on the page, as a single line of ascii
+    """
+    return get_single_line(extract_text(page))
+
+def extract_text(page):
+    """
+        Same as PyPDF2's extractText, but strings that aren't text in the pdf's own
+        encoding are read as UTF-16 instead of being left out.  That's how the text
+        in two-byte fonts, such as the text-only pdfs from tesseract, comes out.
+
+        :param page: PyPDF2 page object
+        :returns: The text on the page
+    """
+    contents = page.getContents()
+    if contents is None:
+        return u''
+    if not isinstance(contents, ContentStream):
+        contents = ContentStream(contents, page.pdf)
+    text = []
+    for operands, operator in contents.operations:
+        if operator in ("T*", "'", '"'):
+            text.append(u'\n')
+        if operator in ('Tj', "'", '"'):
+            text.append(_get_string_text(operands[-1]))
+        elif operator == 'TJ':
+            text.extend(_get_string_text(item) for item in operands[0])
+            text.append(u'\n')
+    return u''.join(text)
+
+def _get_string_text(string):
+    if isinstance(string, TextStringObject):
+        return string
+    if isinstance(string, ByteStringObject) and len(string) % 2 == 0:
+        return string.decode('utf-16-be', 'ignore')
+    return u''
+
+def get_single_line(text):
+    """
+        :returns: The text as a single line of ascii
+    """
+    text = text.encode('ascii', 'ignore')
+    text = text.replace('\n', ' ')
+    return text
+
 class PyPdfFiler(object):
     def __init__(self, filer):
 
@@ -38,15 +87,23 @@ class PyPdfFiler(object):
         # if there is no match in the text
         self.file_using_filename = False 
 
-    def iter_pdf_page_text(self, filename):
+    def iter_pdf_page_text(self, filename, ocr_pages=None):
+        """
+            :param ocr_pages: Optional dict of page number to the
+                              :class:`pypdfocr.pypdfocr_ocrpage.PyOcrPage` that was OCR'ed
+                              onto it, whose text is used instead of reading it back out
+                              of the pdf
+            :returns: generator of the text of each page, as a single line of ascii
+        """
         self.filename = filename
+        ocr_pages = ocr_pages or {}
         reader = PdfFileReader(filename)
         logging.info("pdf scanner found %d pages in %s" % (reader.getNumPages(), filename))
         for pgnum in range(reader.getNumPages()):
-            text = reader.getPage(pgnum).extractText()
-            text = text.encode('ascii', 'ignore')
-            text = text.replace('\n', ' ')
-            yield text
+            if pgnum+1 in ocr_pages:
+                yield get_single_line(ocr_pages[pgnum+1].get_text())
+            else:
+                yield get_page_text(reader.getPage(pgnum))
 
     def _get_matching_folder(self, pdfText):
         searchText = pdfText.lower()
@@ -62,8 +119,12 @@ class PyPdfFiler(object):
     def file_original (self, original_filename):
         return self.filer.file_original(original_filename)
 
-    def move_to_matching_folder(self, filename):
-        for page_text in self.iter_pdf_page_text(filename):
+    def move_to_matching_folder(self, filename, ocr_pages=None):
+        """
+            :param ocr_pages: Optional dict of page number to OCR'ed text, as for
+                              :func:`iter_pdf_page_text`
+        """
+        for page_text in self.iter_pdf_page_text(filename, ocr_pages):
             tgt_folder = self._get_matching_folder(page_text)
             if tgt_folder: break  # Stop searching through pdf pages as soon as we find a match
 
@@ -0,0 +1,284 @@
+# Copyright 2013 Virantha Ekanayake All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+    Read the page sizes and the scanned images on each page straight from the pdf
+    structure, to figure out the resolution and colour of a scan without any
+    external tools
+"""
+
+import re
+import logging
+
+from PyPDF2 import PdfFileReader
+from PyPDF2.generic import ArrayObject, BooleanObject
+
+
+regex_inline_image = re.compile('(^|\s)BI\s')
+regex_content_token = re.compile(r'/[^\s/\[\]()<>{}%]*|[-+]?(?:\d+\.?\d*|\.\d+)|[A-Za-z\'"*]+|\S')
+
+def has_inline_images(page):
+    """
+        Whether the content stream of a PyPDF2 page draws any inline images.  This
+        decodes the content stream, so it's only worth doing when there are no other
+        images.
+    """
+    contents = page.getContents()
+    if contents is None:
+        return False
+    return regex_inline_image.search(contents.getData()) is not None
+
+
+class PyPdfImage(object):
+    """
+        An image XObject used on a page
+
+        :ivar name: Resource name of the image (e.g. /Im0)
+        :ivar width: Width in pixels
+        :ivar height: Height in pixels
+        :ivar bits: Bits per colour component
+        :ivar greyscale: Whether the image is greyscale (or black and white)
+        :ivar filters: list of the stream filters (e.g. ['/DCTDecode'])
+        :ivar params: dict of the decode parameters of the last filter
+        :ivar colorspace: Name of the colour space (e.g. /DeviceGray), or None if it
+                          isn't a plain device colour space
+        :ivar decode: The /Decode array, or None
+        :ivar image_mask: Whether this is a stencil mask rather than an image
+    """
+
+    GREY_SPACES = ['/DeviceGray', '/G', '/CalGray', '/Separation']
+    DEVICE_SPACES = ['/DeviceGray', '/DeviceRGB', '/DeviceCMYK']
+
+    def __init__(self, name, xobject, resources):
+        self.name = name
+        self.width = int(xobject.get('/Width', 0))
+        self.height = int(xobject.get('/Height', 0))
+        self.bits = int(xobject.get('/BitsPerComponent', 1))
+        if xobject.get('/ImageMask') or self.bits == 1:
+            self.greyscale = True
+        else:
+            self.greyscale = self._is_grey(xobject.get('/ColorSpace'), resources)
+        filters = xobject.get('/Filter', [])
+        if not isinstance(filters, ArrayObject):
+            filters = [filters]
+        self.filters = [str(f) for f in filters]
+
+        params = xobject.get('/DecodeParms')
+        if isinstance(params, ArrayObject):
+            params = params[-1] if params else None
+        self.params = {}
+        for key, value in (params.getObject().items() if params else []):
+            self.params[str(key)] = value.value if isinstance(value, BooleanObject) else value
+        colorspace = xobject.get('/ColorSpace')
+        self.colorspace = str(colorspace) if colorspace in self.DEVICE_SPACES else None
+        decode = xobject.get('/Decode')
+        self.decode = [float(d) for d in decode] if decode is not None else None
+        self.image_mask = bool(xobject.get('/ImageMask', False))
+
+    def _is_grey(self, colorspace, resources, depth=0):
+        """
+            Work out whether a colour space has a single component.  Anything that
+            can't be figured out counts as colour, so the page isn't rendered without it.
+        """
+        if colorspace is None or depth > 8:
+            return False
+        colorspace = colorspace.getObject()
+        if isinstance(colorspace, ArrayObject):
+            family = colorspace[0]
+            if family == '/ICCBased':
+                return colorspace[1].getObject().get('/N') == 1
+            if family in ['/Indexed', '/I']:
+                return self._is_grey(colorspace[1], resources, depth+1)
+            if family == '/DeviceN':
+                return len(colorspace[1].getObject()) == 1
+            return family in self.GREY_SPACES
+        if colorspace in self.GREY_SPACES:
+            return True
+        # A named colour space from the page resources
+        named = (resources or {}).get('/ColorSpace')
+        if named is not None and colorspace in named.getObject():
+            return self._is_grey(named.getObject()[colorspace], resources, depth+1)
+        return False
+
+
+class PyPageInfo(object):
+    """
+        Size and images of one page
+
+        :ivar width: Page width in points (of the unrotated MediaBox)
+        :ivar height: Page height in points
+        :ivar rotation: Page rotation in degrees
+        :ivar images: list of :class:`PyPdfImage` on the page, including the ones inside
+                      form XObjects
+        :ivar full_page_image: The :class:`PyPdfImage` if all the page does is draw this
+                               one image upright over the whole page (a plain scan), else None
+    """
+
+    # Content streams of plain scans are a few dozen bytes, so don't bother looking
+    # through anything bigger
+    MAX_SCAN_CONTENTS = 4096
+
+    def __init__(self, page):
+        """
+            :param page: PyPDF2 page object
+        """
+        user_unit = float(page.get('/UserUnit', 1))
+        self.width = float(page.mediaBox.getWidth())*user_unit
+        self.height = float(page.mediaBox.getHeight())*user_unit
+        self.rotation = int(page.get('/Rotate', 0)) % 360
+        self.images = []
+        self._add_images(page.get('/Resources'))
+        self.full_page_image = None
+        if len(self.images) == 1:
+            self.full_page_image = self._find_full_page_image(page)
+
+    def _add_images(self, resources, depth=0):
+        if resources is None or depth > 8:
+            return
+        resources = resources.getObject()
+        xobjects = resources.get('/XObject')
+        if xobjects is None:
+            return
+        for name, xobject in xobjects.getObject().items():
+            xobject = xobject.getObject()
+            subtype = xobject.get('/Subtype')
+            if subtype == '/Image':
+                self.images.append(PyPdfImage(name, xobject, resources))
+            elif subtype == '/Form':
+                self._add_images(xobject.get('/Resources'), depth+1)
+
+    def _get_contents(self, page):
+        """
+            :returns: The decoded content stream of the page, or None if there is none or
+                      it is too big to be a plain scan
+        """
+        contents = page.get('/Contents')
+        if contents is None:
+            return None
+        contents = contents.getObject()
+        streams = contents if isinstance(contents, ArrayObject) else [contents]
+        streams = [stream.getObject() for stream in streams]
+        if sum(len(stream._data) for stream in streams) > self.MAX_SCAN_CONTENTS:
+            return None
+        return '\n'.join(stream.getData() for stream in streams)
+
+    def _find_full_page_image(self, page):
+        """
+            Run through the content stream, keeping track of the transformation matrix,
+            to see where the page's only image gets drawn.  Only saving/restoring the
+            graphics state, transformations and graphics state parameters are allowed
+            besides drawing the image once; anything else (text, paths, inline images,
+            forms) means the page needs rendering.
+        """
+        image = self.images[0]
+        xobject = page['/Resources'].getObject()['/XObject'].getObject().get(image.name)
+        if xobject is None or xobject.getObject().get('/Subtype') != '/Image':
+            return None  # The image is inside a form
+        data = self._get_contents(page)
+        if data is None:
+            return None
+
+        ctm, saved, operands, placed = [1, 0, 0, 1, 0, 0], [], [], None
+        for token in regex_content_token.findall(data):
+            if token[0] in '+-.0123456789':
+                operands.append(float(token))
+                continue
+            if token[0] == '/':
+                operands.append(token)
+                continue
+            if token == 'q':
+                saved.append(ctm)
+            elif token == 'Q':
+                if not saved:
+                    return None
+                ctm = saved.pop()
+            elif token == 'cm':
+                if len(operands) != 6 or not all(isinstance(x, float) for x in operands):
+                    return None
+                ctm = self._multiply(operands, ctm)
+            elif token == 'Do':
+                if placed or operands != [image.name]:
+                    return None
+                placed = ctm
+            elif token != 'gs':
+                return None
+            operands = []
+        if not placed:
+            return None
+
+        a, b, c, d, e, f = placed
+        box = page.mediaBox
+        width, height = float(box.getWidth()), float(box.getHeight())
+        x, y = float(box.getLowerLeft_x()), float(box.getLowerLeft_y())
+        close = lambda value, target, size: abs(value-target) <= size*0.01
+        if (close(a, width, width) and close(d, height, height) and close(b, 0, height)
+                and close(c, 0, width) and close(e, x, width) and close(f, y, height)):
+            return image
+        return None
+
+    def _multiply(self, m, n):
+        """
+            :returns: The matrix product of two pdf transformation matrices [a b c d e f]
+        """
+        return [m[0]*n[0] + m[1]*n[2], m[0]*n[1] + m[1]*n[3],
+                m[2]*n[0] + m[3]*n[2], m[2]*n[1] + m[3]*n[3],
+                m[4]*n[0] + m[5]*n[2] + n[4], m[4]*n[1] + m[5]*n[3] + n[5]]
+
+    def get_main_image(self):
+        """
+            :returns: The largest image on the page, or None
+        """
+        if not self.images:
+            return None
+        return max(self.images, key=lambda img: img.width*img.height)
+
+    def get_dpi(self):
+        """
+            Resolution of the main image, assuming it covers the whole page (as scanned
+            pages do).  An image that is turned on the page (landscape image on a
+            portrait page) is measured against the matching sides.
+
+            :returns: (x dpi, y dpi), or None if the page has no images
+        """
+        img = self.get_main_image()
+        if not img or not self.width or not self.height:
+            return None
+        width, height = self.width, self.height
+        if (img.width > img.height) != (width > height):
+            width, height = height, width
+        return (round(img.width*72.0/width), round(img.height*72.0/height))
+
+    def is_greyscale(self):
+        return all(img.greyscale for img in self.images)
+
+    def is_bilevel(self):
+        """
+            Whether the page only has black and white (1 bit) images
+        """
+        return bool(self.images) and all(img.bits == 1 and img.greyscale for img in self.images)
+
+
+class PyPdfInfo(object):
+    """
+        Reads every page of a pdf in one pass
+
+        :ivar pages: list of :class:`PyPageInfo`, in page order
+    """
+
+    def __init__(self, pdf_filename):
+        self.pdf_filename = pdf_filename
+        with open(pdf_filename, 'rb') as f:
+            reader = PdfFileReader(f)
+            self.pages = [PyPageInfo(reader.getPage(pgnum)) for pgnum in range(reader.getNumPages())]
+        logging.debug("Read %d pages from %s" % (len(self.pages), pdf_filename))
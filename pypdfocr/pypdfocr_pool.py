@@ -0,0 +1,203 @@
+# Copyright 2013 Virantha Ekanayake All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+    Long-lived worker pools that can be shared across many documents
+"""
+
+import logging
+import threading
+import pickle
+import traceback
+from contextlib import contextmanager
+
+from multiprocessing import Pool
+from pypdfocr_interrupts import init_worker
+
+
+def _run_task(func, args):
+    """
+        Runs inside the worker process.  Any failure is handed back as a value
+        rather than raised, so the pool always reports the task as finished and
+        its slot in the queue gets freed up.
+    """
+    try:
+        return (True, func(*args))
+    except (Exception, SystemExit) as e:
+        try:
+            pickle.dumps(e)
+        except Exception:
+            e = Exception(traceback.format_exc())
+        return (False, e)
+
+
+class PyPoolResult(object):
+    """
+        Handle to a task submitted with :func:`PyPool.submit`
+    """
+
+    def __init__(self, async_result):
+        self._result = async_result
+
+    def ready(self):
+        """
+            :returns: True if the task has finished
+        """
+        return self._result.ready()
+
+    def get(self):
+        """
+            Wait for the task, and return its value (or re-raise its exception)
+        """
+        ok, value = self._result.get()
+        if not ok:
+            raise value
+        return value
+
+
+class PyPool(object):
+    """
+        Wraps a multiprocessing Pool so it can be reused for every document instead of
+        being created and torn down each time.
+
+        The worker processes are started on :func:`start` (or on first use), and are
+        shut down once the pool has been idle for `idle_timeout` seconds to release
+        their memory.  The next :func:`lease` brings them back up again.
+
+        Tasks go through a bounded queue of `queue_size` slots shared by everyone using
+        the pool, so when several documents are in flight, a long document can only get
+        a few pages ahead of a short one instead of its whole page count.
+    """
+
+    def __init__(self, processes, idle_timeout=300, queue_size=None):
+        self.processes = processes
+        self.idle_timeout = idle_timeout
+        if not queue_size:
+            # Enough to keep every worker busy with one more page waiting
+            queue_size = 2*processes
+        self.queue_size = queue_size
+
+        self._slots = threading.BoundedSemaphore(queue_size)
+        self._pool = None
+        self._busy = 0
+        self._timer = None
+        self._lock = threading.Lock()
+
+    def _cancel_timer(self):
+        if self._timer:
+            self._timer.cancel()
+            self._timer = None
+
+    def _start(self):
+        if self._pool is None:
+            logging.debug("Starting pool with %d processes" % self.processes)
+            self._pool = Pool(processes=self.processes, initializer=init_worker)
+        return self._pool
+
+    def _shrink(self):
+        """
+            Called from the idle timer.  Shut the workers down if nobody has
+            picked the pool back up in the meantime
+        """
+        with self._lock:
+            self._timer = None
+            if self._busy == 0 and self._pool is not None:
+                logging.debug("Pool idle for %d seconds, shutting down workers" % self.idle_timeout)
+                self._pool.close()
+                self._pool.join()
+                self._pool = None
+
+    def start(self):
+        """
+            Pre-warm the worker processes so the first document doesn't pay for them
+        """
+        with self._lock:
+            self._start()
+            if self._busy == 0 and self._timer is None:
+                self._schedule_shrink()
+
+    def _schedule_shrink(self):
+        if self.idle_timeout is None:
+            return
+        self._timer = threading.Timer(self.idle_timeout, self._shrink)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def submit(self, func, args):
+        """
+            Queue up func(\*args) on the workers.  Blocks while the queue is full, so only
+            call this while holding a :func:`lease`.
+
+            :returns: :class:`PyPoolResult`
+        """
+        slots = self._slots
+        slots.acquire()
+        try:
+            result = self._pool.apply_async(_run_task, (func, args), callback=lambda _: slots.release())
+        except Exception:
+            slots.release()
+            raise
+        return PyPoolResult(result)
+
+    def map(self, func, iterable):
+        """
+            Like Pool.map, but going through the shared bounded queue
+        """
+        results = [self.submit(func, (arg,)) for arg in iterable]
+        return [r.get() for r in results]
+
+    @contextmanager
+    def lease(self):
+        """
+            Context manager that keeps the worker processes up for the duration of a
+            job, and hands back this object for :func:`submit` and :func:`map` calls.
+            On ctrl-c, the workers are terminated and a fresh set is started on the
+            next lease.
+        """
+        with self._lock:
+            self._cancel_timer()
+            self._busy += 1
+            pool = self._start()
+        try:
+            yield self
+        except KeyboardInterrupt:
+            print("Caught keyboard interrupt... terminating")
+            with self._lock:
+                if self._pool is pool:
+                    self._pool = None
+                    # Slots held by the killed tasks will never be given back
+                    self._slots = threading.BoundedSemaphore(self.queue_size)
+            pool.terminate()
+            pool.join()
+            raise
+        finally:
+            with self._lock:
+                self._busy -= 1
+                if self._busy == 0 and self._pool is not None:
+                    self._schedule_shrink()
+
+    def close(self):
+        """
+            Wait for any outstanding work and shut down the workers
+        """
+        with self._lock:
+            timer = self._timer
+            self._cancel_timer()
+            pool, self._pool = self._pool, None
+        if timer:
+            # Let the timer thread wind down before the interpreter does
+            timer.join()
+        if pool is not None:
+            pool.close()
+            pool.join()
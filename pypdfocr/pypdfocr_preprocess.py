@@ -27,8 +27,7 @@ import glob
 import functools
 import signal
 
-from multiprocessing import Pool
-from pypdfocr_interrupts import init_worker
+from pypdfocr_pool import PyPool
 
 # Ugly hack to pass in object method to the multiprocessing library
 # From http://www.rueckstiess.net/research/snippets/show/ca1d7d90
@@ -94,25 +93,27 @@ class PyPreprocess(object):
         else:
             return out_filename
 
-    def preprocess(self, in_filenames):
+    def preprocess(self, in_filenames, pool=None):
+        """
+            Run the ImageMagick cleanup on each image in parallel.
+
+            :param in_filenames: Image filenames
+            :param pool: Optional :class:`pypdfocr.pypdfocr_pool.PyPool` to run on; otherwise
+                         a pool is created just for this call
+            :returns: list of preprocessed image filenames
+        """
         fns = in_filenames
 
-        pool = Pool(processes=self.threads, initializer=init_worker)
+        own_pool = pool is None
+        if own_pool:
+            pool = PyPool(self.threads)
         try:
-            logging.info("Starting preprocessing parallel execution")
-            preprocessed_filenames = pool.map(unwrap_self,zip([self]*len(fns),fns))
-            pool.close()
-        except KeyboardInterrupt or Exception:
-            print("Caught keyboard interrupt... terminating")
-            pool.terminate()
-            #sys,exit(-1)
-            raise
+            with pool.lease() as workers:
+                logging.info("Starting preprocessing parallel execution")
+                preprocessed_filenames = workers.map(unwrap_self,zip([self]*len(fns),fns))
         finally:
-            pool.join()
+            if own_pool:
+                pool.close()
             logging.info ("Completed preprocessing")
 
         return preprocessed_filenames
-
-
-
-
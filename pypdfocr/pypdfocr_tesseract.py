@@ -20,13 +20,23 @@
 """
 
 import os, sys
+import re
 import logging
 import subprocess
 import glob
+import time
+import tempfile
+import cStringIO
 from subprocess import CalledProcessError
 
-from multiprocessing import Pool
-from pypdfocr_interrupts import init_worker
+from PyPDF2 import PdfFileReader, PdfFileWriter
+from PyPDF2.utils import PdfReadError
+
+from pypdfocr_pool import PyPool
+from pypdfocr_timing import PyTimer
+from pypdfocr_cache import PyOcrCache
+
+regex_hocr_page = re.compile(r"<div class=['\"]ocr_page['\"]")
 
 def error(text):
     print("ERROR: %s" % text)
@@ -35,8 +45,54 @@ def error(text):
 # Ugly hack to pass in object method to the multiprocessing library
 # From http://www.rueckstiess.net/research/snippets/show/ca1d7d90
 # Basically gets passed in a pair of (self, arg), and calls the method
-def unwrap_self(arg, **kwarg):
-    return PyTesseract.make_hocr_from_pnm(*arg, **kwarg)
+def unwrap_self_batch(arg, **kwarg):
+    start = time.time()
+    hocr_filenames = PyTesseract.make_hocr_from_pnm_batch(*arg, **kwarg)
+    seconds = (time.time()-start)/len(hocr_filenames)
+    return [(hocr_filename, seconds) for hocr_filename in hocr_filenames]
+
+def unwrap_self_pipe(arg, **kwarg):
+    start = time.time()
+    hocr_filenames = PyTesseract.make_hocr_from_pipe(*arg, **kwarg)
+    seconds = (time.time()-start)/len(hocr_filenames)
+    return [(hocr_filename, seconds) for hocr_filename in hocr_filenames]
+
+def read_pnm(f):
+    """
+        Read the next image off a stream of binary PNM images, as ghostscript's pnm
+        devices write them one after the other
+
+        :returns: The image, or '' at the end of the stream
+    """
+    magic = f.read(2)
+    if not magic:
+        return ''
+    if magic not in ('P4', 'P5', 'P6'):
+        raise ValueError("Not a binary PNM image")
+    header, fields, field = magic, [], ''
+    # Width, height, and the largest value (except for bitmaps)
+    while len(fields) < (2 if magic == 'P4' else 3):
+        c = f.read(1)
+        if not c:
+            raise ValueError("PNM header cut short")
+        header += c
+        if c == '#':
+            header += f.readline()
+        elif c.isspace():
+            if field:
+                fields.append(int(field))
+                field = ''
+        else:
+            field += c
+    width, height = fields[:2]
+    if magic == 'P4':
+        size = (width+7)//8*height
+    else:
+        size = width*height*(3 if magic == 'P6' else 1)*(2 if fields[2] > 255 else 1)
+    data = f.read(size)
+    if len(data) < size:
+        raise ValueError("PNM image cut short")
+    return header + data
 
 class PyTesseract(object):
     """Class to wrap all the tesseract calls"""
@@ -46,7 +102,24 @@ class PyTesseract(object):
         """
         self.lang = 'eng'
         self.required = "3.02.02"
+        self.version = None  # Set once the installed version has been checked
         self.threads = config.get('threads',4)
+        # Pages OCR'ed by each tesseract run, so the language data is loaded once per
+        # batch instead of once per page
+        self.batch_size = max(1, config.get('batch_size', 1))
+        self.options = "-psm 1 -c hocr_font_info=1"
+        # 'hocr', 'tsv' (tesseract 3.05 and newer), which is quicker to read but has
+        # no baselines or fonts, or 'pdf', a text-only pdf of each page (tesseract
+        # 3.05.01 and newer) that is the text layer as it is
+        self.output = config.get('output', 'hocr')
+        # Optional :class:`pypdfocr.pypdfocr_blank.PyBlankDetector`, so blank pages skip OCR
+        self.blank = None
+
+        # Optional cache of OCR results, so pages that were already OCR'ed are not done again
+        if config.get('cache_dir'):
+            self.cache = PyOcrCache(config['cache_dir'], config.get('cache_size', 500)*1024*1024)
+        else:
+            self.cache = None
 
         if "binary" in config:  # Override location of binary
             binary = config['binary']
@@ -71,6 +144,11 @@ class PyTesseract(object):
             'TS_VERSION':'Tesseract version is too old',
             'TS_img_MISSING':'Cannot find specified tiff file',
             'TS_FAILED': 'Tesseract-OCR execution failed!',
+            'TS_PIPE_FAILED': 'Could not make the image to pipe into Tesseract',
+            'TS_NO_PIPE': 'Tesseract-OCR is too old to read images from a pipe (3.03 needed)',
+            'TS_BATCH_FAILED': 'Tesseract-OCR batch failed, OCR\'ing its pages one at a time',
+            'TS_NO_TSV': 'Tesseract-OCR is too old to write TSV (3.05 needed), using hocr',
+            'TS_NO_PDF': 'Tesseract-OCR is too old to write text-only pdfs (3.05.01 needed), using hocr',
         }
 
 
@@ -128,57 +206,385 @@ class PyTesseract(object):
         print("WARNING: %s" % msg)
 
 
-    def make_hocr_from_pnms(self, fns):
-        uptodate,ver =  self._is_version_uptodate()
-        if not uptodate:
-            error(self.msgs['TS_VERSION']+ " (found %s, required %s)" % (ver, self.required))
+    def _check_version(self):
+        """
+            Make sure tesseract is new enough, probing the binary only the first time
+        """
+        if not self.version:
+            uptodate,ver =  self._is_version_uptodate()
+            if not uptodate:
+                error(self.msgs['TS_VERSION']+ " (found %s, required %s)" % (ver, self.required))
+            self.version = ver
+
+    def can_pipe(self):
+        """
+            Whether images can be piped into tesseract (see :func:`make_hocr_from_pipe`),
+            checking the installed version first if need be
+        """
+        self._check_version()
+        return self._can_pipe()
+
+    def _can_pipe(self):
+        """
+            Whether tesseract can read the image from stdin and write to stdout (3.03 and newer)
+        """
+        return [int(x) for x in self.version.split('.')[:2]] >= [3, 3]
+
+    def _can_batch(self):
+        """
+            Whether tesseract can take a text file listing the images (3.04 and newer)
+        """
+        return [int(x) for x in self.version.split('.')[:2]] >= [3, 4]
+
+    def _can_tsv(self):
+        """
+            Whether tesseract can write TSV (3.05 and newer)
+        """
+        return [int(x) for x in self.version.split('.')[:2]] >= [3, 5]
+
+    def _can_textonly_pdf(self):
+        """
+            Whether tesseract can leave the image out of the pdfs it writes (3.05.01 and newer)
+        """
+        return [int(x) for x in self.version.split('.')[:3]] >= [3, 5, 1]
+
+    def _get_options(self):
+        """
+            :returns: The options to run tesseract with, including any the output needs
+        """
+        if self.output == 'pdf':
+            return "%s -c textonly_pdf=1" % self.options
+        return self.options
+
+    def _get_cache_options(self):
+        """
+            :returns: The options that make a difference to the output, for the cache key
+        """
+        if self.output == 'hocr':
+            return self.options
+        return "%s %s" % (self._get_options(), self.output)
+
+    def make_hocr_from_pnms(self, fns, pool=None, timer=None, callback=None):
+        """
+            Run tesseract on each image in parallel.  Images are handed out to the
+            tesseract processes in batches of `batch_size`.
+
+            :param fns: Image filenames (can be a generator that is still producing them).
+                        Pages that are piped into tesseract instead come in chunks, as
+                        (image names, command, image data, dpi), see
+                        :func:`make_hocr_from_pipe`.
+            :param pool: Optional :class:`pypdfocr.pypdfocr_pool.PyPool` to run on; otherwise
+                         a pool is created just for this call
+            :param timer: Optional :class:`pypdfocr.pypdfocr_timing.PyTimer` to record the ocr time of each page
+            :param callback: Optional function called with (image filename, hocr filename) as
+                             each page finishes, in page order
+            :returns: list of (image filename, hocr filename) pairs, with no hocr filename (None)
+                      for blank pages.  With the tsv or pdf output, the hocr filenames are
+                      TSV files or text-only pdfs instead.
+        """
+        timer = timer or PyTimer()
+        # Only probe the binary once, not for every document
+        self._check_version()
+        if self.output == 'tsv' and not self._can_tsv():
+            self._warn(self.msgs['TS_NO_TSV'])
+            self.output = 'hocr'
+        if self.output == 'pdf' and not self._can_textonly_pdf():
+            self._warn(self.msgs['TS_NO_PDF'])
+            self.output = 'hocr'
 
-        # Glob it
-        #fns = glob.glob(img_filename)
-        logging.debug("Making pool for tesseract")
-        pool = Pool(processes=self.threads, initializer=init_worker)
+        own_pool = pool is None
+        if own_pool:
+            logging.debug("Making pool for tesseract")
+            pool = PyPool(self.threads)
+
+        img_filenames = []
+        hocr_filenames = []
+        def collect(results, wait):
+            # Pick up finished pages in order, so the callback sees them as soon as possible
+            while results and (wait or results[0].ready()):
+                for hocr_filename, seconds in results.pop(0).get():
+                    fn = img_filenames[len(hocr_filenames)]
+                    timer.add('ocr', seconds, page=fn)
+                    hocr_filenames.append(hocr_filename)
+                    if callback:
+                        callback(fn, hocr_filename)
 
         try:
-            hocr_filenames = pool.map(unwrap_self, zip([self]*len(fns), fns))
-            pool.close()
-        except KeyboardInterrupt or Exception:
-            print("Caught keyboard interrupt... terminating")
-            pool.terminate()
-            raise
+            with pool.lease() as workers:
+                # Submit each image as it comes in, so fns can be a generator that is still
+                # producing images (e.g. ghostscript rendering in the background)
+                results = []
+                batch_size = self.batch_size if self._can_batch() else 1
+                batch = []
+                for fn in fns:
+                    if isinstance(fn, tuple):
+                        if not self._can_pipe():
+                            error(self.msgs['TS_NO_PIPE'])
+                        if batch:
+                            # Results have to come back in page order
+                            results.append(workers.submit(unwrap_self_batch, ((self, batch),)))
+                            batch = []
+                        img_filenames.extend(fn[0])
+                        results.append(workers.submit(unwrap_self_pipe, ((self,) + fn,)))
+                    else:
+                        img_filenames.append(fn)
+                        batch.append(fn)
+                        if len(batch) >= batch_size:
+                            results.append(workers.submit(unwrap_self_batch, ((self, batch),)))
+                            batch = []
+                    collect(results, False)
+                if batch:
+                    results.append(workers.submit(unwrap_self_batch, ((self, batch),)))
+                collect(results, True)
         finally:
-            pool.join()
+            if own_pool:
+                pool.close()
 
-        return zip(fns,hocr_filenames)
+        if self.cache:
+            self.cache.evict()
+        return zip(img_filenames,hocr_filenames)
 
 
     def make_hocr_from_pnm(self, img_filename):
+        """
+            :returns: The hocr filename, or None if the image is a blank page
+        """
+        return self.make_hocr_from_pnm_batch([img_filename])[0]
 
-        basename,filext = os.path.splitext(img_filename)
-        hocr_filename = "%s.html" % basename
+    def make_hocr_from_pnm_batch(self, img_filenames):
+        """
+            OCR several images with a single tesseract run, which reads them from a list
+            file.  The multi-page hocr it makes is split back into one hocr file per image.
+            Blank pages and pages in the cache are left out of the run.
 
-        if not os.path.exists(img_filename):
-            error(self.msgs['TS_img_MISSING'] + " %s" % (img_filename))
+            :returns: list of hocr filenames, with None for blank pages
+        """
+        hocr_filenames = [None]*len(img_filenames)
+        todo = []
+        for i, img_filename in enumerate(img_filenames):
+            basename,filext = os.path.splitext(img_filename)
+            if not os.path.exists(img_filename):
+                error(self.msgs['TS_img_MISSING'] + " %s" % (img_filename))
 
-        logging.info("Running OCR on %s to create %s.html" % (img_filename, basename))
-        cmd = '%s "%s" "%s" -psm 1 -c hocr_font_info=1 -l %s hocr' % (self.binary, img_filename, basename, self.lang)
+            if self.blank and self.blank.is_blank(img_filename):
+                continue
+
+            cache_key = None
+            if self.cache:
+                cache_key = self.cache.get_key(img_filename, self.lang, self.version, self._get_cache_options())
+                if self.cache.fetch(cache_key, "%s.%s" % (basename, self.output)):
+                    hocr_filenames[i] = "%s.%s" % (basename, self.output)
+                    continue
+            todo.append((i, img_filename, cache_key))
+
+        if len(todo) == 1:
+            i, img_filename, cache_key = todo[0]
+            hocr_filenames[i] = self._make_hocr(img_filename, cache_key)
+        elif todo:
+            batch_hocr_filenames = self._make_batch_hocr([(fn, key) for i, fn, key in todo])
+            for (i, img_filename, cache_key), hocr_filename in zip(todo, batch_hocr_filenames):
+                hocr_filenames[i] = hocr_filename
+        return hocr_filenames
+
+    def _make_batch_hocr(self, pages):
+        """
+            :param pages: list of (image filename, cache key)
+            :returns: list of hocr filenames
+        """
+        basename = "%s_batch" % os.path.splitext(pages[0][0])[0]
+        list_filename = "%s.txt" % basename
+        with open(list_filename, 'w') as f:
+            f.write(''.join("%s\n" % img_filename for img_filename, cache_key in pages))
+
+        logging.info("Running OCR on %d images listed in %s" % (len(pages), list_filename))
+        cmd = '%s "%s" "%s" %s -l %s %s' % (self.binary, list_filename, basename, self._get_options(), self.lang, self.output)
+        logging.info(cmd)
+        page_hocrs = []
+        output_filename = "%s.%s" % (basename, self.output)
+        try:
+            subprocess.check_output(cmd, shell=True, stderr=subprocess.STDOUT)
+            with open(output_filename, 'rb') as f:
+                if self.output == 'tsv':
+                    page_hocrs = self._split_tsv(f.read())
+                elif self.output == 'pdf':
+                    page_hocrs = self._split_pdf(f.read())
+                else:
+                    page_hocrs = self._split_hocr(f.read())
+        except (subprocess.CalledProcessError, IOError, PdfReadError) as e:
+            logging.info(e)
+        finally:
+            for fn in [list_filename, output_filename]:
+                if os.path.exists(fn):
+                    os.remove(fn)
+
+        if len(page_hocrs) != len(pages):
+            # Find out which page is the trouble
+            self._warn(self.msgs['TS_BATCH_FAILED'])
+            return [self._make_hocr(img_filename, cache_key) for img_filename, cache_key in pages]
+
+        hocr_filenames = []
+        for (img_filename, cache_key), page_hocr in zip(pages, page_hocrs):
+            hocr_filename = "%s.%s" % (os.path.splitext(img_filename)[0], self.output)
+            with open(hocr_filename, 'wb') as f:
+                f.write(page_hocr)
+            logging.info("Created %s" % hocr_filename)
+            if self.cache:
+                self.cache.store(cache_key, hocr_filename)
+            hocr_filenames.append(hocr_filename)
+        return hocr_filenames
+
+    def _split_hocr(self, hocr):
+        """
+            Split a multi-page hocr into a hocr document for each page, each with the
+            head of the original
+        """
+        starts = [m.start() for m in regex_hocr_page.finditer(hocr)]
+        end = hocr.rfind('</body>')
+        if not starts or end < starts[-1]:
+            return []
+        head, tail = hocr[:starts[0]], hocr[end:]
+        return [head + hocr[start:stop] + tail for start, stop in zip(starts, starts[1:] + [end])]
+
+    def _split_tsv(self, tsv):
+        """
+            Split a multi-page TSV into a TSV for each page, each with the header and
+            numbered as page 1
+        """
+        rows = tsv.splitlines(True)
+        if not rows or not rows[0].startswith('level'):
+            return []
+        pages = []
+        for row in rows[1:]:
+            cols = row.split('\t')
+            if len(cols) < 11:
+                continue
+            if cols[0] == '1':
+                pages.append([rows[0]])
+            elif not pages:
+                return []
+            cols[1] = '1'
+            pages[-1].append('\t'.join(cols))
+        return [''.join(page) for page in pages]
+
+    def _split_pdf(self, pdf):
+        """
+            Split a multi-page pdf into a pdf for each page
+        """
+        reader = PdfFileReader(cStringIO.StringIO(pdf), strict=False)
+        pages = []
+        for pgnum in range(reader.getNumPages()):
+            writer = PdfFileWriter()
+            writer.addPage(reader.getPage(pgnum))
+            out = cStringIO.StringIO()
+            writer.write(out)
+            pages.append(out.getvalue())
+        return pages
+
+    def _make_hocr(self, img_filename, cache_key):
+        """
+            Run tesseract on one image
+
+            :returns: The hocr filename
+        """
+        basename,filext = os.path.splitext(img_filename)
+        hocr_filename = "%s.%s" % (basename, 'html' if self.output == 'hocr' else self.output)
+
+        logging.info("Running OCR on %s to create %s" % (img_filename, hocr_filename))
+        cmd = '%s "%s" "%s" %s -l %s %s' % (self.binary, img_filename, basename, self._get_options(), self.lang, self.output)
         logging.info(cmd)
+        succeeded = True
         try:
             ret_output = subprocess.check_output(cmd, shell=True,  stderr=subprocess.STDOUT)
         except subprocess.CalledProcessError as e:
             # Could not run tesseract
             print e.output
             self._warn (self.msgs['TS_FAILED'])
+            succeeded = False
                 
-        if os.path.isfile(hocr_filename):
+        if not os.path.isfile(hocr_filename) and self.output == 'hocr':
             # Output format is html for old versions of tesseract
-            logging.info("Created %s.html" % basename)
-            return hocr_filename
-        else:
             # Try changing extension to .hocr for tesseract 3.03 and higher
             hocr_filename = "%s.hocr" % basename
-            if os.path.isfile(hocr_filename):
-                logging.info("Created %s.hocr" % basename)
-                return hocr_filename
-            else:
-                error(self.msgs['TS_FAILED'])
+        if not os.path.isfile(hocr_filename):
+            error(self.msgs['TS_FAILED'])
+        logging.info("Created %s" % hocr_filename)
+
+        if self.cache and succeeded:
+            self.cache.store(cache_key, hocr_filename)
+        return hocr_filename
             
+
+    def make_hocr_from_pipe(self, img_names, cmd, data, dpi=None):
+        """
+            Same as :func:`make_hocr_from_pnm_batch`, for images that never go to disk.
+            The images are whatever cmd writes to stdout (e.g. ghostscript rendering a
+            chunk of pages as PNM images, one after the other), or data if there is no
+            command.  Each one goes into tesseract on stdin as soon as it has been read,
+            and the hocr comes back on stdout.  Only the hocr gets written out, next to
+            where the image would have been.  Every image gets its own tesseract run,
+            whatever the batch_size.
+
+            :param img_names: Filenames the images would have had, one for each image
+                              cmd writes (only one with data)
+            :param dpi: Resolution of the images, for formats that don't record it
+            :returns: list of the hocr filenames, with None for blank pages
+        """
+        if not cmd:
+            return [self._make_hocr_from_data(img_names[0], data, dpi)]
+
+        logging.info(cmd)
+        err = tempfile.TemporaryFile()
+        proc = subprocess.Popen(cmd, shell=True, stdout=subprocess.PIPE, stderr=err)
+        hocr_filenames = []
+        try:
+            for img_name in img_names:
+                data = read_pnm(proc.stdout)
+                if not data:
+                    break
+                hocr_filenames.append(self._make_hocr_from_data(img_name, data, dpi))
+        except ValueError as e:
+            logging.info("Could not read the images from %s: %s" % (cmd, e))
+        finally:
+            proc.stdout.close()
+            proc.wait()
+        if proc.returncode != 0 or len(hocr_filenames) < len(img_names):
+            err.seek(0)
+            print err.read()
+            error(self.msgs['TS_PIPE_FAILED'] + " %s" % ', '.join(img_names[len(hocr_filenames):] or img_names))
+        return hocr_filenames
+
+    def _make_hocr_from_data(self, img_name, data, dpi=None):
+        """
+            Run tesseract on one image piped in from memory
+
+            :returns: The hocr filename, or None if the image is a blank page
+        """
+        basename,filext = os.path.splitext(img_name)
+        hocr_filename = "%s.%s" % (basename, self.output)
+
+        if self.blank and self.blank.is_blank(cStringIO.StringIO(data), img_name):
+            return None
+
+        if self.cache:
+            cache_key = self.cache.get_data_key(data, self.lang, self.version, self._get_cache_options())
+            if self.cache.fetch(cache_key, hocr_filename):
+                return hocr_filename
+
+        options = self._get_options()
+        if dpi:
+            options += " -c user_defined_dpi=%d" % dpi
+        logging.info("Running OCR on %s to create %s" % (img_name, hocr_filename))
+        cmd = '%s stdin stdout %s -l %s %s' % (self.binary, options, self.lang, self.output)
+        logging.info(cmd)
+        proc = subprocess.Popen(cmd, shell=True, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        hocr, err = proc.communicate(data)
+        if proc.returncode != 0 or not hocr.strip():
+            print err
+            error(self.msgs['TS_FAILED'])
+        with open(hocr_filename, 'wb') as f:
+            f.write(hocr)
+        logging.info("Created %s" % hocr_filename)
+
+        if self.cache:
+            self.cache.store(cache_key, hocr_filename)
+        return hocr_filename
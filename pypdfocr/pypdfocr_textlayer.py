@@ -0,0 +1,272 @@
+# Copyright 2013 Virantha Ekanayake All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+    Write the invisible text layer of OCR'ed pages as pdf text operators, without
+    going through reportlab's layout engine
+"""
+
+import zlib
+import hashlib
+import cStringIO
+
+from PyPDF2 import PdfFileReader
+from PyPDF2.generic import ArrayObject, DictionaryObject, IndirectObject, StreamObject
+from reportlab.pdfbase.pdfmetrics import stringWidth
+
+
+def get_text_pdf_page(pdf_filename):
+    """
+        :returns: The first page of a text pdf (e.g. from reportlab or tesseract), as a
+                  PyPDF2 page object.  The file is read in whole, so it isn't left open.
+    """
+    with open(pdf_filename, 'rb') as f:
+        return PdfFileReader(cStringIO.StringIO(f.read()), strict=False).getPage(0)
+
+
+class PyTextLayer(object):
+    """
+        Turns the OCR'ed words of a page into a content stream that draws each one as
+        invisible text (render mode 3) over its spot on the page image.  Each word gets
+        its own text matrix, placing it on the line's baseline and turning it with the
+        line, and is stretched (Tz) to the width of its bounding box, so selecting text
+        in a viewer highlights the words on the scan.
+    """
+
+    FONT = 'Helvetica'
+    # Resource name of the font, unlikely to be in use on any page the text goes onto
+    FONT_RESOURCE = '/FPyPDFOCR'
+    # (cos, sin) of the text angles hocr can have; anything else is drawn upright
+    ROTATIONS = {0: (1, 0), 90: (0, 1), 180: (-1, 0), 270: (0, -1)}
+
+    def get_content(self, page, height, dpi):
+        """
+            :param page: :class:`pypdfocr.pypdfocr_ocrpage.PyOcrPage` with the words
+            :param height: Page height in points
+            :param dpi: Resolution of the page image the words were read from
+            :returns: The (uncompressed) content stream, using the font as
+                      :attr:`FONT_RESOURCE`
+        """
+        scale = 72.0/dpi
+        out = ['BT', '3 Tr', '0 TL']
+        font_size, h_scale = None, None
+        for line, word in page.iter_words():
+            box, angle, size = word.bbox, line.angle, word.font_size
+            x0, y0, x1, y1 = [v*scale for v in box]
+            if angle in (90, 270):
+                extent, across = y1-y0, x1-x0
+            else:
+                extent, across = x1-x0, y1-y0
+            if size is None:
+                size = line.x_size*scale if line.x_size else across
+            size = max(size, 1.0)
+
+            if angle == 90:
+                x, y = x1, height-y1
+            elif angle == 180:
+                x, y = x1, height-y0
+            elif angle == 270:
+                x, y = x0, height-y0
+            else:
+                angle = 0
+                baseline = line.get_baseline(word.bbox[0])
+                x, y = x0, height-(baseline*scale if baseline is not None else y1)
+
+            text = word.text.encode('cp1252', 'replace')
+            width = stringWidth(text, self.FONT, size, 'cp1252')
+            stretch = 100.0*extent/width if width > 0 else 100.0
+
+            if size != font_size:
+                out.append('%s %s Tf' % (self.FONT_RESOURCE, self._num(size)))
+                font_size = size
+            if self._num(stretch) != h_scale:
+                h_scale = self._num(stretch)
+                out.append('%s Tz' % h_scale)
+            cos, sin = self.ROTATIONS[angle]
+            out.append('%s %s %s %s %s %s Tm' % tuple(self._num(v) for v in (cos, sin, -sin, cos, x, y)))
+            # T* after each word keeps the words apart when the text is extracted
+            out.append('(%s) Tj T*' % self._escape(text))
+        out.append('ET')
+        return '\n'.join(out) + '\n'
+
+    def get_font(self):
+        """
+            :returns: The font dictionary for the content streams
+        """
+        return '<< /Type /Font /Subtype /Type1 /BaseFont /%s /Encoding /WinAnsiEncoding >>' % self.FONT
+
+    def write_pdf(self, f, pages, title=None):
+        """
+            Write a pdf with nothing but the given content streams, each on a page of
+            its own.  The pages are written out as they come, so pages can be a
+            generator.
+
+            :param f: File object to write to
+            :param pages: iterable of (width, height, content stream) for each page, or
+                          the filename of a text pdf whose first page is copied over
+            :param title: Optional document title
+        """
+        writer = PyObjectWriter(f)
+        writer.write('%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+        catalog, tree = writer.reserve(), writer.reserve()
+        writer.add('<< /Type /Catalog /Pages %d 0 R >>' % tree, catalog)
+        font = None
+        info = writer.add('<< /Creator (pypdfocr) /Producer (pypdfocr)%s >>'
+                          % (' /Title (%s)' % self._escape(title) if title else ''))
+        kids = []
+        for text_layer in pages:
+            page = writer.reserve()
+            if isinstance(text_layer, tuple):
+                width, height, content = text_layer
+                font = font or writer.add(self.get_font())
+                contents = writer.add_stream(content)
+                writer.add('<< /Type /Page /Parent %d 0 R /MediaBox [0 0 %s %s] '
+                           '/Resources << /Font << %s %d 0 R >> /ProcSet [/PDF /Text] >> /Contents %d 0 R >>'
+                           % (tree, self._num(width), self._num(height), self.FONT_RESOURCE, font, contents), page)
+            else:
+                text_page = get_text_pdf_page(text_layer)
+                resources = text_page.get('/Resources', DictionaryObject())
+                writer.add('<< /Type /Page /Parent %d 0 R /MediaBox %s /Resources %s /Contents %s >>'
+                           % (tree, writer.get_syntax(text_page.mediaBox), writer.get_syntax(resources),
+                              writer.get_syntax(text_page.raw_get('/Contents'))), page)
+            kids.append(page)
+        writer.add('<< /Type /Pages /Count %d /Kids [%s] >>' % (len(kids), ' '.join('%d 0 R' % i for i in kids)), tree)
+        writer.finish('/Root %d 0 R /Info %d 0 R' % (catalog, info))
+
+    def _num(self, value):
+        """
+            Format a number for the content stream, without needless digits
+        """
+        text = ('%.2f' % value).rstrip('0').rstrip('.')
+        return '0' if text in ('', '-0') else text
+
+    def _escape(self, text):
+        return text.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)').replace('\r', '\\r').replace('\n', '\\n')
+
+
+class PyObjectWriter(object):
+    """
+        Writes numbered pdf objects one after another, keeping track of where each
+        one starts, and finishes off with the cross-reference table and trailer.  It
+        can also append objects to an existing pdf, as an incremental update.
+    """
+
+    def __init__(self, f, next_id=1, position=0):
+        """
+            :param f: File object to write to
+            :param next_id: Number of the first new object
+            :param position: Offset in the file that f is at
+        """
+        self.f = f
+        self.next_id = next_id
+        self.position = position
+        self.offsets = {}
+        # Object number of each object copied from another pdf, by a digest of its
+        # contents, so the same font from every page's text pdf is written only once
+        self.copies = {}
+
+    def write(self, data):
+        self.f.write(data)
+        self.position += len(data)
+
+    def reserve(self):
+        """
+            :returns: A new object number, for an object that is written later on
+        """
+        self.next_id += 1
+        return self.next_id-1
+
+    def add(self, data, obj_id=None, generation=0):
+        """
+            :param data: The object, in pdf syntax
+            :param obj_id: Object number, if it was reserved or replaces an existing object
+            :returns: The object number
+        """
+        obj_id = obj_id or self.reserve()
+        self.offsets[obj_id] = (self.position, generation)
+        self.write('%d %d obj\n%s\nendobj\n' % (obj_id, generation, data))
+        return obj_id
+
+    def add_stream(self, data, obj_id=None):
+        """
+            Add a stream object, compressed
+        """
+        data = zlib.compress(data)
+        return self.add('<< /Length %d /Filter /FlateDecode >>\nstream\n%s\nendstream' % (len(data), data), obj_id)
+
+    def copy(self, obj):
+        """
+            Copy an object from a pdf read with PyPDF2, along with every object it
+            refers to.  Objects that are the same as one copied before aren't written
+            again.  The objects mustn't refer back to themselves (as a page's /Parent
+            does).
+
+            :param obj: PyPDF2 object, or a reference to one
+            :returns: The object number of the copy
+        """
+        data = self.get_syntax(obj.getObject())
+        digest = hashlib.sha1(data).digest()
+        if digest not in self.copies:
+            self.copies[digest] = self.add(data)
+        return self.copies[digest]
+
+    def get_syntax(self, obj):
+        """
+            :param obj: PyPDF2 object, whose references are copied with :func:`copy`
+            :returns: The object in pdf syntax
+        """
+        if isinstance(obj, IndirectObject):
+            return '%d 0 R' % self.copy(obj)
+        if isinstance(obj, StreamObject):
+            # The stream is copied as it was read, still compressed
+            entries = ''.join(' %s %s' % (self.get_syntax(key), self.get_syntax(value))
+                              for key, value in obj.items() if key != '/Length')
+            return '<<%s /Length %d >>\nstream\n%s\nendstream' % (entries, len(obj._data), obj._data)
+        if isinstance(obj, DictionaryObject):
+            return '<<%s >>' % ''.join(' %s %s' % (self.get_syntax(key), self.get_syntax(value))
+                                       for key, value in obj.items())
+        if isinstance(obj, ArrayObject):
+            return '[%s]' % ' '.join(self.get_syntax(value) for value in obj)
+        out = cStringIO.StringIO()
+        obj.writeToStream(out, None)
+        return out.getvalue()
+
+    def finish(self, trailer, size=None):
+        """
+            Write the cross-reference table and the trailer
+
+            :param trailer: Trailer entries besides /Size, in pdf syntax
+            :param size: Minimum /Size
+        """
+        start = self.position
+        ids = sorted(self.offsets)
+        lines = ['xref\n']
+        # Always starting with the free object 0, which readers expect even in an
+        # incremental update
+        sections = [[0]]
+        for obj_id in ids:
+            if sections and sections[-1][-1] == obj_id-1:
+                sections[-1].append(obj_id)
+            else:
+                sections.append([obj_id])
+        for section in sections:
+            lines.append('%d %d\n' % (section[0], len(section)))
+            for obj_id in section:
+                if obj_id == 0:
+                    lines.append('0000000000 65535 f \n')
+                else:
+                    lines.append('%010d %05d n \n' % self.offsets[obj_id])
+        size = max(size or 0, self.next_id)
+        lines.append('trailer\n<< /Size %d %s >>\nstartxref\n%d\n%%%%EOF\n' % (size, trailer, start))
+        self.write(''.join(lines))
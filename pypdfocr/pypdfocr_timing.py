@@ -0,0 +1,99 @@
+# Copyright 2013 Virantha Ekanayake All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+    Per-stage timing of a document conversion
+"""
+
+import os
+import time
+import json
+from collections import OrderedDict
+from contextlib import contextmanager
+
+
+class PyTimer(object):
+    """
+        Collects how much time each stage of a single document conversion takes
+        (dpi detection, rendering, preprocessing, ocr, overlay, merge, filing, ...).
+        Stages that work page by page also keep the time for each page, keyed by the
+        page's image filename.
+
+        One of these gets passed down the conversion of each document; the tool
+        wrappers accept None when nobody is interested in the timings.
+    """
+
+    def __init__(self, pdf_filename=None):
+        self.pdf_filename = pdf_filename
+        self.start_time = time.time()
+        self.stages = OrderedDict()
+        self.page_times = OrderedDict()
+
+    @contextmanager
+    def stage(self, name):
+        """
+            Context manager that adds the time spent inside it to stage `name`
+        """
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.add(name, time.time()-start)
+
+    def add(self, name, seconds, page=None):
+        """
+            Add seconds to stage `name`, and to `page` within the stage if given.
+            Per-page times are not added to the stage total, since pages usually run in
+            parallel and the stage's wall-clock time is timed separately.
+        """
+        if page is None:
+            self.stages[name] = self.stages.get(name, 0) + seconds
+        else:
+            pages = self.page_times.setdefault(name, OrderedDict())
+            pages[os.path.basename(page)] = pages.get(os.path.basename(page), 0) + seconds
+
+    def get_record(self, **extra):
+        """
+            :returns: dict with the timings, suitable for dumping as JSON
+        """
+        record = OrderedDict()
+        record['file'] = self.pdf_filename
+        record['start'] = self.start_time
+        record['total'] = time.time() - self.start_time
+        record['stages'] = self.stages
+        record['pages'] = self.page_times
+        record.update(extra)
+        return record
+
+    def write_record(self, f, **extra):
+        """
+            Append the timings as one line of JSON to file object f
+        """
+        f.write(json.dumps(self.get_record(**extra)) + '\n')
+        f.flush()
+
+    def get_summary(self):
+        """
+            :returns: Human-readable table of the stage times
+        """
+        lines = ["Timing for %s (%.2fs total)" % (self.pdf_filename, time.time()-self.start_time),
+                 "  %-12s %10s %7s %10s %10s" % ("stage", "seconds", "pages", "avg/page", "max/page")]
+        names = list(self.stages.keys()) + [x for x in self.page_times if x not in self.stages]
+        for name in names:
+            line = "  %-12s %10s" % (name, "%.3f" % self.stages[name] if name in self.stages else "")
+            pages = self.page_times.get(name)
+            if pages:
+                line += " %7d %10.3f %10.3f" % (len(pages), sum(pages.values())/len(pages), max(pages.values()))
+            lines.append(line)
+        return '\n'.join(lines)
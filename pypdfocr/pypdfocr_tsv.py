@@ -0,0 +1,78 @@
+# Copyright 2013 Virantha Ekanayake All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+    Read the lines and words out of tesseract's TSV output
+"""
+
+import logging
+
+from pypdfocr_ocrpage import PyOcrPage, PyOcrLine, PyOcrWord
+
+
+class PyTsvReader(object):
+    """
+        Reads the TSV output of tesseract (3.05 and newer).  It has a row for each
+        page, block, paragraph, line and word, with the level, the position in the
+        layout, the bounding box, the confidence and the text in tab separated columns
+        (see :attr:`COLUMNS`), so there's no markup or attributes to parse.  It doesn't
+        have the baseline, angle or font of the text, so the baseline of each line is
+        taken to be where most of its words end, and the font is sized from the line
+        height.
+    """
+
+    COLUMNS = ('level', 'page_num', 'block_num', 'par_num', 'line_num', 'word_num',
+               'left', 'top', 'width', 'height', 'conf', 'text')
+    PAGE, LINE, WORD = '1', '4', '5'
+
+    def read_page(self, tsv_filename, page_num=1):
+        """
+            :param page_num: Which page of the TSV file to read, starting at 1
+            :returns: :class:`pypdfocr.pypdfocr_ocrpage.PyOcrPage` with the lines of the
+                      page.  A file that can't be read (e.g. tesseract failed and left
+                      garbage) has no lines past where the garbage starts.
+        """
+        page = PyOcrPage([])
+        line = None
+        try:
+            with open(tsv_filename, 'rb') as f:
+                for row in f:
+                    cols = row.rstrip('\r\n').split('\t', 11)
+                    level = cols[0]
+                    if level == 'level':
+                        # The header
+                        continue
+                    if int(cols[1]) != page_num:
+                        continue
+                    left, top, width, height = [int(v) for v in cols[6:10]]
+                    if level == self.WORD:
+                        text = cols[11].strip() if len(cols) > 11 else ''
+                        confidence = float(cols[10])
+                        if line is None or not text or confidence < 0:
+                            continue
+                        line.words.append(PyOcrWord(text.decode('utf-8', 'replace'),
+                                                    (left, top, left+width, top+height), confidence))
+                    elif level == self.LINE:
+                        line = PyOcrLine((left, top, left+width, top+height), [], x_size=height)
+                        page.lines.append(line)
+                    elif level == self.PAGE:
+                        page.width, page.height = width, height
+        except Exception as e:
+            logging.info("Error loading tsv %s (%s), not adding any more text" % (tsv_filename, e))
+
+        for line in page.lines:
+            if line.words:
+                bottoms = sorted(word.bbox[3] for word in line.words)
+                line.baseline = (0.0, bottoms[len(bottoms)//2] - line.bbox[3])
+        return page
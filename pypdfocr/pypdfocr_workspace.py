@@ -0,0 +1,227 @@
+# Copyright 2013 Virantha Ekanayake All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+    Per-document workspace holding the intermediate files of a conversion, so an
+    interrupted conversion can pick up where it left off
+"""
+
+import os
+import stat
+import errno
+import json
+import logging
+import shutil
+import hashlib
+import tempfile
+from collections import OrderedDict
+
+
+class PyWorkspace(object):
+    """
+        Directory for the page images, hocr files and text pdfs of one document,
+        along with a state file recording which pages are finished with each stage:
+
+        - ``render``: for each page image ghostscript has finished, its page number
+        - ``ocr``: for each page image, the (image, hocr) pair tesseract ran on
+        - ``text``: for each OCR'ed image, its text-only pdf
+
+        The state file is rewritten after every page, so a conversion that fails or
+        gets killed partway can be restarted, and only does the pages that were not
+        finished.  The state is thrown away if the pdf or the settings (e.g. language)
+        have changed since.
+
+        All the files are stored in the state by basename, and handed back as full
+        paths.  A state file with anything else in it (e.g. a path leading out of
+        the workspace) is thrown away.
+
+        The directory name is predictable, so it can be resumed from, which in a
+        shared temp directory means someone else could have made it first.  It is
+        only used if it is a real directory, owned by us and private to us;
+        otherwise the conversion gets a fresh directory of its own (and can't be
+        resumed).
+
+        :ivar dir: The workspace directory
+        :ivar state: Dict of everything recorded so far
+    """
+
+    STATE_FILENAME = 'state.json'
+
+    def __init__(self, pdf_filename, root_dir=None):
+        """
+            :param root_dir: Scratch directory to make the workspace in (default is the
+                             system temp directory)
+        """
+        self.pdf_filename = pdf_filename
+        pdf_path = os.path.abspath(pdf_filename)
+        basename = os.path.splitext(os.path.basename(pdf_path))[0]
+        # Named after the full path, so files with the same name in different folders
+        # don't collide, and a rerun on the same file finds its workspace again
+        digest = hashlib.sha1(pdf_path.encode('utf-8') if isinstance(pdf_path, unicode) else pdf_path).hexdigest()
+        self.dir = os.path.join(root_dir or tempfile.gettempdir(), "pypdfocr_%s_%s" % (basename, digest[:12]))
+        self.state = None
+
+    def _new_state(self, signature, settings):
+        return OrderedDict([('signature', signature), ('settings', settings),
+                            ('render', OrderedDict()), ('ocr', OrderedDict()), ('text', OrderedDict())])
+
+    def open(self, **settings):
+        """
+            Create the workspace, or pick up the state of an earlier attempt if the pdf
+            and settings are unchanged.
+
+            :param settings: Anything that makes the intermediate files invalid when it changes
+            :returns: True if an earlier attempt is being resumed
+        """
+        st = os.stat(self.pdf_filename)
+        signature = [st.st_size, int(st.st_mtime)]
+        settings = json.loads(json.dumps(settings))  # So they compare equal to what gets read back
+
+        self._make_dir()
+        state_filename = self.path(self.STATE_FILENAME)
+        if os.path.exists(state_filename):
+            try:
+                with open(state_filename) as f:
+                    state = json.load(f, object_pairs_hook=OrderedDict)
+                self._check_state(state)
+                if state['signature'] == signature and state['settings'] == settings:
+                    self.state = state
+                    logging.info("Resuming from workspace %s" % self.dir)
+                    return True
+            except (ValueError, KeyError, TypeError, AttributeError):
+                logging.info("Ignoring unreadable state file %s" % state_filename)
+            logging.info("Discarding out-of-date workspace %s" % self.dir)
+            shutil.rmtree(self.dir)
+            self._make_dir()
+
+        self.state = self._new_state(signature, settings)
+        self.save()
+        return False
+
+    def _make_dir(self):
+        """
+            Create the workspace directory, only readable by us since it may be in a
+            shared temp directory.  If it is already there but isn't safe to use,
+            switch to a fresh directory instead.
+        """
+        root_dir = os.path.dirname(self.dir)
+        if not os.path.isdir(root_dir):
+            os.makedirs(root_dir)
+        try:
+            os.mkdir(self.dir, 0o700)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+        if not self._is_private(self.dir):
+            logging.warning("%s is not a private directory of ours, not resuming from it" % self.dir)
+            self.dir = tempfile.mkdtemp(prefix=os.path.basename(self.dir) + '_', dir=root_dir)
+
+    def _is_private(self, dirname):
+        """
+            :returns: True if dirname is a directory (not a symlink to one) that only
+                      we can get into
+        """
+        st = os.lstat(dirname)
+        if not stat.S_ISDIR(st.st_mode) or st.st_mode & 0o077:
+            return False
+        # No owners to check on Windows
+        return not hasattr(os, 'getuid') or st.st_uid == os.getuid()
+
+    def _check_state(self, state):
+        """
+            Raise ValueError unless every file in the pages of state is a plain
+            basename, so nothing read back from it points outside the workspace
+        """
+        def check(value):
+            if isinstance(value, list):
+                for x in value:
+                    check(x)
+            elif isinstance(value, basestring) and (os.path.basename(value) != value or value in ('', '.', '..')):
+                raise ValueError("%s is not a file in the workspace" % value)
+        for stage in ['render', 'ocr', 'text']:
+            for page, value in state[stage].items():
+                check(page)
+                check(value)
+
+    def save(self):
+        """
+            Write out the state file.  It goes to a temporary file first, so a crash
+            while writing leaves the previous state intact.
+        """
+        state_filename = self.path(self.STATE_FILENAME)
+        tmp_filename = state_filename + '.tmp'
+        with open(tmp_filename, 'w') as f:
+            json.dump(self.state, f)
+            f.flush()
+            os.fsync(f.fileno())
+        if os.name == 'nt' and os.path.exists(state_filename):
+            os.remove(state_filename)
+        os.rename(tmp_filename, state_filename)
+
+    def path(self, basename):
+        return os.path.join(self.dir, basename)
+
+    def _to_state(self, value):
+        if isinstance(value, (list, tuple)):
+            return [self._to_state(x) for x in value]
+        if isinstance(value, basestring):
+            return os.path.basename(value)
+        return value
+
+    def _from_state(self, value):
+        if isinstance(value, list):
+            return tuple(self._from_state(x) for x in value)
+        if isinstance(value, basestring):
+            return self.path(value)
+        return value
+
+    def get(self, key, default=None):
+        return self.state.get(key, default)
+
+    def set(self, key, value):
+        self.state[key] = value
+        self.save()
+
+    def get_pages(self, stage):
+        """
+            :returns: OrderedDict of page filename to whatever was recorded for it in stage
+        """
+        return OrderedDict((self.path(page), self._from_state(value))
+                           for page, value in self.state[stage].items())
+
+    def get_page(self, stage, page, default=None):
+        """
+            :returns: Whatever was recorded for page in stage, or default if it isn't there
+        """
+        basename = os.path.basename(page)
+        if basename not in self.state[stage]:
+            return default
+        return self._from_state(self.state[stage][basename])
+
+    def add_page(self, stage, page, value=None):
+        """
+            Record that page is done with stage, and checkpoint the state
+        """
+        self.state[stage][os.path.basename(page)] = self._to_state(value)
+        self.save()
+
+    def remove(self):
+        """
+            Delete the workspace and everything in it.  Anything that can't be deleted
+            is reported and left behind, rather than failing the conversion.
+        """
+        def warn(function, path, excinfo):
+            logging.warning("Could not remove %s: %s" % (path, excinfo[1]))
+        if os.path.exists(self.dir):
+            shutil.rmtree(self.dir, onerror=warn)
@@ -0,0 +1,60 @@
+import pypdfocr.pypdfocr_batch as P
+import pytest
+import os
+
+
+class TestBatch:
+
+    def _make_tree(self, tmpdir):
+        for fn in ['a.pdf', 'a_ocr.pdf', 'notes.txt', os.path.join('sub', 'b.pdf'), os.path.join('sub', 'c.PDF')]:
+            tmpdir.join(fn).ensure()
+        return tmpdir
+
+    def test_expand(self, tmpdir):
+        d = self._make_tree(tmpdir)
+        p = P.PyPdfBatch([str(d)], str(d.join('manifest.jsonl')))
+        found = [os.path.relpath(x, str(d)) for x in p.start()]
+        assert found == ['a.pdf', os.path.join('sub','b.pdf'), os.path.join('sub','c.PDF')]
+
+    def test_glob_and_list(self, tmpdir):
+        d = self._make_tree(tmpdir)
+        d.join('list.txt').write("# Comment\n%s\n\n%s\n" % (d.join('sub','b.pdf'), d.join('a.pdf')))
+        p = P.PyPdfBatch([str(d.join('*.pdf')), '@'+str(d.join('list.txt'))], str(d.join('manifest.jsonl')))
+        found = [os.path.relpath(x, str(d)) for x in p.start()]
+        # a.pdf only shows up once
+        assert found == ['a.pdf', os.path.join('sub','b.pdf')]
+
+    def test_resume(self, tmpdir):
+        d = self._make_tree(tmpdir)
+        manifest = str(d.join('manifest.jsonl'))
+        p = P.PyPdfBatch([str(d)], manifest)
+        todo = list(p.start())
+        p.mark_done(todo[0], 'a_ocr.pdf')
+        p.mark_failed(todo[1], 'Broken')
+        # Simulate a crash halfway through writing a record
+        with open(manifest, 'a') as f:
+            f.write('{"file": "')
+
+        p = P.PyPdfBatch([str(d)], manifest)
+        assert list(p.start()) == todo[1:]
+        assert p.skipped == 1
+
+        # A changed file gets converted again
+        d.join('a.pdf').write('changed')
+        p = P.PyPdfBatch([str(d)], manifest)
+        assert list(p.start()) == todo
+
+    def test_incomplete_records(self, tmpdir):
+        d = self._make_tree(tmpdir)
+        manifest = str(d.join('manifest.jsonl'))
+        p = P.PyPdfBatch([str(d)], manifest)
+        todo = list(p.start())
+        p.mark_done(todo[0], 'a_ocr.pdf')
+        # Valid json, but not records this version wrote
+        with open(manifest, 'a') as f:
+            f.write('[]\n{}\n{"status": "done"}\n{"file": "%s"}\n' % todo[1])
+            f.write('{"file": "%s", "status": "done"}\n' % todo[2])
+
+        p = P.PyPdfBatch([str(d)], manifest)
+        assert list(p.start()) == todo[1:]
+        assert p.skipped == 1
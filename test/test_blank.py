@@ -0,0 +1,55 @@
+import pypdfocr.pypdfocr_blank as P
+import pypdfocr.pypdfocr_tesseract as T
+
+from mock import patch
+from PIL import Image, ImageDraw
+
+
+class TestBlank:
+
+    def _make_img(self, tmpdir, name, boxes=[]):
+        img = Image.new('L', (1000, 1400), 250)
+        draw = ImageDraw.Draw(img)
+        for box in boxes:
+            draw.rectangle(box, fill=0)
+        filename = str(tmpdir.join(name))
+        img.save(filename)
+        return filename
+
+    def test_blank(self, tmpdir):
+        b = P.PyBlankDetector({})
+        assert b.is_blank(self._make_img(tmpdir, 'empty.jpg'))
+        # Dark scanner border and a speck of dust
+        assert b.is_blank(self._make_img(tmpdir, 'border.jpg', [(0, 0, 20, 1399), (500, 700, 502, 702)]))
+        # A line of text
+        assert not b.is_blank(self._make_img(tmpdir, 'text.jpg', [(100, 100, 400, 120)]))
+
+    def test_short_text(self, tmpdir):
+        """
+            A page with one short line of 10pt text at 300dpi isn't blank
+        """
+        for text in ['See attached.', 'Void']:
+            line = Image.new('L', (200, 14), 255)
+            ImageDraw.Draw(line).text((0, 0), text, fill=0)
+            width = ImageDraw.Draw(line).textsize(text)[0]
+            img = Image.new('L', (2550, 3300), 250)
+            img.paste(line.crop((0, 0, width, 14)).resize((width*3, 42)), (300, 400))
+            filename = str(tmpdir.join('short.jpg'))
+            img.save(filename)
+            assert not P.PyBlankDetector({}).is_blank(filename)
+
+    def test_off_by_default(self):
+        assert not P.PyBlankDetector({}).enabled
+        assert P.PyBlankDetector({'enabled': True}).enabled
+
+    def test_ink_threshold(self, tmpdir):
+        img = self._make_img(tmpdir, 'text.png', [(100, 100, 400, 120)])
+        assert not P.PyBlankDetector({}).is_blank(img)
+        assert P.PyBlankDetector({'ink_threshold': 0.01}).is_blank(img)
+
+    @patch('pypdfocr.pypdfocr_tesseract.subprocess.check_output')
+    def test_tesseract_skips_blank(self, mock_subprocess, tmpdir):
+        p = T.PyTesseract({})
+        p.blank = P.PyBlankDetector({})
+        assert p.make_hocr_from_pnm(self._make_img(tmpdir, 'scan_2.jpg')) is None
+        assert not mock_subprocess.called
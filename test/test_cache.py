@@ -0,0 +1,122 @@
+import pypdfocr.pypdfocr_cache as P
+import pypdfocr.pypdfocr_tesseract as T
+import os
+
+from mock import patch, MagicMock
+
+
+class TestCache:
+
+    def _write(self, filename, contents):
+        filename = str(filename)
+        with open(filename, 'wb') as f:
+            f.write(contents)
+        return filename
+
+    def test_store_fetch(self, tmpdir):
+        c = P.PyOcrCache(str(tmpdir.join('cache')))
+        img = self._write(tmpdir.join('page_1.jpg'), 'image data')
+        hocr = self._write(tmpdir.join('page_1.hocr'), '<html>text</html>')
+
+        key = c.get_key(img, 'eng', '3.04.01', '-psm 1')
+        assert not c.fetch(key, str(tmpdir.join('out.hocr')))
+        c.store(key, hocr)
+        assert c.fetch(key, str(tmpdir.join('out.hocr')))
+        assert tmpdir.join('out.hocr').read() == '<html>text</html>'
+
+        # Same image contents under another name is a hit, other settings are not
+        img2 = self._write(tmpdir.join('cover.jpg'), 'image data')
+        assert c.get_key(img2, 'eng', '3.04.01', '-psm 1') == key
+        assert c.get_key(img, 'spa', '3.04.01', '-psm 1') != key
+        assert c.get_key(img, 'eng', '3.05.00', '-psm 1') != key
+
+    def test_evict_lru(self, tmpdir):
+        c = P.PyOcrCache(str(tmpdir.join('cache')), max_size=25)
+        hocr = self._write(tmpdir.join('page.hocr'), 'x'*10)
+        for i, key in enumerate(['aa01', 'bb02', 'cc03']):
+            c.store(key, hocr)
+            os.utime(c._get_path(key), (i, i))
+        # Using the oldest entry makes it the most recent
+        assert c.fetch('aa01', str(tmpdir.join('out.hocr')))
+
+        assert c.evict() == 1
+        assert not os.path.exists(c._get_path('bb02'))
+        assert os.path.exists(c._get_path('aa01'))
+        assert os.path.exists(c._get_path('cc03'))
+        assert c.evict() == 0
+
+    @patch('pypdfocr.pypdfocr_tesseract.subprocess.check_output')
+    def test_tesseract_cache_hit(self, mock_subprocess, tmpdir):
+        p = T.PyTesseract({'cache_dir': str(tmpdir.join('cache'))})
+        p.version = '3.04.01'
+        img = self._write(tmpdir.join('scan_1.jpg'), 'image data')
+
+        def run_tesseract(cmd, **kwargs):
+            self._write(tmpdir.join('scan_1.hocr'), '<html>text</html>')
+        mock_subprocess.side_effect = run_tesseract
+
+        assert p.make_hocr_from_pnm(img) == str(tmpdir.join('scan_1.hocr'))
+        assert mock_subprocess.call_count == 1
+        tmpdir.join('scan_1.hocr').remove()
+
+        # Second time around the result comes out of the cache
+        assert p.make_hocr_from_pnm(img) == str(tmpdir.join('scan_1.hocr'))
+        assert mock_subprocess.call_count == 1
+        assert tmpdir.join('scan_1.hocr').read() == '<html>text</html>'
+
+        # but not for another language
+        p.lang = 'spa'
+        p.make_hocr_from_pnm(img)
+        assert mock_subprocess.call_count == 2
+
+    @patch('pypdfocr.pypdfocr_tesseract.subprocess.Popen')
+    def test_tesseract_pipe(self, mock_popen, tmpdir):
+        """
+            Piped pages go through ghostscript and tesseract without an image file, and
+            are cached by the image data
+        """
+        from PIL import Image, ImageDraw
+        import StringIO
+        import pypdfocr.pypdfocr_blank as B
+        img = Image.new('L', (850, 1100), 255)
+        ImageDraw.Draw(img).rectangle((100, 100, 400, 130), fill=0)
+        out = StringIO.StringIO()
+        img.save(out, 'ppm')
+        img_data = out.getvalue()
+
+        p = T.PyTesseract({'cache_dir': str(tmpdir.join('cache'))})
+        p.version = '3.04.01'
+        p.blank = B.PyBlankDetector({})
+
+        procs = []
+        def run(cmd, **kwargs):
+            proc = MagicMock()
+            proc.returncode = 0
+            if cmd.startswith('gs'):
+                proc.stdout = StringIO.StringIO(img_data)
+            else:
+                proc.communicate.return_value = ('<html>text</html>', '')
+            procs.append(proc)
+            return proc
+        mock_popen.side_effect = run
+
+        name = str(tmpdir.join('scan_1.pgm'))
+        assert p.make_hocr_from_pipe([name], 'gs -sOutputFile=- scan.pdf', None, 100) == [str(tmpdir.join('scan_1.hocr'))]
+        assert [c[0][0].split()[0] for c in mock_popen.call_args_list] == ['gs', 'tesseract']
+        assert 'stdin stdout' in mock_popen.call_args_list[1][0][0]
+        assert 'user_defined_dpi=100' in mock_popen.call_args_list[1][0][0]
+        assert procs[1].communicate.call_args == ((img_data,), {})
+        assert tmpdir.join('scan_1.hocr').read() == '<html>text</html>'
+        assert not tmpdir.join('scan_1.pgm').exists()
+        tmpdir.join('scan_1.hocr').remove()
+
+        # The same image data is a cache hit, even when it was handed over directly
+        assert p.make_hocr_from_pipe([str(tmpdir.join('scan_2.pgm'))], None, img_data) == [str(tmpdir.join('scan_2.hocr'))]
+        assert mock_popen.call_count == 2
+        assert tmpdir.join('scan_2.hocr').read() == '<html>text</html>'
+
+        # A blank page never gets to tesseract
+        out = StringIO.StringIO()
+        Image.new('L', (850, 1100), 255).save(out, 'ppm')
+        assert p.make_hocr_from_pipe([str(tmpdir.join('scan_3.pgm'))], None, out.getvalue()) == [None]
+        assert mock_popen.call_count == 2
@@ -0,0 +1,129 @@
+import os
+import StringIO
+
+import pypdfocr.pypdfocr_extract as P
+import pypdfocr.pypdfocr_gs as G
+from pypdfocr.pypdfocr_pdfinfo import PyPdfInfo
+from pypdfocr.pypdfocr_timing import PyTimer
+
+from PIL import Image, ImageDraw
+from PyPDF2 import PdfFileWriter
+from PyPDF2.generic import (StreamObject, DecodedStreamObject, DictionaryObject, NameObject,
+                            NumberObject, BooleanObject)
+
+
+class TestExtract:
+
+    def _make_scan(self, mode, size=(2550, 3300)):
+        img = Image.new(mode, size, 'white')
+        ImageDraw.Draw(img).rectangle((300, 300, 1200, 400), fill='black')
+        return img
+
+    def _jpeg(self, img):
+        out = StringIO.StringIO()
+        img.save(out, 'jpeg')
+        return out.getvalue()
+
+    def _g4(self, img, tmpdir):
+        """
+            :returns: (G4 data, whether black is 1 in it)
+        """
+        fn = str(tmpdir.join('g4.tif'))
+        img.save(fn, compression='group4')
+        tiff = Image.open(fn)
+        offset, count = tiff.tag_v2[273][0], tiff.tag_v2[279][0]
+        with open(fn, 'rb') as f:
+            data = f.read()[offset:offset+count]
+        return data, tiff.tag_v2[262] == 1
+
+    def _make_pdf(self, filename, scans):
+        """
+            :param scans: list of (image, filter, stream data, decode parameters, page contents)
+        """
+        w = PdfFileWriter()
+        for img, img_filter, data, params, contents in scans:
+            page = w.addBlankPage(612, 792)
+            xobject = StreamObject()
+            xobject._data = data
+            xobject.update({NameObject('/Type'): NameObject('/XObject'), NameObject('/Subtype'): NameObject('/Image'),
+                            NameObject('/Width'): NumberObject(img.size[0]),
+                            NameObject('/Height'): NumberObject(img.size[1]),
+                            NameObject('/BitsPerComponent'): NumberObject(1 if img.mode == '1' else 8),
+                            NameObject('/ColorSpace'): NameObject('/DeviceRGB' if img.mode == 'RGB' else '/DeviceGray'),
+                            NameObject('/Filter'): NameObject(img_filter)})
+            if params:
+                xobject[NameObject('/DecodeParms')] = DictionaryObject(params)
+            xobjects = DictionaryObject({NameObject('/Im0'): w._addObject(xobject)})
+            page[NameObject('/Resources')] = DictionaryObject({NameObject('/XObject'): xobjects})
+            stream = DecodedStreamObject()
+            stream.setData(contents)
+            page[NameObject('/Contents')] = w._addObject(stream)
+        with open(filename, 'wb') as f:
+            w.write(f)
+        return filename
+
+    def test_full_page_image(self, tmpdir):
+        """
+            Only an upright image covering the page, with nothing else drawn, counts as a scan
+        """
+        img = self._make_scan('L', (85, 110))
+        data = self._jpeg(img)
+        pdf = self._make_pdf(str(tmpdir.join('scans.pdf')), [
+            (img, '/DCTDecode', data, None, 'q 612 0 0 792 0 0 cm /Im0 Do Q'),
+            (img, '/DCTDecode', data, None, 'q\n1 0 0 1 0 0 cm\nq 306 0 0 396 0 0 cm 2 0 0 2 0 0 cm/Im0 Do Q Q'),
+            (img, '/DCTDecode', data, None, 'q 306 0 0 396 0 0 cm /Im0 Do Q'),
+            (img, '/DCTDecode', data, None, 'q 612 0 0 -792 0 792 cm /Im0 Do Q'),
+            (img, '/DCTDecode', data, None, 'q 612 0 0 792 0 0 cm /Im0 Do Q 0 0 m 100 100 l S'),
+            (img, '/DCTDecode', data, None, 'q 612 0 0 792 0 0 cm /Im0 Do Q q 612 0 0 792 0 0 cm /Im0 Do Q'),
+        ])
+        pages = PyPdfInfo(pdf).pages
+        assert [bool(page.full_page_image) for page in pages] == [True, True, False, False, False, False]
+
+    def test_extract(self, tmpdir):
+        grey = self._make_scan('L')
+        colour = self._make_scan('RGB', (5100, 6600))
+        bilevel = self._make_scan('1')
+        g4, black_is_1 = self._g4(bilevel, tmpdir)
+        contents = 'q 612 0 0 792 0 0 cm /Im0 Do Q'
+        pdf = self._make_pdf(str(tmpdir.join('scans.pdf')), [
+            (grey, '/DCTDecode', self._jpeg(grey), None, contents),
+            (colour, '/DCTDecode', self._jpeg(colour), None, contents),
+            (bilevel, '/CCITTFaxDecode', g4,
+             {NameObject('/K'): NumberObject(-1), NameObject('/Columns'): NumberObject(2550),
+              NameObject('/BlackIs1'): BooleanObject(black_is_1)}, contents),
+            (self._make_scan('L', (1700, 2200)), '/DCTDecode', self._jpeg(self._make_scan('L', (1700, 2200))),
+             None, contents),
+        ])
+
+        p = G.PyGs({})
+        assert p._get_page_settings(pdf) == [(None, 'extract', [1, 2, 3]), (300, 'jpggrey', [4])]
+        assert G.PyGs({'extract_images': False})._get_page_settings(pdf)[0] == (300, 'jpggrey', [1, 4])
+
+        work = str(tmpdir.mkdir('work'))
+        runs = p._setup_img_output(pdf, PyTimer(), work, [1, 2, 3])
+        assert runs == [(None, os.path.join(work, 'scans_%d'), [1, 2, 3])]
+        imgs = list(p._iter_runs(runs, pdf, PyTimer()))
+        assert imgs == [(os.path.join(work, 'scans_1.jpg'), 1), (os.path.join(work, 'scans_2.jpg'), 2),
+                        (os.path.join(work, 'scans_3.tiff'), 3)]
+
+        for (fn, page), original, dpi in zip(imgs, [grey, colour, bilevel], [300, 600, 300]):
+            img = Image.open(fn)
+            assert img.info['dpi'] == (dpi, dpi)
+            assert img.size == original.size
+            assert img.mode == original.mode
+            # Same content as the scan: the black box is still where it was
+            assert img.convert('L').getpixel((700, 350)) < 50
+            assert img.convert('L').getpixel((700, 600)) > 200
+
+    def test_jpeg_dpi(self):
+        """
+            An existing JFIF header gets the new resolution, and one is added if it's missing
+        """
+        e = P.PyImageExtractor()
+        data = self._jpeg(self._make_scan('L', (100, 100)))
+        assert Image.open(StringIO.StringIO(e._set_jpeg_dpi(data, (300, 300)))).info['dpi'] == (300, 300)
+        no_jfif = data[:2] + data[2+2+16:]
+        assert no_jfif[2:4] != '\xff\xe0'
+        img = Image.open(StringIO.StringIO(e._set_jpeg_dpi(no_jfif, (400, 400))))
+        assert img.info['dpi'] == (400, 400)
+        assert img.size == (100, 100)
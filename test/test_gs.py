@@ -1,11 +1,12 @@
 #from pypdfocr import PyPDFOCR as P
 import pypdfocr.pypdfocr_gs as P
+from pypdfocr.pypdfocr_timing import PyTimer
 import pytest
 import os
 
 import hashlib
 
-from mock import patch, call
+from mock import patch, call, Mock
 from pytest import skip
 
 class TestGS:
@@ -24,18 +25,17 @@ class TestGS:
 
     @pytest.mark.skipif(os.name!='nt', reason="Not on NT")
     @patch('os.name')
-    @patch('subprocess.call')
-    def test_gs_run_nt(self, mock_subprocess, mock_os_name, capsys):
+    def test_gs_run_nt(self, mock_os_name, capsys):
         """
             Stupid test because Windows Tesseract only returns 3.02 instead of 3.02.02
         """
         mock_os_name.__str__.return_value = 'nt'
         p = P.PyGs({})
 
-        mock_subprocess.return_value = -1
         p.binary = 'gsblah.exe'
+        proc, out = p._start_gs("", "out_%d.jpg", "in.pdf")
         with pytest.raises(SystemExit):
-            p._run_gs("","","")
+            list(p._iter_gs(proc, out, "out_%d.jpg"))
 
         out,err = capsys.readouterr()
         assert p.msgs['GS_FAILED'] in out
@@ -48,3 +48,200 @@ class TestGS:
         assert p.msgs['GS_MISSING_PDF'] in out
 
 
+    @patch('pypdfocr.pypdfocr_gs.os.path.exists')
+    @patch('subprocess.Popen')
+    def test_gs_iter_pages(self, mock_popen, mock_exists):
+        """
+            Make sure pages are only handed out once ghostscript has moved past them
+        """
+        p = P.PyGs({'poll_interval':0})
+        rendered = set(['out_1.jpg', 'out_2.jpg'])
+        mock_exists.side_effect = lambda fn: fn in rendered
+        proc, out = p._start_gs("", "out_%d.jpg", "in.pdf")
+        proc.poll.return_value = None
+        proc.returncode = 0
+
+        pages = p._iter_gs(proc, out, "out_%d.jpg")
+        assert next(pages) == 'out_1.jpg'
+        # Still running, and page 3 not started yet, so page 2 isn't done
+        rendered.add('out_3.jpg')
+        assert next(pages) == 'out_2.jpg'
+        proc.poll.return_value = 0
+        assert list(pages) == ['out_3.jpg']
+
+
+    @patch('pypdfocr.pypdfocr_gs.PyGs._start_gs')
+    @patch('pypdfocr.pypdfocr_gs.PyGs._get_page_settings')
+    def test_gs_resume(self, mock_settings, mock_start_gs, tmpdir):
+        """
+            Rendering some of the pages keeps the other images, and names the new ones by page number
+        """
+        mock_settings.return_value = [(300, 'jpggrey', [3, 4])]
+        pdf = tmpdir.join('scan.pdf')
+        pdf.write('%PDF')
+        out_dir = tmpdir.mkdir('work')
+        for fn in ['scan_1.jpg', 'scan_2.jpg', 'scan_3.jpg']:
+            out_dir.join(fn).write('old')
+
+        def start_gs(options, output_filename, pdf_filename):
+            assert '-dFirstPage=3 -dLastPage=4' in options
+            for page in [1, 2]:
+                with open(output_filename % page, 'w') as f:
+                    f.write('new')
+            proc = Mock()
+            proc.poll.return_value = proc.returncode = 0
+            return (proc, None)
+        mock_start_gs.side_effect = start_gs
+
+        p = P.PyGs({'threads': 1})
+        imgs = p.make_img_from_pdf(str(pdf), PyTimer(), str(out_dir), pages=[3, 4])
+        assert imgs == [(str(out_dir.join('scan_3.jpg')), 3), (str(out_dir.join('scan_4.jpg')), 4)]
+        assert sorted(os.listdir(str(out_dir))) == ['scan_1.jpg', 'scan_2.jpg', 'scan_3.jpg', 'scan_4.jpg']
+        assert out_dir.join('scan_2.jpg').read() == 'old'
+        assert out_dir.join('scan_3.jpg').read() == 'new'
+
+    def test_gs_page_runs(self):
+        """
+            Pages to render are grouped into runs of consecutive pages for ghostscript
+        """
+        p = P.PyGs({})
+        assert p._get_page_runs(None) == [(1, None)]
+        assert p._get_page_runs([5, 1, 2, 3, 7, 8]) == [(1, 3), (5, 5), (7, 8)]
+        assert p._split_pages([5, 1, 2, 3, 7, 8]) == [[1, 2, 3], [5], [7, 8]]
+        assert p._get_run_output('-r300', 'w/scan_%d.jpg', [1, 2, 3]) == ('-r300 -dFirstPage=1 -dLastPage=3', 'w/scan_%d.jpg')
+        assert p._get_run_output('-r300', 'w/scan_%d.jpg', [5]) == ('-r300 -dFirstPage=5 -dLastPage=5', 'w/scan_from5_%d.jpg')
+
+        # Newer ghostscript can do them all at once
+        p = P.PyGs({'page_list': True})
+        assert p._split_pages([5, 1, 2, 3, 7, 8]) == [[1, 2, 3, 5, 7, 8]]
+        assert p._split_pages([5, 1, 2, 3, 7, 8], 4) == [[1, 2, 3, 5], [7, 8]]
+        assert p._get_run_output('-r300', 'w/scan_%d.jpg', [1, 2, 3, 5, 7, 8]) == ('-r300 -sPageList=1-3,5,7-8', 'w/scan_from1_%d.jpg')
+
+    def _make_scans_pdf(self, filename, scans):
+        """
+            Make a pdf with one image per page, without any image data
+
+            :param scans: list of (width, height, bits, colour space) for each page
+        """
+        from PyPDF2 import PdfFileWriter
+        from PyPDF2.generic import StreamObject, DictionaryObject, NameObject, NumberObject
+        w = PdfFileWriter()
+        for width, height, bits, colorspace in scans:
+            page = w.addBlankPage(612, 792)
+            img = StreamObject()
+            img._data = ''
+            img.update({NameObject('/Type'): NameObject('/XObject'), NameObject('/Subtype'): NameObject('/Image'),
+                        NameObject('/Width'): NumberObject(width), NameObject('/Height'): NumberObject(height),
+                        NameObject('/BitsPerComponent'): NumberObject(bits),
+                        NameObject('/ColorSpace'): NameObject(colorspace)})
+            xobjects = DictionaryObject({NameObject('/Im0'): w._addObject(img)})
+            page[NameObject('/Resources')] = DictionaryObject({NameObject('/XObject'): xobjects})
+        with open(filename, 'wb') as f:
+            w.write(f)
+        return filename
+
+    def test_gs_page_settings(self, tmpdir):
+        """
+            Each page is rendered with the resolution and colour of its own scan
+        """
+        pdf = self._make_scans_pdf(str(tmpdir.join('scan.pdf')),
+                                   [(2550, 3300, 1, '/DeviceGray'), (1700, 2200, 8, '/DeviceGray'),
+                                    (5100, 6600, 8, '/DeviceRGB'), (2550, 3300, 1, '/DeviceGray')])
+        p = P.PyGs({})
+        assert p._get_page_settings(pdf) == [(300, 'pnggrey', [1, 4]), (300, 'jpggrey', [2]), (600, 'jpg', [3])]
+        assert p._get_page_settings(pdf, [2, 3]) == [(300, 'jpggrey', [2]), (600, 'jpg', [3])]
+
+        work = str(tmpdir.mkdir('work'))
+        runs = p._setup_img_output(pdf, PyTimer(), work)
+        assert [(page_filename, pages) for options, page_filename, pages in runs] == [
+            (os.path.join(work, 'scan_%d.png'), [1]), (os.path.join(work, 'scan_%d.jpg'), [2]),
+            (os.path.join(work, 'scan_%d.jpg'), [3]), (os.path.join(work, 'scan_%d.png'), [4])]
+        assert '-sDEVICE=jpeg -dJPEGQ=75 -r600' in runs[2][0]
+
+    def test_gs_chunks(self):
+        """
+            The pages are shared out between the ghostscript processes, with ghostscript's
+            own rendering options added to each one
+        """
+        p = P.PyGs({'threads': 3, 'rendering_threads': 2, 'band_buffer_space': 1000000})
+        settings = [(300, 'jpggrey', range(1, 11)), (300, 'pnggrey', [11, 12])]
+        with patch.object(p, '_get_page_settings', return_value=settings):
+            runs = p._setup_img_output('/tmp/in.pdf', PyTimer(), '/tmp/none')
+        assert [pages for options, page_filename, pages in runs] == [[1, 2, 3, 4], [5, 6, 7, 8], [9, 10], [11, 12]]
+        assert runs[0][0] == '-sDEVICE=jpeggray -dJPEGQ=75 -r300 -dNumRenderingThreads=2 -dBandBufferSpace=1000000'
+        assert P.PyGs({'chunk_size': 5})._split_pages(range(1, 13), 5) == [range(1, 6), range(6, 11), [11, 12]]
+
+    @patch('pypdfocr.pypdfocr_gs.os.path.exists')
+    @patch('pypdfocr.pypdfocr_gs.PyGs._start_gs')
+    def test_gs_parallel(self, mock_start_gs, mock_exists):
+        """
+            Up to `threads` ghostscripts run at once, and the next one starts as soon as
+            one of them is done
+        """
+        procs = []
+        def start_gs(options, output_filename, pdf_filename):
+            proc = Mock()
+            proc.poll.return_value = None
+            proc.returncode = 0
+            procs.append(proc)
+            return (proc, None)
+        mock_start_gs.side_effect = start_gs
+        rendered = set()
+        mock_exists.side_effect = lambda fn: fn in rendered
+
+        p = P.PyGs({'threads': 2, 'poll_interval': 0})
+        runs = [('-r300', 'w/scan_%d.jpg', [1, 2]), ('-r300', 'w/scan_%d.jpg', [3, 4]), ('-r300', 'w/scan_%d.jpg', [5])]
+        with patch.object(p, '_rename_page', side_effect=lambda output, page, page_filename, pages: page_filename % pages[page-1]):
+            imgs = p._iter_runs(runs, 'in.pdf', PyTimer())
+            rendered.update(['w/scan_%d.jpg' % 1, 'w/scan_%d.jpg' % 2, 'w/scan_from3_%d.jpg' % 1])
+            assert next(imgs) == ('w/scan_1.jpg', 1)
+            assert len(procs) == 2
+            procs[0].poll.return_value = 0
+            assert next(imgs) == ('w/scan_2.jpg', 2)
+            # The first run has finished, so the third one starts
+            assert len(procs) == 3
+            rendered.add('w/scan_from3_%d.jpg' % 2)
+            procs[1].poll.return_value = procs[2].poll.return_value = 0
+            rendered.add('w/scan_from5_%d.jpg' % 1)
+            assert list(imgs) == [('w/scan_3.jpg', 3), ('w/scan_4.jpg', 4), ('w/scan_5.jpg', 5)]
+        assert len(procs) == 3
+
+    def test_gs_pipe_pages(self, tmpdir):
+        """
+            Piped pages come one at a time in page order, each with the ghostscript
+            command that writes its uncompressed image to stdout
+        """
+        pdf = self._make_scans_pdf(str(tmpdir.join('scan.pdf')),
+                                   [(2550, 3300, 1, '/DeviceGray'), (5100, 6600, 8, '/DeviceRGB'),
+                                    (1700, 2200, 8, '/DeviceGray')])
+        p = P.PyGs({'transport': 'pipe'})
+        assert p.pipe
+        work = str(tmpdir.mkdir('work'))
+        pages = list(p.iter_pipe_pages(pdf, PyTimer(), work, [1, 2, 3]))
+        assert [(names, pgs, data, dpi) for names, pgs, cmd, data, dpi in pages] == [
+            ([os.path.join(work, 'scan_1.pbm')], [1], None, 300), ([os.path.join(work, 'scan_2.ppm')], [2], None, 600),
+            ([os.path.join(work, 'scan_3.pgm')], [3], None, 300)]
+        cmd = pages[1][2]
+        assert '-sDEVICE=ppmraw -r600 -dFirstPage=2 -dLastPage=2 -sOutputFile=- "%s"' % pdf in cmd
+        assert '-sstdout=%stderr' in cmd
+        assert not os.listdir(work)
+
+    def test_gs_pipe_chunks(self, tmpdir):
+        """
+            Consecutive pages with the same settings are piped out of one ghostscript
+            run, in chunks
+        """
+        pdf = self._make_scans_pdf(str(tmpdir.join('scan.pdf')), [(1700, 2200, 8, '/DeviceGray')]*5)
+        p = P.PyGs({'transport': 'pipe', 'extract_images': False, 'threads': 2})
+        chunks = list(p.iter_pipe_pages(pdf, PyTimer(), str(tmpdir), [1, 2, 3, 4, 5]))
+        assert [pgs for names, pgs, cmd, data, dpi in chunks] == [[1, 2, 3], [4, 5]]
+        assert [os.path.basename(name) for name in chunks[1][0]] == ['scan_4.pgm', 'scan_5.pgm']
+        assert '-dFirstPage=4 -dLastPage=5 -sOutputFile=-' in chunks[1][2]
+
+        # No more than PIPE_CHUNK_SIZE pages to a run, unless chunk_size says otherwise
+        p = P.PyGs({'transport': 'pipe', 'extract_images': False, 'threads': 1})
+        p.PIPE_CHUNK_SIZE = 2
+        assert [pgs for names, pgs, cmd, data, dpi in p.iter_pipe_pages(pdf, PyTimer(), str(tmpdir), [1, 2, 3, 4, 5])] == [
+            [1, 2], [3, 4], [5]]
+        p.chunk_size = 5
+        assert len(list(p.iter_pipe_pages(pdf, PyTimer(), str(tmpdir), [1, 2, 3, 4, 5]))) == 1
@@ -0,0 +1,53 @@
+import pypdfocr.pypdfocr_hocr as P
+
+
+HOCR = ('<html xmlns="http://www.w3.org/1999/xhtml"><body>'
+        '<div class="ocr_page" id="page_1" title="bbox 0 0 2550 3300">'
+        '<div class="ocr_par"><span class="ocr_line" title="bbox 300 300 1200 360; baseline 0.01 -10; x_size 50">'
+        '<span class="ocrx_word" title="bbox 300 300 600 360; x_wconf 90">Total</span> '
+        '<span class="ocrx_word" title="bbox 700 300 1200 360; x_font &quot;Arial Bold&quot;; x_fsize 12">'
+        '<strong>due</strong></span>'
+        '</span></div>'
+        '<span class="ocr_line" title="bbox 2000 1000 2060 1600; textangle 90">'
+        '<span class="ocrx_word" title="bbox 2000 1000 2060 1600">Sideways</span>'
+        '<span class="ocrx_word" title="bbox 2000 1700 2060 1800"> </span>'
+        '</span></div>'
+        '<div class="ocr_page" id="page_2" title="bbox 0 0 2550 3300">'
+        '<span class="ocr_line" title="bbox 100 100 200 160">'
+        '<span class="ocrx_word" title="bbox 100 100 200 160">Second</span>'
+        '</span></div></body></html>')
+
+
+class TestHocr:
+
+    def test_lines(self, tmpdir):
+        hocr = tmpdir.join('scan_1.hocr')
+        hocr.write(HOCR)
+        page = P.PyHocrReader().read_page(str(hocr))
+        assert (page.width, page.height) == (2550, 3300)
+        assert len(page.lines) == 2
+        line = page.lines[0]
+        assert (line.bbox, line.angle, line.baseline, line.x_size) == ((300, 300, 1200, 360), 0, (0.01, -10), 50)
+        assert [(w.text, w.bbox, w.confidence, w.font_name, w.font_size) for w in line.words] == [
+            ('Total', (300, 300, 600, 360), 90, None, None),
+            ('due', (700, 300, 1200, 360), None, 'Arial Bold', 12)]
+        # The baseline is 10 pixels up from the bottom of the line, and slopes down
+        assert line.get_baseline(700) == 360 - 10 + 0.01*400
+        # Words with no text are left out
+        line = page.lines[1]
+        assert (line.angle, line.baseline, line.x_size, line.get_baseline(2000)) == (90, None, None, None)
+        assert page.get_text() == 'Total due\nSideways'
+
+        assert P.PyHocrReader().read_page(str(hocr), 2).get_text() == 'Second'
+        page = P.PyHocrReader().read_page(str(hocr), 3)
+        assert (page.lines, page.width) == ([], None)
+
+    def test_garbage(self, tmpdir):
+        """
+            Whatever could be read before the file goes wrong is kept
+        """
+        hocr = tmpdir.join('scan_1.hocr')
+        hocr.write(HOCR[:HOCR.index('<span class="ocr_line" title="bbox 2000')] + '<span <<garbage')
+        assert P.PyHocrReader().read_page(str(hocr)).get_text() == 'Total due'
+
+        assert P.PyHocrReader().read_page(str(tmpdir.join('missing.hocr'))).lines == []
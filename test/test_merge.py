@@ -0,0 +1,195 @@
+import os
+import subprocess
+import pytest
+
+import pypdfocr.pypdfocr_merge as P
+from pypdfocr.pypdfocr_textlayer import PyTextLayer
+from pypdfocr.pypdfocr_ocrpage import PyOcrPage, PyOcrLine, PyOcrWord
+
+from mock import patch
+from PIL import Image
+from PyPDF2 import PdfFileReader, PdfFileWriter
+from reportlab.pdfgen.canvas import Canvas
+
+
+class TestMerge:
+
+    def _make_pdf(self, tmpdir):
+        """
+            Three pages: a scan, a page with real text, and a scan turned sideways
+        """
+        img = str(tmpdir.join('scan.png'))
+        Image.new('L', (85, 110), 255).save(img)
+        pdf = str(tmpdir.join('scans.pdf'))
+        c = Canvas(pdf, pagesize=(612, 792))
+        c.drawImage(img, 0, 0, 612, 792)
+        c.showPage()
+        c.drawString(72, 720, "Born digital")
+        c.showPage()
+        c.setPageRotation(90)
+        c.drawImage(img, 0, 0, 612, 792)
+        c.showPage()
+        c.save()
+        return pdf
+
+    def _text_layers(self, words):
+        t = PyTextLayer()
+        return [(612, 792, t.get_content(PyOcrPage([PyOcrLine([300, 300, 900, 360], [PyOcrWord(word, [300, 300, 900, 360])])]),
+                                         792, 300))
+                for word in words]
+
+    def _text_pdfs(self, tmpdir, words):
+        """
+            A text pdf for each word, each with its own copy of the same font (as
+            tesseract's text-only pdfs have)
+        """
+        pdfs = []
+        for word in words:
+            pdf = str(tmpdir.join('text_%s.pdf' % word))
+            c = Canvas(pdf, pagesize=(612, 792))
+            c.drawString(72, 400, word)
+            c.showPage()
+            c.save()
+            pdfs.append(pdf)
+        return pdfs
+
+    def test_page_ranges(self):
+        assert P.get_page_ranges([5, 1, 2, 3, 7, 8]) == '1-3,5,7-8'
+        assert P.get_page_ranges([]) == ''
+
+    def test_incremental(self, tmpdir):
+        """
+            The original pdf is left as it is, with the OCR'ed pages rewritten after it
+        """
+        pdf = self._make_pdf(tmpdir)
+        out = str(tmpdir.join('scans_ocr.pdf'))
+        assert P.PyIncrementalMerge().merge(pdf, out, [1, 3], iter(self._text_layers(['First', 'Third'])))
+
+        with open(pdf, 'rb') as f:
+            orig = f.read()
+        with open(out, 'rb') as f:
+            assert f.read().startswith(orig)
+        with open(out, 'rb') as f:
+            reader = PdfFileReader(f, strict=True)
+            assert reader.getNumPages() == 3
+            assert 'First' in reader.getPage(0).extractText()
+            assert 'Born digital' in reader.getPage(1).extractText()
+            assert 'Third' in reader.getPage(2).extractText()
+            assert int(reader.getPage(2)['/Rotate']) == 90
+            # The original fonts are still there, next to the text layer's
+            fonts = reader.getPage(0)['/Resources'].getObject()['/Font'].getObject()
+            assert PyTextLayer.FONT_RESOURCE in fonts
+            # The text is turned back with the page
+            assert ' cm\n' in reader.getPage(2)['/Contents'][-1].getObject().getData()
+
+    def test_incremental_streams(self, tmpdir):
+        """
+            Each page is written out before the next one's text layer is made
+        """
+        pdf = self._make_pdf(tmpdir)
+        out = str(tmpdir.join('scans_ocr.pdf'))
+        events = []
+        def text_layers():
+            for layer in self._text_layers(['First', 'Third']):
+                events.append('layer')
+                yield layer
+        add_stream = P.PyObjectWriter.add_stream
+        def write_stream(writer, *args):
+            events.append('write')
+            return add_stream(writer, *args)
+        with patch.object(P.PyObjectWriter, 'add_stream', write_stream):
+            assert P.PyIncrementalMerge().merge(pdf, out, [1, 3], text_layers())
+        assert events.index('write') < events.index('layer', 1)
+
+    def test_incremental_text_pdf(self, tmpdir):
+        """
+            Text pdfs have their contents and fonts copied over, and the fonts they all
+            share are written once
+        """
+        pdf = self._make_pdf(tmpdir)
+        out = str(tmpdir.join('scans_ocr.pdf'))
+        assert P.PyIncrementalMerge().merge(pdf, out, [1, 2, 3], iter(self._text_pdfs(tmpdir, ['First', 'Second', 'Third'])))
+
+        with open(out, 'rb') as f:
+            reader = PdfFileReader(f, strict=True)
+            assert 'First' in reader.getPage(0).extractText()
+            assert 'Third' in reader.getPage(2).extractText()
+            text = reader.getPage(1).extractText()
+            assert 'Born digital' in text and 'Second' in text
+            # The pages' own font has the same name as the text's, so the text's is
+            # renamed
+            text_fonts = set()
+            for i in range(3):
+                page = reader.getPage(i)
+                fonts = page['/Resources']['/Font']
+                assert sorted(fonts) == ['/F1', '/F1_1']
+                assert '/F1_1 ' in page['/Contents'][-1].getObject().getData()
+                text_fonts.add(fonts.raw_get('/F1_1').idnum)
+            assert len(text_fonts) == 1
+
+    def test_incremental_fallback(self, tmpdir):
+        """
+            Dropping pages and encrypted pdfs need the pdf rewritten, and the text
+            layers are left for that
+        """
+        pdf = self._make_pdf(tmpdir)
+        out = str(tmpdir.join('scans_ocr.pdf'))
+        layers = iter(self._text_layers(['First']))
+        assert not P.PyIncrementalMerge().merge(pdf, out, [1], layers, drop=[2])
+
+        writer = PdfFileWriter()
+        with open(pdf, 'rb') as f:
+            writer.appendPagesFromReader(PdfFileReader(f))
+            writer.encrypt('')
+            encrypted = str(tmpdir.join('encrypted.pdf'))
+            with open(encrypted, 'wb') as e:
+                writer.write(e)
+        assert not P.PyIncrementalMerge().merge(encrypted, out, [1], layers)
+        assert len(list(layers)) == 1
+        assert not os.path.exists(out)
+
+    @patch('pypdfocr.pypdfocr_merge.subprocess.check_output')
+    def test_qpdf(self, mock_run, tmpdir):
+        pdf = self._make_pdf(tmpdir)
+        out = str(tmpdir.join('scans_ocr.pdf'))
+        merger = P.PyQpdfMerge('/opt/qpdf')
+        assert merger.merge(pdf, out, [1, 3], iter(self._text_layers(['First', 'Third'])), drop=[2], work_dir=str(tmpdir))
+        cmd = mock_run.call_args[0][0]
+        # The text goes on where the pages end up once page 2 is dropped
+        assert cmd == '/opt/qpdf "%s" --pages . 1,3 -- --overlay "%s" --to=1-2 -- "%s"' % (
+            pdf, tmpdir.join('scans_text.pdf'), out)
+        assert not tmpdir.join('scans_text.pdf').exists()
+        # qpdf is only looked for once
+        assert len([c for c in mock_run.call_args_list if '--version' in c[0][0]]) == 1
+
+        # Warnings about the input still count as success, other failures don't
+        mock_run.side_effect = subprocess.CalledProcessError(3, 'qpdf', 'WARNING: damaged')
+        assert merger.merge(pdf, out, [1], iter(self._text_layers(['First'])), work_dir=str(tmpdir))
+        mock_run.side_effect = subprocess.CalledProcessError(2, 'qpdf')
+        with pytest.raises(subprocess.CalledProcessError):
+            merger.merge(pdf, out, [1], iter(self._text_layers(['First'])), work_dir=str(tmpdir))
+
+        # Without qpdf the text layers are left for the PyPDF2 merge
+        mock_run.side_effect = subprocess.CalledProcessError(127, 'qpdf')
+        merger = P.PyQpdfMerge('/opt/qpdf')
+        layers = iter(self._text_layers(['First']))
+        assert not merger.merge(pdf, out, [1], layers)
+        assert len(list(layers)) == 1
+
+    @patch('pypdfocr.pypdfocr_merge.subprocess.check_output')
+    def test_qpdf_text_pdf(self, mock_run, tmpdir):
+        """
+            Text pdfs go into the text-only pdf for qpdf as they are
+        """
+        pdf = self._make_pdf(tmpdir)
+        text_pdfs = []
+        def run_qpdf(cmd, **kwargs):
+            if '--overlay' in cmd:
+                with open(str(tmpdir.join('scans_text.pdf')), 'rb') as f:
+                    reader = PdfFileReader(f, strict=True)
+                    text_pdfs.extend(reader.getPage(i).extractText() for i in range(reader.getNumPages()))
+        mock_run.side_effect = run_qpdf
+        assert P.PyQpdfMerge().merge(pdf, str(tmpdir.join('scans_ocr.pdf')), [1, 3],
+                                     iter(self._text_pdfs(tmpdir, ['First']) + self._text_layers(['Third'])),
+                                     work_dir=str(tmpdir))
+        assert [text.strip() for text in text_pdfs] == ['First', 'Third']
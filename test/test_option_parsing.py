@@ -103,3 +103,19 @@ class TestOptions:
         assert(self.p.enable_filing)
         assert(self.p.enable_evernote)
 
+
+    def test_batch(self):
+        opts = ['-b', 'pdfs', 'temp/*.pdf']
+        self.p.get_options(opts)
+        assert(self.p.batch)
+        assert(self.p.batch_paths == ['pdfs', 'temp/*.pdf'])
+        assert(self.p.manifest_filename == 'pypdfocr_manifest.jsonl')
+        assert(not self.p.watch)
+
+        opts.append('--manifest=run.jsonl')
+        self.p.get_options(opts)
+        assert(self.p.manifest_filename == 'run.jsonl')
+
+        # Can't combine with a single file
+        with pytest.raises(SystemExit):
+            self.p.get_options(['blah.pdf', '-b', 'pdfs'])
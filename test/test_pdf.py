@@ -0,0 +1,225 @@
+import os
+import pypdfocr.pypdfocr_pdf as P
+from pypdfocr.pypdfocr_pool import PyPool
+from pypdfocr.pypdfocr_ocrpage import PyOcrPage, PyOcrLine, PyOcrWord
+from PIL import Image
+from PyPDF2 import PdfFileReader
+from reportlab.pdfgen.canvas import Canvas
+
+
+class TestPdf:
+
+    def _make_pdf(self, tmpdir):
+        """
+            Four pages: a scan, a page with real text, a blank page, and a scan with
+            text on top of it (e.g. already OCR'ed)
+        """
+        img = str(tmpdir.join('scan.png'))
+        Image.new('L', (85, 110), 255).save(img)
+        pdf = str(tmpdir.join('mixed.pdf'))
+        c = Canvas(pdf, pagesize=(612, 792))
+        c.drawImage(img, 0, 0, 612, 792)
+        c.showPage()
+        c.drawString(72, 720, "Born digital")
+        c.showPage()
+        c.showPage()
+        c.drawImage(img, 0, 0, 612, 792)
+        for i, line in enumerate(["Already OCR'ed, with a few lines of text on it,",
+                                  "enough for the page to count as having text",
+                                  "rather than just a stamp on a scan"]):
+            c.drawString(72, 720-14*i, line)
+        c.showPage()
+        c.save()
+        return pdf
+
+    def _make_ocr_page(self, tmpdir, page, words):
+        """
+            The 100dpi image and hocr tesseract would have made for a page of the pdf
+            from :func:`_make_pdf`, with the words side by side on one line
+        """
+        img = str(tmpdir.join('mixed_%d.jpg' % page))
+        Image.new('L', (850, 1100), 255).save(img, dpi=(100, 100))
+        spans = ['<span class="ocrx_word" title="bbox %d 100 %d 130">%s</span>' % (100+150*i, 240+150*i, word)
+                 for i, word in enumerate(words)]
+        hocr = tmpdir.join('mixed_%d.hocr' % page)
+        hocr.write('<html xmlns="http://www.w3.org/1999/xhtml"><body>'
+                   '<div class="ocr_page" id="page_1" title="bbox 0 0 850 1100">'
+                   '<span class="ocr_line" title="bbox 100 100 %d 130">%s'
+                   '</span></div></body></html>' % (90+150*len(words), ' '.join(spans)))
+        return (img, str(hocr))
+
+    def test_pages_to_ocr(self, tmpdir):
+        p = P.PyPdf(None)
+        assert p.get_pages_to_ocr(self._make_pdf(tmpdir)) == (4, [1])
+
+    def test_pages_to_ocr_stamped(self, tmpdir):
+        """
+            A scan with a Bates number or page number stamped on it still needs OCR
+        """
+        img = str(tmpdir.join('scan.png'))
+        Image.new('L', (2550, 3300), 255).save(img)
+        pdf = str(tmpdir.join('stamped.pdf'))
+        c = Canvas(pdf, pagesize=(612, 792))
+        c.drawImage(img, 0, 0, 612, 792)
+        c.setFont('Helvetica', 6)
+        c.drawString(540, 20, "ABC-000123")
+        c.showPage()
+        c.drawImage(img, 0, 0, 612, 792)
+        c.drawString(72, 770, "Smith v. Jones")
+        c.drawString(280, 20, "Page 2 of 2")
+        c.showPage()
+        c.save()
+        p = P.PyPdf(None)
+        assert p.get_pages_to_ocr(pdf) == (2, [1, 2])
+
+    def test_overlay_some_pages(self, tmpdir):
+        """
+            Only the OCR'ed pages get a text layer, the rest are copied over as they are
+        """
+        pdf = self._make_pdf(tmpdir)
+        pair = self._make_ocr_page(tmpdir, 1, ['Scanned'])
+
+        p = P.PyPdf(None)
+        ocr_pdf = p.overlay_hocr_pages(100, [pair], pdf, pages=[1])
+        with open(ocr_pdf, 'rb') as f:
+            reader = PdfFileReader(f)
+            assert reader.getNumPages() == 4
+            assert 'Scanned' in reader.getPage(0).extractText()
+            assert 'Born digital' in reader.getPage(1).extractText()
+            assert not reader.getPage(2).extractText().strip()
+
+    def test_overlay_drop_pages(self, tmpdir):
+        pdf = self._make_pdf(tmpdir)
+        p = P.PyPdf(None)
+        ocr_pdf = p.overlay_hocr_pages(100, [], pdf, pages=[], drop=[1, 3])
+        with open(ocr_pdf, 'rb') as f:
+            reader = PdfFileReader(f)
+            assert reader.getNumPages() == 2
+            assert 'Born digital' in reader.getPage(0).extractText()
+
+    def test_overlay_ocr_pages(self, tmpdir):
+        """
+            The text read from each hocr file is handed back, by where its page ends up
+        """
+        pdf = self._make_pdf(tmpdir)
+        pair = self._make_ocr_page(tmpdir, 4, ['Fourth', 'page'])
+
+        p = P.PyPdf(None)
+        ocr_pages = {}
+        ocr_pdf = p.overlay_hocr_pages(100, [pair], pdf, pages=[4], drop=[3], ocr_pages=ocr_pages)
+        assert ocr_pages.keys() == [3]
+        assert ocr_pages[3].get_text() == 'Fourth page'
+        with open(ocr_pdf, 'rb') as f:
+            assert 'Fourth' in PdfFileReader(f).getPage(2).extractText()
+
+    def test_overlay_piped_page(self, tmpdir):
+        """
+            A page that was piped into tesseract has no image, so the text layer is
+            sized from the pdf page and the resolution from the hocr
+        """
+        pdf = self._make_pdf(tmpdir)
+        hocr = tmpdir.join('mixed_1.hocr')
+        hocr.write('<html xmlns="http://www.w3.org/1999/xhtml"><body>'
+                   '<div class="ocr_page" id="page_1" title="image &quot;stdin&quot;; bbox 0 0 1700 2200">'
+                   '<span class="ocr_line" title="bbox 200 200 800 260">'
+                   '<span class="ocrx_word" title="bbox 200 200 800 260">Piped</span>'
+                   '</span></div></body></html>')
+
+        p = P.PyPdf(None)
+        page = p.reader.read_page(str(hocr))
+        assert (page.width, page.height) == (1700, 2200)
+        ocr_pdf = p.overlay_hocr_pages(None, [(str(tmpdir.join('mixed_1.pgm')), str(hocr))], pdf, pages=[1])
+        with open(ocr_pdf, 'rb') as f:
+            reader = PdfFileReader(f)
+            assert reader.getNumPages() == 4
+            assert 'Piped' in reader.getPage(0).extractText()
+            assert [float(x) for x in reader.getPage(0).mediaBox.upperRight] == [612, 792]
+
+    def test_overlay_one_pass(self, tmpdir):
+        """
+            The text goes straight onto the pages, without a text pdf for each page, and
+            all the pages share one font
+        """
+        pdf = self._make_pdf(tmpdir)
+        pairs = [self._make_ocr_page(tmpdir, 1, ['First']), self._make_ocr_page(tmpdir, 4, ['Fourth'])]
+
+        p = P.PyPdf(None)
+        made = []
+        ocr_pdf = p.overlay_hocr_pages(None, pairs, pdf, callback=lambda img, text: made.append(text), pages=[1, 4])
+        assert not made
+        assert not tmpdir.listdir(lambda f: f.basename.startswith('text_') or f.basename.endswith('_text.pdf'))
+        with open(ocr_pdf, 'rb') as f:
+            reader = PdfFileReader(f)
+            assert 'First' in reader.getPage(0).extractText()
+            assert 'Fourth' in reader.getPage(3).extractText()
+            fonts = [reader.getPage(i)['/Resources'].getObject()['/Font'].raw_get(P.PyTextLayer.FONT_RESOURCE).idnum for i in (0, 3)]
+            assert fonts[0] == fonts[1]
+
+        # The reportlab text layer still makes a text pdf for each page
+        p = P.PyPdf(None, {'text_layer': 'reportlab'})
+        ocr_pdf = p.overlay_hocr_pages(None, pairs, pdf, callback=lambda img, text: made.append(text), pages=[1, 4])
+        assert [os.path.basename(fn) for fn in made] == ['text_mixed_1_ocr.pdf', 'text_mixed_4_ocr.pdf']
+        with open(ocr_pdf, 'rb') as f:
+            assert 'Fourth' in PdfFileReader(f).getPage(3).extractText()
+
+        # Or appended to a copy of the original, which stays as it was
+        p = P.PyPdf(None, {'merge': 'incremental'})
+        ocr_pdf = p.overlay_hocr_pages(None, pairs, pdf, pages=[1, 4])
+        with open(pdf, 'rb') as f:
+            orig = f.read()
+        with open(ocr_pdf, 'rb') as f:
+            assert f.read().startswith(orig)
+            assert 'First' in PdfFileReader(f).getPage(0).extractText()
+
+    def test_overlay_pending(self, tmpdir):
+        """
+            Text layers made by the workers ahead of time go on the pages the same as
+            the ones made during the merge
+        """
+        pdf = self._make_pdf(tmpdir)
+        pairs = [self._make_ocr_page(tmpdir, 1, ['First']), self._make_ocr_page(tmpdir, 4, ['Fourth'])]
+
+        pool = PyPool(2, idle_timeout=None)
+        try:
+            for text_layer in ['direct', 'reportlab']:
+                p = P.PyPdf(None, {'text_layer': text_layer})
+                made, ocr_pages = [], {}
+                with pool.lease() as workers:
+                    # Only the first page is made ahead, and without its text
+                    pending = {pairs[0][0]: p.submit_text_layer(workers, None, pairs[0][0], pairs[0][1], keep_ocr_page=False)}
+                    ocr_pdf = p.overlay_hocr_pages(None, pairs, pdf, callback=lambda img, text: made.append(text),
+                                                   pages=[1, 4], ocr_pages=ocr_pages, pending=pending)
+                assert not pending
+                assert [ocr_pages[i].get_text() for i in (1, 4)] == ['First', 'Fourth']
+                assert len(made) == (2 if text_layer == 'reportlab' else 0)
+                with open(ocr_pdf, 'rb') as f:
+                    reader = PdfFileReader(f)
+                    assert 'First' in reader.getPage(0).extractText()
+                    assert 'Fourth' in reader.getPage(3).extractText()
+        finally:
+            pool.close()
+
+    def test_overlay_tesseract_pdf(self, tmpdir):
+        """
+            Tesseract's text-only pdfs go onto the pages as they are, with no hocr to
+            read the text from
+        """
+        pdf = self._make_pdf(tmpdir)
+        img = str(tmpdir.join('mixed_1.jpg'))
+        text_pdf = str(tmpdir.join('mixed_1.pdf'))
+        t = P.PyTextLayer()
+        content = t.get_content(PyOcrPage([PyOcrLine([100, 100, 400, 130], [PyOcrWord(u'Scanned', [100, 100, 400, 130])])]),
+                                792, 100)
+        with open(text_pdf, 'wb') as f:
+            t.write_pdf(f, [(612, 792, content)])
+
+        for merge in ['pypdf2', 'incremental']:
+            p = P.PyPdf(None, {'text_layer': 'tesseract', 'merge': merge})
+            ocr_pages = {}
+            ocr_pdf = p.overlay_hocr_pages(None, [(img, text_pdf)], pdf, pages=[1], ocr_pages=ocr_pages)
+            assert ocr_pages == {}
+            with open(ocr_pdf, 'rb') as f:
+                reader = PdfFileReader(f)
+                assert reader.getNumPages() == 4
+                assert 'Scanned' in reader.getPage(0).extractText()
+                assert 'Born digital' in reader.getPage(1).extractText()
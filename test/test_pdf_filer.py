@@ -5,6 +5,12 @@ import os
 
 import hashlib
 
+from PyPDF2 import PdfFileReader
+from reportlab.pdfgen.canvas import Canvas
+from pypdfocr.pypdfocr_pdffiler import PyPdfFiler
+from pypdfocr.pypdfocr_filer_dirs import PyFilerDirs
+from pypdfocr.pypdfocr_ocrpage import PyOcrPage, PyOcrLine, PyOcrWord
+
 from mock import patch, call
 from pytest import skip
 
@@ -39,3 +45,39 @@ class TestPDFFiler:
 
 
         
+
+    def test_ocr_pages(self, tmpdir):
+        """
+            The text of OCR'ed pages is taken as it was OCR'ed, and only the other
+            pages are read out of the pdf
+        """
+        pdf = str(tmpdir.join('scan_ocr.pdf'))
+        c = Canvas(pdf)
+        c.drawString(72, 720, "Invoice")
+        c.showPage()
+        c.drawString(72, 720, "Born digital")
+        c.showPage()
+        c.save()
+        ocr_pages = {1: PyOcrPage([PyOcrLine([0, 0, 100, 10], [PyOcrWord(u'Bank', [0, 0, 40, 10]),
+                                                                   PyOcrWord(u'statement\u2019s', [50, 0, 100, 10])]),
+                                   PyOcrLine([0, 20, 100, 30], [PyOcrWord(u'total', [0, 20, 40, 30])])])}
+
+        filer = PyPdfFiler(PyFilerDirs())
+        with patch.object(PdfFileReader, 'getPage', side_effect=PdfFileReader.getPage, autospec=True) as mock_page:
+            texts = list(filer.iter_pdf_page_text(pdf, ocr_pages))
+            assert texts[0] == 'Bank statements total'
+            assert texts[1].strip() == 'Born digital'
+            assert [c[0][1] for c in mock_page.call_args_list] == [1]
+
+    def test_two_byte_text(self):
+        """
+            Text in two-byte fonts (as in tesseract's text-only pdfs) is read as UTF-16
+        """
+        from pypdfocr.pypdfocr_pdffiler import get_page_text
+        from PyPDF2.pdf import PageObject
+        from PyPDF2.generic import DecodedStreamObject, NameObject
+        page = PageObject.createBlankPage(None, 612, 792)
+        contents = DecodedStreamObject()
+        contents.setData('BT /f-0-0 12 Tf [ <00420061006E006B0020> ] TJ [ <00730074006100740065006D0065006E0074> ] TJ (total) Tj ET')
+        page[NameObject('/Contents')] = contents
+        assert get_page_text(page) == 'Bank  statement total'
@@ -0,0 +1,54 @@
+import pypdfocr.pypdfocr_pdfinfo as P
+import pypdfocr.pypdfocr_gs as G
+from PIL import Image
+from reportlab.pdfgen.canvas import Canvas
+
+
+class TestPdfInfo:
+
+    def _make_pdf(self, tmpdir):
+        """
+            A 200dpi greyscale page, a 300dpi colour page, a text page, and a
+            landscape scan turned onto a portrait page
+        """
+        grey = str(tmpdir.join('grey.png'))
+        Image.new('L', (1700, 2200), 255).save(grey)
+        colour = str(tmpdir.join('colour.jpg'))
+        Image.new('RGB', (2550, 3300), (255, 255, 200)).save(colour)
+        landscape = str(tmpdir.join('landscape.png'))
+        Image.new('L', (1100, 850), 255).save(landscape)
+
+        pdf = str(tmpdir.join('mixed.pdf'))
+        c = Canvas(pdf, pagesize=(612, 792))
+        c.drawImage(grey, 0, 0, 612, 792)
+        c.showPage()
+        c.drawImage(colour, 0, 0, 612, 792)
+        c.showPage()
+        c.drawString(72, 720, "No images here")
+        c.showPage()
+        c.rotate(90)
+        c.drawImage(landscape, 0, -612, 792, 612)
+        c.showPage()
+        c.save()
+        return pdf
+
+    def test_pages(self, tmpdir):
+        pages = P.PyPdfInfo(self._make_pdf(tmpdir)).pages
+        assert len(pages) == 4
+        assert (pages[0].width, pages[0].height) == (612, 792)
+
+        assert pages[0].get_dpi() == (200, 200)
+        assert pages[0].is_greyscale()
+        assert pages[1].get_dpi() == (300, 300)
+        assert not pages[1].is_greyscale()
+        assert pages[1].get_main_image().filters[-1] == '/DCTDecode'
+        assert pages[2].get_dpi() is None
+        assert not pages[2].images
+        assert pages[3].get_dpi() == (100, 100)
+
+    def test_gs_dpi(self, tmpdir):
+        """
+            Ghostscript goes by the first page with images, and renders at no less than 300dpi
+        """
+        pdf = self._make_pdf(tmpdir)
+        assert G.PyGs({})._get_dpi(pdf) == (300, True)
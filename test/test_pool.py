@@ -0,0 +1,65 @@
+import pypdfocr.pypdfocr_pool as P
+import pytest
+import sys
+import time
+
+
+def square(x):
+    return x*x
+
+def fail(x):
+    sys.exit(-1)
+
+class TestPool:
+
+    def test_reuse(self):
+        p = P.PyPool(2, idle_timeout=None)
+        p.start()
+        first = p._pool
+        with p.lease() as workers:
+            assert workers.map(square, [1,2,3]) == [1,4,9]
+        with p.lease() as workers:
+            # Same processes get used for the next job
+            assert p._pool is first
+        p.close()
+        assert p._pool is None
+
+    def test_idle_shrink(self):
+        p = P.PyPool(1, idle_timeout=0.1)
+        with p.lease() as workers:
+            assert workers.submit(square, (3,)).get() == 9
+            time.sleep(0.3)
+            # Still busy, so the pool must not go away
+            assert p._pool is not None
+        time.sleep(0.5)
+        assert p._pool is None
+
+        # Comes back on the next lease
+        with p.lease() as workers:
+            assert workers.submit(square, (4,)).get() == 16
+        p.close()
+
+    def test_interrupt_terminates(self):
+        p = P.PyPool(1, idle_timeout=None)
+        with pytest.raises(KeyboardInterrupt):
+            with p.lease() as workers:
+                raise KeyboardInterrupt()
+        assert p._pool is None
+        p.close()
+
+    def test_failure_frees_slot(self):
+        """
+            A task that exits must not hang the caller or use up its queue slot
+        """
+        p = P.PyPool(1, idle_timeout=None, queue_size=1)
+        with p.lease() as workers:
+            with pytest.raises(SystemExit):
+                workers.submit(fail, (1,)).get()
+            assert workers.submit(square, (5,)).get() == 25
+        p.close()
+
+    def test_queue_size(self):
+        p = P.PyPool(3, idle_timeout=None)
+        assert p.queue_size == 6
+        p = P.PyPool(3, idle_timeout=None, queue_size=2)
+        assert p.queue_size == 2
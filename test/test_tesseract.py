@@ -136,3 +136,186 @@ class TestTesseract:
         out, err = capsys.readouterr()
         assert p.msgs['TS_FAILED'] in out
 
+
+    def _hocr(self, img_filenames):
+        head = '<?xml version="1.0" encoding="UTF-8"?>\n<html xmlns="http://www.w3.org/1999/xhtml">\n <head>\n  <title></title>\n </head>\n <body>\n'
+        pages = ["  <div class='ocr_page' id='page_%d' title='image \"%s\"; bbox 0 0 850 1100'>\n"
+                 "   <span class='ocrx_word' id='word_%d_1' title='bbox 1 1 9 9'>word%d</span>\n  </div>\n"
+                 % (i, fn, i, i) for i, fn in enumerate(img_filenames, 1)]
+        return head + ''.join(pages) + ' </body>\n</html>\n'
+
+    @patch('pypdfocr.pypdfocr_tesseract.subprocess.check_output')
+    def test_batch(self, mock_subprocess, tmpdir):
+        """
+            A batch of images goes through one tesseract run, and the hocr is split
+            back into one file per image
+        """
+        from xml.etree.ElementTree import ElementTree
+        p = P.PyTesseract({'batch_size': 3})
+        p.version = '3.04.01'
+        imgs = []
+        for i in range(1, 4):
+            tmpdir.join('scan_%d.png' % i).write('image')
+            imgs.append(str(tmpdir.join('scan_%d.png' % i)))
+
+        def run_tesseract(cmd, **kwargs):
+            list_filename = cmd.split('"')[1]
+            with open(list_filename) as f:
+                listed = f.read().splitlines()
+            assert listed == imgs
+            tmpdir.join('scan_1_batch.hocr').write(self._hocr(listed))
+        mock_subprocess.side_effect = run_tesseract
+
+        assert p.make_hocr_from_pnm_batch(imgs) == [str(tmpdir.join('scan_%d.hocr' % i)) for i in range(1, 4)]
+        assert mock_subprocess.call_count == 1
+        for i in range(1, 4):
+            root = ElementTree().parse(str(tmpdir.join('scan_%d.hocr' % i)))
+            words = [e.text for e in root.iter('{http://www.w3.org/1999/xhtml}span')]
+            assert words == ['word%d' % i]
+        # The list and the combined hocr are cleaned up
+        assert sorted(f.basename for f in tmpdir.listdir()) == ['scan_%d.%s' % (i, ext) for i in range(1, 4) for ext in ['hocr', 'png']]
+
+    @patch('pypdfocr.pypdfocr_tesseract.subprocess.check_output')
+    def test_batch_fail(self, mock_subprocess, tmpdir, capsys):
+        """
+            If the batch doesn't give a page for every image, they're done one at a time
+        """
+        p = P.PyTesseract({})
+        p.version = '3.04.01'
+        imgs = []
+        for i in range(1, 3):
+            tmpdir.join('scan_%d.png' % i).write('image')
+            imgs.append(str(tmpdir.join('scan_%d.png' % i)))
+
+        def run_tesseract(cmd, **kwargs):
+            base = cmd.split('"')[3]
+            if base.endswith('_batch'):
+                tmpdir.join('scan_1_batch.hocr').write(self._hocr(imgs[:1]))
+            else:
+                tmpdir.join('%s.hocr' % os.path.basename(base)).write(self._hocr([base]))
+        mock_subprocess.side_effect = run_tesseract
+
+        assert p.make_hocr_from_pnm_batch(imgs) == [str(tmpdir.join('scan_%d.hocr' % i)) for i in range(1, 3)]
+        assert mock_subprocess.call_count == 3
+        assert p.msgs['TS_BATCH_FAILED'] in capsys.readouterr()[0]
+
+    @patch('pypdfocr.pypdfocr_tesseract.subprocess.check_output')
+    def test_batch_tsv(self, mock_subprocess, tmpdir):
+        """
+            With the tsv output, the batch's TSV is split into one file per image,
+            each numbered as page 1
+        """
+        p = P.PyTesseract({'batch_size': 2, 'output': 'tsv'})
+        p.version = '3.05.01'
+        imgs = []
+        for i in range(1, 3):
+            tmpdir.join('scan_%d.png' % i).write('image')
+            imgs.append(str(tmpdir.join('scan_%d.png' % i)))
+
+        header = 'level\tpage_num\tblock_num\tpar_num\tline_num\tword_num\tleft\ttop\twidth\theight\tconf\ttext\n'
+        def run_tesseract(cmd, **kwargs):
+            assert cmd.endswith(' tsv')
+            tmpdir.join('scan_1_batch.tsv').write(
+                header + ''.join('1\t%d\t0\t0\t0\t0\t0\t0\t850\t1100\t-1\t\n'
+                                 '5\t%d\t1\t1\t1\t1\t1\t1\t8\t8\t90\tword%d\n' % (i, i, i) for i in range(1, 3)))
+        mock_subprocess.side_effect = run_tesseract
+
+        assert p.make_hocr_from_pnm_batch(imgs) == [str(tmpdir.join('scan_%d.tsv' % i)) for i in range(1, 3)]
+        for i in range(1, 3):
+            assert tmpdir.join('scan_%d.tsv' % i).read() == (header + '1\t1\t0\t0\t0\t0\t0\t0\t850\t1100\t-1\t\n'
+                                                              '5\t1\t1\t1\t1\t1\t1\t1\t8\t8\t90\tword%d\n' % i)
+        # Garbage doesn't split into pages
+        assert p._split_tsv('Error\n') == []
+        assert p._split_tsv(header + '5\t1\t1\t1\t1\t1\t1\t1\t8\t8\t90\tword\n') == []
+
+    def test_tsv_too_old(self, tmpdir, capsys):
+        """
+            Tesseract older than 3.05 can't write TSV, so hocr is used instead
+        """
+        p = P.PyTesseract({'output': 'tsv'})
+        p.version = '3.04.01'
+        p.make_hocr_from_pnms([])
+        assert p.output == 'hocr'
+        assert p.msgs['TS_NO_TSV'] in capsys.readouterr()[0]
+
+    @patch('pypdfocr.pypdfocr_tesseract.subprocess.check_output')
+    def test_batch_pdf(self, mock_subprocess, tmpdir):
+        """
+            With the pdf output, tesseract leaves out the images, and the batch's pdf is
+            split into one text-only pdf per image
+        """
+        from PyPDF2 import PdfFileReader
+        from pypdfocr.pypdfocr_textlayer import PyTextLayer
+        p = P.PyTesseract({'batch_size': 2, 'output': 'pdf'})
+        p.version = '3.05.01'
+        imgs = []
+        for i in range(1, 3):
+            tmpdir.join('scan_%d.png' % i).write('image')
+            imgs.append(str(tmpdir.join('scan_%d.png' % i)))
+
+        def run_tesseract(cmd, **kwargs):
+            assert '-c textonly_pdf=1' in cmd and cmd.endswith(' pdf')
+            t = PyTextLayer()
+            with open(str(tmpdir.join('scan_1_batch.pdf')), 'wb') as f:
+                t.write_pdf(f, [(612, 792, 'BT /FPyPDFOCR 12 Tf (word%d) Tj ET' % i) for i in range(1, 3)])
+        mock_subprocess.side_effect = run_tesseract
+
+        assert p.make_hocr_from_pnm_batch(imgs) == [str(tmpdir.join('scan_%d.pdf' % i)) for i in range(1, 3)]
+        for i in range(1, 3):
+            with open(str(tmpdir.join('scan_%d.pdf' % i)), 'rb') as f:
+                reader = PdfFileReader(f)
+                assert reader.getNumPages() == 1
+                assert reader.getPage(0).extractText() == 'word%d' % i
+
+    def test_pdf_too_old(self, capsys):
+        """
+            Tesseract older than 3.05.01 writes the image into its pdfs, so hocr is used
+            instead
+        """
+        p = P.PyTesseract({'output': 'pdf'})
+        p.version = '3.05'
+        p.make_hocr_from_pnms([])
+        assert p.output == 'hocr'
+        assert p.msgs['TS_NO_PDF'] in capsys.readouterr()[0]
+        p.version, p.output = '4.0.0', 'pdf'
+        assert p._can_textonly_pdf()
+        assert p._get_cache_options() == '%s -c textonly_pdf=1 pdf' % p.options
+
+    def test_read_pnm(self):
+        import StringIO
+        f = StringIO.StringIO('P5\n# Image generated by Ghostscript\n3 2\n255\n' + 'x'*6 + 'P4 9 2\n' + 'y'*4)
+        assert P.read_pnm(f) == 'P5\n# Image generated by Ghostscript\n3 2\n255\n' + 'x'*6
+        assert P.read_pnm(f) == 'P4 9 2\n' + 'y'*4
+        assert P.read_pnm(f) == ''
+        with pytest.raises(ValueError):
+            P.read_pnm(StringIO.StringIO('P6\n3 2\n255\nzz'))
+
+    def test_pipe_chunk(self, tmpdir):
+        """
+            One command writes the images of a chunk of pages, and each one goes to
+            tesseract as it is read
+        """
+        frames = ['P5\n2 2\n255\n' + c*4 for c in 'ab']
+        stream = tmpdir.join('chunk.pgm')
+        stream.write(''.join(frames), 'wb')
+        p = P.PyTesseract({})
+        p.version = '3.04.01'
+        names = [str(tmpdir.join('scan_%d.pgm' % i)) for i in (3, 4)]
+        with patch.object(P.PyTesseract, '_make_hocr_from_data', side_effect=lambda name, data, dpi: (name, data, dpi)):
+            assert p.make_hocr_from_pipe(names, 'cat "%s"' % stream, None, 300) == [
+                (names[0], frames[0], 300), (names[1], frames[1], 300)]
+            # A chunk that comes up short fails the conversion
+            with pytest.raises(SystemExit):
+                p.make_hocr_from_pipe(names + [str(tmpdir.join('scan_5.pgm'))], 'cat "%s"' % stream, None, 300)
+
+    def test_pipe_too_old(self):
+        """
+            Tesseract older than 3.03 can't read from stdin
+        """
+        p = P.PyTesseract({})
+        p.version = '3.02.02'
+        assert not p.can_pipe()
+        with pytest.raises(SystemExit):
+            p.make_hocr_from_pnms([(['scan_1.pgm'], 'gs', None, 300)])
+        p.version = '3.03'
+        assert p.can_pipe()
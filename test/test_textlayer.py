@@ -0,0 +1,58 @@
+import StringIO
+
+import pypdfocr.pypdfocr_textlayer as P
+from pypdfocr.pypdfocr_ocrpage import PyOcrPage, PyOcrLine, PyOcrWord
+from PyPDF2 import PdfFileReader
+from reportlab.pdfbase.pdfmetrics import stringWidth
+
+
+class TestTextLayer:
+
+    def test_content(self, tmpdir):
+        t = P.PyTextLayer()
+        page = PyOcrPage([PyOcrLine([300, 300, 1200, 360], [PyOcrWord('Total', [300, 300, 600, 360]),
+                                                            PyOcrWord('(due)', [700, 300, 1200, 360], font_size=12)],
+                                    baseline=(0.01, -10), x_size=50),
+                          PyOcrLine([2000, 1000, 2060, 1600], [PyOcrWord('Sideways', [2000, 1000, 2060, 1600])], 90)])
+        content = t.get_content(page, 792, 300).splitlines()
+        assert content[:3] == ['BT', '3 Tr', '0 TL']
+        # Sized from the line, placed on the baseline and stretched over the word's box
+        assert '/FPyPDFOCR 12 Tf' in content
+        assert '1 0 0 1 72 708 Tm' in content
+        assert '%s Tz' % t._num(100*72/stringWidth('Total', 'Helvetica', 12)) in content
+        assert '(\\(due\\)) Tj T*' in content
+        # Turned text reads up along the right edge of its box
+        assert '0 1 -1 0 494.4 408 Tm' in content
+        assert content[-1] == 'ET'
+
+    def test_write_pdf(self):
+        t = P.PyTextLayer()
+        page = PyOcrPage([PyOcrLine([300, 300, 600, 360], [PyOcrWord('Hello', [300, 300, 600, 360])], baseline=(0, -10))])
+        out = StringIO.StringIO()
+        t.write_pdf(out, [(612, 792, t.get_content(page, 792, 300)), (792, 612, t.get_content(PyOcrPage([]), 612, 300))],
+                    'scan (1).hocr')
+        reader = PdfFileReader(StringIO.StringIO(out.getvalue()), strict=True)
+        assert reader.getNumPages() == 2
+        assert reader.getDocumentInfo().title == 'scan (1).hocr'
+        assert reader.getPage(0).extractText().strip() == 'Hello'
+        assert [float(x) for x in reader.getPage(1).mediaBox.upperRight] == [792, 612]
+
+    def test_write_pdf_copies(self, tmpdir):
+        """
+            Text pdfs are copied in, with the objects that are the same in each written
+            only once
+        """
+        from reportlab.pdfgen.canvas import Canvas
+        pdfs = []
+        for word in ['First', 'Second']:
+            pdfs.append(str(tmpdir.join('%s.pdf' % word)))
+            c = Canvas(pdfs[-1], pagesize=(792, 612))
+            c.drawString(72, 400, word)
+            c.showPage()
+            c.save()
+        out = StringIO.StringIO()
+        P.PyTextLayer().write_pdf(out, pdfs)
+        assert out.getvalue().count('/BaseFont /Helvetica') == 1
+        reader = PdfFileReader(StringIO.StringIO(out.getvalue()), strict=True)
+        assert [reader.getPage(i).extractText().strip() for i in range(2)] == ['First', 'Second']
+        assert [float(x) for x in reader.getPage(1).mediaBox.upperRight] == [792, 612]
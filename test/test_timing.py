@@ -0,0 +1,31 @@
+import pypdfocr.pypdfocr_timing as P
+import json
+import cStringIO
+
+
+class TestTiming:
+
+    def test_stages(self):
+        t = P.PyTimer("scan.pdf")
+        with t.stage('render'):
+            pass
+        t.add('ocr', 2.0, page='/tmp/scan_1.jpg')
+        t.add('ocr', 4.0, page='/tmp/scan_2.jpg')
+        t.add('ocr', 5.0)
+        t.add('ocr', 1.0)
+
+        assert list(t.stages.keys()) == ['render', 'ocr']
+        assert t.stages['ocr'] == 6.0
+        assert t.page_times['ocr'] == {'scan_1.jpg': 2.0, 'scan_2.jpg': 4.0}
+
+        f = cStringIO.StringIO()
+        t.write_record(f, output="scan_ocr.pdf")
+        record = json.loads(f.getvalue())
+        assert record['file'] == 'scan.pdf'
+        assert record['output'] == 'scan_ocr.pdf'
+        assert record['pages']['ocr']['scan_2.jpg'] == 4.0
+
+        summary = t.get_summary()
+        assert 'render' in summary
+        # 2 pages, averaging 3 seconds, worst is 4
+        assert '2      3.000      4.000' in summary
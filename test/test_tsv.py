@@ -0,0 +1,59 @@
+import pypdfocr.pypdfocr_tsv as P
+
+
+def _rows(rows):
+    return ''.join('\t'.join(str(col) for col in row) + '\n' for row in rows)
+
+TSV = _rows([
+    ('level', 'page_num', 'block_num', 'par_num', 'line_num', 'word_num', 'left', 'top', 'width', 'height', 'conf', 'text'),
+    (1, 1, 0, 0, 0, 0, 0, 0, 2550, 3300, -1, ''),
+    (2, 1, 1, 0, 0, 0, 300, 300, 900, 60, -1, ''),
+    (3, 1, 1, 1, 0, 0, 300, 300, 900, 60, -1, ''),
+    (4, 1, 1, 1, 1, 0, 300, 300, 900, 60, -1, ''),
+    (5, 1, 1, 1, 1, 1, 300, 300, 300, 50, 91, 'Total'),
+    (5, 1, 1, 1, 1, 2, 700, 300, 200, 60, 85, 'due:'),
+    (5, 1, 1, 1, 1, 3, 950, 300, 250, 50, 88, '\xe2\x82\xac10'),
+    (5, 1, 1, 1, 1, 4, 1250, 300, 10, 10, 95, ' '),
+    (5, 1, 1, 1, 1, 5, 1300, 300, 10, 10, -1, 'noise'),
+    (4, 1, 1, 1, 2, 0, 300, 400, 100, 60, -1, ''),
+    (1, 2, 0, 0, 0, 0, 0, 0, 1700, 2200, -1, ''),
+    (4, 2, 1, 1, 1, 0, 100, 100, 100, 60, -1, ''),
+    (5, 2, 1, 1, 1, 1, 100, 100, 100, 60, 90, 'Second'),
+])
+
+
+class TestTsv:
+
+    def test_lines(self, tmpdir):
+        tsv = tmpdir.join('scan_1.tsv')
+        tsv.write(TSV, 'wb')
+        page = P.PyTsvReader().read_page(str(tsv))
+        assert (page.width, page.height) == (2550, 3300)
+        assert len(page.lines) == 2
+        line = page.lines[0]
+        assert (line.bbox, line.angle, line.x_size) == ((300, 300, 1200, 360), 0, 60)
+        # Words with no text or no confidence are left out
+        assert [(w.text, w.bbox, w.confidence) for w in line.words] == [
+            (u'Total', (300, 300, 600, 350), 91),
+            (u'due:', (700, 300, 900, 360), 85),
+            (u'\u20ac10', (950, 300, 1200, 350), 88)]
+        # The baseline is where most of the words end
+        assert line.baseline == (0.0, -10)
+        assert line.get_baseline(700) == 350
+        assert page.lines[1].words == [] and page.lines[1].baseline is None
+        assert page.get_text() == u'Total due: \u20ac10\n'
+
+        page = P.PyTsvReader().read_page(str(tsv), 2)
+        assert (page.get_text(), page.width, page.height) == (u'Second', 1700, 2200)
+        page = P.PyTsvReader().read_page(str(tsv), 3)
+        assert (page.lines, page.width) == ([], None)
+
+    def test_garbage(self, tmpdir):
+        """
+            Whatever could be read before the file goes wrong is kept
+        """
+        tsv = tmpdir.join('scan_1.tsv')
+        tsv.write(TSV[:TSV.index('4\t1\t1\t1\t2')] + 'garbage\n', 'wb')
+        assert P.PyTsvReader().read_page(str(tsv)).get_text() == u'Total due: \u20ac10'
+
+        assert P.PyTsvReader().read_page(str(tmpdir.join('missing.tsv'))).lines == []
@@ -0,0 +1,106 @@
+import pypdfocr.pypdfocr_workspace as P
+import os
+
+
+class TestWorkspace:
+
+    def _make_pdf(self, tmpdir):
+        pdf = tmpdir.join('scan.pdf')
+        pdf.write('%PDF-1.4')
+        return str(pdf)
+
+    def test_resume(self, tmpdir):
+        pdf = self._make_pdf(tmpdir)
+        w = P.PyWorkspace(pdf, str(tmpdir.join('scratch')))
+        assert w.dir.startswith(str(tmpdir.join('scratch', 'pypdfocr_scan_')))
+        assert not w.open(lang='eng')
+        assert os.path.isdir(w.dir)
+
+        w.add_page('render', w.path('scan_1.jpg'), 1)
+        w.add_page('render', w.path('scan_3.jpg'), 3)
+        w.add_page('ocr', w.path('scan_1.jpg'), (w.path('scan_1.jpg'), w.path('scan_1.hocr')))
+        w.set('dpi', 300)
+
+        # A new attempt picks up where this one stopped
+        w = P.PyWorkspace(pdf, str(tmpdir.join('scratch')))
+        assert w.open(lang='eng')
+        assert w.get_pages('render').items() == [(w.path('scan_1.jpg'), 1), (w.path('scan_3.jpg'), 3)]
+        assert w.get_pages('ocr')[w.path('scan_1.jpg')] == (w.path('scan_1.jpg'), w.path('scan_1.hocr'))
+        assert w.get('dpi') == 300
+        assert w.get_page('render', 'scan_3.jpg') == 3
+        assert w.get_page('ocr', w.path('scan_3.jpg'), 'missing') == 'missing'
+
+        w.remove()
+        assert not os.path.exists(w.dir)
+
+    def test_discard_stale(self, tmpdir):
+        pdf = self._make_pdf(tmpdir)
+        w = P.PyWorkspace(pdf, str(tmpdir.join('scratch')))
+        w.open(lang='eng')
+        w.add_page('render', w.path('scan_1.jpg'), 1)
+        with open(w.path('scan_1.jpg'), 'w') as f:
+            f.write('image')
+
+        # Other settings, so the earlier pages are no good
+        w = P.PyWorkspace(pdf, str(tmpdir.join('scratch')))
+        assert not w.open(lang='spa')
+        assert not w.get_pages('render')
+        assert not os.path.exists(w.path('scan_1.jpg'))
+
+        # Changed pdf
+        w.add_page('render', w.path('scan_1.jpg'), 1)
+        with open(pdf, 'a') as f:
+            f.write('more')
+        w = P.PyWorkspace(pdf, str(tmpdir.join('scratch')))
+        assert not w.open(lang='spa')
+        assert not w.get_pages('render')
+
+    def test_private_dirs(self, tmpdir):
+        """
+            Same-named pdfs in different folders get their own workspaces
+        """
+        pdf1 = self._make_pdf(tmpdir.mkdir('a'))
+        pdf2 = self._make_pdf(tmpdir.mkdir('b'))
+        w1 = P.PyWorkspace(pdf1, str(tmpdir))
+        w2 = P.PyWorkspace(pdf2, str(tmpdir))
+        assert w1.dir != w2.dir
+        assert P.PyWorkspace(pdf1, str(tmpdir)).dir == w1.dir
+
+    def test_unsafe_dir(self, tmpdir):
+        """
+            A workspace directory that isn't private, or is a symlink, isn't resumed
+            from or written into
+        """
+        pdf = self._make_pdf(tmpdir)
+        scratch = tmpdir.mkdir('scratch')
+        w = P.PyWorkspace(pdf, str(scratch))
+        planted = w.dir
+        os.mkdir(planted)
+        os.chmod(planted, 0o777)
+        assert not w.open(lang='eng')
+        assert w.dir != planted and w.dir.startswith(planted)
+        assert os.stat(w.dir).st_mode & 0o777 == 0o700
+        assert not os.listdir(planted)
+
+        os.rmdir(planted)
+        target = tmpdir.mkdir('elsewhere')
+        os.symlink(str(target), planted)
+        w = P.PyWorkspace(pdf, str(scratch))
+        assert not w.open(lang='eng')
+        assert w.dir != planted
+        assert not target.listdir()
+
+    def test_state_outside(self, tmpdir):
+        """
+            A state file pointing outside the workspace is thrown away
+        """
+        pdf = self._make_pdf(tmpdir)
+        w = P.PyWorkspace(pdf, str(tmpdir.join('scratch')))
+        w.open(lang='eng')
+        w.add_page('ocr', w.path('scan_1.jpg'), (w.path('scan_1.jpg'), w.path('scan_1.hocr')))
+        w.state['ocr']['scan_1.jpg'] = ['scan_1.jpg', '/etc/passwd']
+        w.save()
+
+        w = P.PyWorkspace(pdf, str(tmpdir.join('scratch')))
+        assert not w.open(lang='eng')
+        assert not w.get_pages('ocr')